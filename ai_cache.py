@@ -0,0 +1,240 @@
+"""
+USAGE:
+    python ai_cache.py
+
+    Set the environment variables with your own values to turn the cache on for every sample:
+    1) AI_CACHE_PATH - path of the SQLite file used to store results, e.g. ./.ai_cache.sqlite
+    2) AI_CACHE_TTL - optional, seconds a result stays valid (default: no expiry)
+    3) AI_CACHE_MAX_BYTES - optional, size the cache is trimmed to with LRU eviction (default: 512 MB)
+
+    Results are keyed by a SHA-256 of the operation, the model version, the options and the payload,
+    so sending the same review, ticket or image twice only costs a local lookup.
+    Running this file prints the hit ratio and the bytes saved so far.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Tuple
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    payload_size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _payload_bytes(payload: Any) -> bytes:
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache of service results backed by SQLite.
+    Safe to share between threads, and between processes through SQLite's own locking.
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def make_key(operation: str, payload: Any, options: dict = None, model_version: str = None) -> str:
+        """
+        Hash everything that can change the answer of the service.
+        :param operation: e.g. "analyze_sentiment" or "image.analyze"
+        :param payload: documents, image bytes or anything json serializable
+        :param options: call options such as visual features or the model id
+        :param model_version: model version the result is for, None means the service default
+        :return: hex digest
+        """
+        digest = hashlib.sha256()
+        header = json.dumps([operation, model_version or "latest", options or {}], sort_keys=True, default=str)
+        digest.update(header.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(_payload_bytes(payload))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up a result, an expired entry counts as a miss.
+        :return: (found, value)
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, payload_size, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and now - row[3] > self.ttl):
+                self._bump(misses=1)
+                return False, None
+            self._conn.execute("BEGIN")
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._bump(hits=1, bytes_saved=row[1] + row[2])
+            self._conn.execute("COMMIT")
+        return True, pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, payload_size: int = 0) -> None:
+        """
+        Store a result and evict expired and least recently used entries past max_bytes.
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, payload_size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob, len(blob), payload_size, now, now),
+            )
+            self._evict(now)
+            self._conn.execute("COMMIT")
+
+    def read_through(
+        self,
+        operation: str,
+        payload: Any,
+        call: Callable[[], Any],
+        options: dict = None,
+        model_version: str = None,
+    ) -> Any:
+        """
+        Return the cached result for this request or make the call and cache what it returns.
+        :param call: zero argument callable that sends the request, e.g. a lambda around the client method
+        """
+        key = self.make_key(operation, payload, options, model_version)
+        found, value = self.get(key)
+        if found:
+            return value
+        value = call()
+        self.set(key, value, payload_size=len(_payload_bytes(payload)))
+        return value
+
+    def stats(self) -> dict:
+        """
+        Counters since the cache file was created, plus the current size.
+        :return: dict with hits, misses, hit_ratio, bytes_saved, entries and size_bytes
+        """
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "bytes_saved": counters.get("bytes_saved", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM stats")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _bump(self, **counters: int) -> None:
+        for name, value in counters.items():
+            self._conn.execute(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, value),
+            )
+
+    def _evict(self, now: float) -> None:
+        evicted = 0
+        if self.ttl is not None:
+            evicted += self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,)).rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        if evicted:
+            self._bump(evictions=evicted)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    """
+    The cache configured through AI_CACHE_PATH, or None when caching is turned off.
+    :return: ResultCache or None
+    """
+    global _default_cache
+    path = os.environ.get("AI_CACHE_PATH")
+    if not path:
+        return None
+    with _default_lock:
+        if _default_cache is None or _default_cache.path != path:
+            ttl = os.environ.get("AI_CACHE_TTL")
+            _default_cache = ResultCache(
+                path,
+                ttl=float(ttl) if ttl else None,
+                max_bytes=int(os.environ.get("AI_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+        return _default_cache
+
+
+def cached_call(
+    operation: str,
+    payload: Any,
+    call: Callable[[], Any],
+    options: dict = None,
+    model_version: str = None,
+) -> Any:
+    """
+    Read-through helper used by the samples, makes the call directly when the cache is turned off.
+    """
+    cache = get_cache()
+    if cache is None:
+        return call()
+    return cache.read_through(operation, payload, call, options=options, model_version=model_version)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    cache = get_cache()
+    if cache is None:
+        print("Set AI_CACHE_PATH to turn on the result cache")
+    else:
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
@@ -0,0 +1,449 @@
+"""
+USAGE:
+    from ai_clients import registry
+
+    text_analytics_client = registry.text_analytics()
+    image_client = registry.image_analysis()
+    async_text_client = registry.text_analytics(is_async=True)
+
+    Set the environment variables with your own values before running the samples:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) AZURE_FACE_ENDPOINT / AZURE_FACE_KEY - endpoint and key of your face resource.
+
+    One registry for every client the samples use. Clients are created on first use and then reused,
+    clients for the same endpoint share one HTTP transport with a keep-alive connection pool, and
+    Azure Active Directory tokens are cached and refreshed ahead of expiry instead of being
+    fetched by every client. Async clients get their own aiohttp session per event loop.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+POOL_MAXSIZE = 32
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+PolicyFactory = Callable[[str, str, bool], List[Any]]
+RetryPolicyFactory = Callable[[str, str, bool], Any]
+HookFactory = Callable[[str, str], List[Callable]]
+
+
+class CachedTokenCredential:
+    """
+    Wraps a TokenCredential and shares one token per scope between all clients.
+    A token is refreshed by a single thread once it is within refresh_margin of expiring,
+    other threads keep using the current token while it is still valid.
+    """
+
+    def __init__(self, credential: Any, refresh_margin: float = TOKEN_REFRESH_MARGIN):
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[Tuple, Any] = {}
+        self._locks: Dict[Tuple, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def get_token(self, *scopes: str, claims: str = None, tenant_id: str = None, **kwargs: Any) -> Any:
+        cache_key = (scopes, claims, tenant_id)
+        token = self._tokens.get(cache_key)
+        if token is not None and token.expires_on - time.time() > self.refresh_margin:
+            return token
+        with self._guard:
+            lock = self._locks.setdefault(cache_key, threading.Lock())
+        # Only one thread refreshes, the others return the still valid token if there is one
+        if not lock.acquire(blocking=token is None or token.expires_on <= time.time()):
+            return token
+        try:
+            token = self._tokens.get(cache_key)
+            if token is None or token.expires_on - time.time() <= self.refresh_margin:
+                token = self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+                self._tokens[cache_key] = token
+            return token
+        finally:
+            lock.release()
+
+    def close(self) -> None:
+        self.credential.close()
+
+
+class AsyncCachedTokenCredential:
+    """
+    Async counterpart of CachedTokenCredential for azure.identity.aio credentials.
+    """
+
+    def __init__(self, credential: Any, refresh_margin: float = TOKEN_REFRESH_MARGIN):
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[Tuple, Any] = {}
+        self._locks: Dict[Tuple, Any] = {}
+
+    async def get_token(self, *scopes: str, claims: str = None, tenant_id: str = None, **kwargs: Any) -> Any:
+        cache_key = (scopes, claims, tenant_id)
+        token = self._tokens.get(cache_key)
+        if token is not None and token.expires_on - time.time() > self.refresh_margin:
+            return token
+        lock = self._locks.get(cache_key)
+        if lock is None:
+            import asyncio
+            lock = self._locks.setdefault(cache_key, asyncio.Lock())
+        if lock.locked() and token is not None and token.expires_on > time.time():
+            return token
+        async with lock:
+            token = self._tokens.get(cache_key)
+            if token is None or token.expires_on - time.time() <= self.refresh_margin:
+                token = await self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+                self._tokens[cache_key] = token
+            return token
+
+    async def close(self) -> None:
+        await self.credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+
+class ClientRegistry:
+    """
+    Lazily creates and caches clients, transports and credentials. Safe to use from threads and asyncio.
+    """
+
+    def __init__(self, pool_maxsize: int = POOL_MAXSIZE):
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.RLock()
+        self._clients: Dict[Tuple, Any] = {}
+        self._transports: Dict[Tuple, Any] = {}
+        self._credentials: Dict[Tuple, Any] = {}
+        self._policy_factories: List[PolicyFactory] = []
+        self._retry_policy_factory: RetryPolicyFactory = None
+        self._hook_factories: List[HookFactory] = []
+        # Weak references to the event loops of the async entries, by the id used in the cache keys
+        self._loops: Dict[int, Any] = {}
+
+    def add_policies(self, factory: PolicyFactory) -> None:
+        """
+        Register extra per-call pipeline policies for azure-core clients created from now on.
+        Per-retry policies are not supported, the text analytics and form recognizer clients
+        install their own. A per-call policy sees every attempt in response.context["history"].
+        :param factory: called with (service, endpoint, is_async), returns a list of policies
+        """
+        with self._lock:
+            self._policy_factories.append(factory)
+
+    def add_msrest_hooks(self, factory: HookFactory) -> None:
+        """
+        Register requests response hooks for the msrest clients (custom vision, face) created from now on.
+        msrest clients have no pipeline policies, a hook sees the final response of every call.
+        :param factory: called with (service, endpoint), returns a list of hooks called as hook(response)
+        """
+        with self._lock:
+            self._hook_factories.append(factory)
+
+    def set_retry_policy(self, factory: RetryPolicyFactory) -> None:
+        """
+        Replace the RetryPolicy of azure-core clients created from now on.
+        :param factory: called with (service, endpoint, is_async), returns a RetryPolicy or AsyncRetryPolicy
+        """
+        with self._lock:
+            self._retry_policy_factory = factory
+
+    def _get(self, cache_key: Tuple, create: Callable[[], Any]) -> Any:
+        instance = self._clients.get(cache_key)
+        if instance is None:
+            with self._lock:
+                instance = self._clients.get(cache_key)
+                if instance is None:
+                    instance = create()
+                    self._clients[cache_key] = instance
+        return instance
+
+    def _loop_id(self, is_async: bool) -> int:
+        """
+        Id of the running event loop in the cache keys of async entries, 0 for sync ones.
+        When a new loop shows up, the entries of the loops that were closed or garbage collected
+        are dropped first, so a new loop that gets the id of a closed one never gets its clients.
+        """
+        if not is_async:
+            return 0
+        import asyncio
+        import weakref
+
+        loop = asyncio.get_running_loop()
+        loop_id = id(loop)
+        reference = self._loops.get(loop_id)
+        if reference is None or reference() is not loop:
+            with self._lock:
+                reference = self._loops.get(loop_id)
+                if reference is None or reference() is not loop:
+                    for known_id, known in list(self._loops.items()):
+                        known_loop = known()
+                        if known_loop is None or known_loop.is_closed():
+                            self._forget_loop(known_id)
+                    self._forget_loop(loop_id)
+                    try:
+                        self._loops[loop_id] = weakref.ref(loop)
+                    except TypeError:
+                        # Loops without weak reference support are kept alive, their id is not reused
+                        self._loops[loop_id] = lambda loop=loop: loop
+        return loop_id
+
+    def _forget_loop(self, loop_id: int) -> None:
+        """
+        Drop the async clients, transports and credentials of a loop that is gone, with the lock held.
+        They cannot be closed any more, their loop is closed.
+        """
+        self._loops.pop(loop_id, None)
+        for key in [key for key in self._clients if len(key) > 4 and key[3] and key[4] == loop_id]:
+            del self._clients[key]
+        for key in [key for key in self._transports if key[1] and key[2] == loop_id]:
+            del self._transports[key]
+        for key in [key for key in self._credentials if key[0] == "aad" and key[1] and key[2] == loop_id]:
+            del self._credentials[key]
+
+    @staticmethod
+    def _env(value: str, variable: str) -> str:
+        if value:
+            return value
+        from dotenv import load_dotenv
+        load_dotenv()
+        return os.environ[variable]
+
+    def key_credential(self, key: str = None, variable: str = "AZURE_AI_SERVICES_KEY") -> Any:
+        """
+        One AzureKeyCredential per key, so rotating it with update() reaches every client.
+        """
+        key = self._env(key, variable)
+        cache_key = ("key", key)
+        with self._lock:
+            if cache_key not in self._credentials:
+                from azure.core.credentials import AzureKeyCredential
+                self._credentials[cache_key] = AzureKeyCredential(key)
+            return self._credentials[cache_key]
+
+    def aad_credential(self, is_async: bool = False) -> Any:
+        """
+        A shared DefaultAzureCredential with token caching.
+        """
+        cache_key = ("aad", is_async, self._loop_id(is_async))
+        with self._lock:
+            if cache_key not in self._credentials:
+                if is_async:
+                    from azure.identity.aio import DefaultAzureCredential
+                    self._credentials[cache_key] = AsyncCachedTokenCredential(DefaultAzureCredential())
+                else:
+                    from azure.identity import DefaultAzureCredential
+                    self._credentials[cache_key] = CachedTokenCredential(DefaultAzureCredential())
+            return self._credentials[cache_key]
+
+    def _credential(self, credential: Any) -> Any:
+        if credential is None:
+            return self.key_credential()
+        if isinstance(credential, str):
+            return self.key_credential(credential)
+        return credential
+
+    def transport(self, endpoint: str, is_async: bool = False) -> Any:
+        """
+        The HTTP transport shared by every azure-core client of an endpoint.
+        """
+        cache_key = (endpoint, is_async, self._loop_id(is_async))
+        with self._lock:
+            transport = self._transports.get(cache_key)
+            if transport is None:
+                transport = self._create_async_transport() if is_async else self._create_transport()
+                self._transports[cache_key] = transport
+            return transport
+
+    def _create_transport(self) -> Any:
+        import requests
+        from urllib3.util.retry import Retry
+        from azure.core.pipeline.transport import RequestsTransport
+
+        session = requests.Session()
+        # Retries are handled by the azure-core RetryPolicy
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_maxsize,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return RequestsTransport(session=session, session_owner=False)
+
+    def _create_async_transport(self) -> Any:
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=self.pool_maxsize),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            auto_decompress=False,
+        )
+        return AioHttpTransport(session=session, session_owner=False)
+
+    def _configure_msrest(self, client: Any, service: str, endpoint: str) -> Any:
+        client.config.keep_alive = True
+        for factory in self._hook_factories:
+            client.config.hooks.extend(factory(service, endpoint))
+        return client
+
+    def _pipeline_kwargs(self, service: str, endpoint: str, is_async: bool) -> dict:
+        per_call_policies = []
+        for factory in self._policy_factories:
+            per_call_policies.extend(factory(service, endpoint, is_async))
+        kwargs = {
+            "transport": self.transport(endpoint, is_async),
+            "per_call_policies": per_call_policies,
+        }
+        if self._retry_policy_factory is not None:
+            kwargs["retry_policy"] = self._retry_policy_factory(service, endpoint, is_async)
+        return kwargs
+
+    def text_analytics(self, endpoint: str = None, credential: Any = None, is_async: bool = False) -> Any:
+        endpoint = self._env(endpoint, "AZURE_AI_SERVICES_URL")
+        credential = self._credential(credential)
+
+        def create():
+            if is_async:
+                from azure.ai.textanalytics.aio import TextAnalyticsClient
+            else:
+                from azure.ai.textanalytics import TextAnalyticsClient
+            return TextAnalyticsClient(
+                endpoint, credential, **self._pipeline_kwargs("text_analytics", endpoint, is_async)
+            )
+
+        return self._get(("text_analytics", endpoint, id(credential), is_async, self._loop_id(is_async)), create)
+
+    def image_analysis(self, endpoint: str = None, credential: Any = None, is_async: bool = False) -> Any:
+        endpoint = self._env(endpoint, "AZURE_AI_SERVICES_URL")
+        credential = self._credential(credential)
+
+        def create():
+            if is_async:
+                from azure.ai.vision.imageanalysis.aio import ImageAnalysisClient
+            else:
+                from azure.ai.vision.imageanalysis import ImageAnalysisClient
+            return ImageAnalysisClient(
+                endpoint=endpoint, credential=credential,
+                **self._pipeline_kwargs("image_analysis", endpoint, is_async)
+            )
+
+        return self._get(("image_analysis", endpoint, id(credential), is_async, self._loop_id(is_async)), create)
+
+    def document_analysis(self, endpoint: str = None, credential: Any = None, is_async: bool = False) -> Any:
+        endpoint = self._env(endpoint, "AZURE_AI_SERVICES_URL")
+        credential = self._credential(credential)
+
+        def create():
+            if is_async:
+                from azure.ai.formrecognizer.aio import DocumentAnalysisClient
+            else:
+                from azure.ai.formrecognizer import DocumentAnalysisClient
+            return DocumentAnalysisClient(
+                endpoint, credential, **self._pipeline_kwargs("document_analysis", endpoint, is_async)
+            )
+
+        return self._get(("document_analysis", endpoint, id(credential), is_async, self._loop_id(is_async)), create)
+
+    def translation(self, endpoint: str = None, credential: Any = None, is_async: bool = False) -> Any:
+        endpoint = self._env(endpoint, "AZURE_AI_SERVICES_URL")
+        credential = self._credential(credential)
+
+        def create():
+            if is_async:
+                from azure.ai.translation.text.aio import TextTranslationClient
+            else:
+                from azure.ai.translation.text import TextTranslationClient
+            return TextTranslationClient(
+                credential=credential, endpoint=endpoint,
+                **self._pipeline_kwargs("translation", endpoint, is_async)
+            )
+
+        return self._get(("translation", endpoint, id(credential), is_async, self._loop_id(is_async)), create)
+
+    def content_safety(self, endpoint: str = None, credential: Any = None, is_async: bool = False) -> Any:
+        endpoint = self._env(endpoint, "CONTENT_SAFETY_ENDPOINT")
+        if credential is None:
+            credential = self.key_credential(variable="CONTENT_SAFETY_KEY")
+        credential = self._credential(credential)
+
+        def create():
+            if is_async:
+                from azure.ai.contentsafety.aio import ContentSafetyClient
+            else:
+                from azure.ai.contentsafety import ContentSafetyClient
+            return ContentSafetyClient(
+                endpoint, credential, **self._pipeline_kwargs("content_safety", endpoint, is_async)
+            )
+
+        return self._get(("content_safety", endpoint, id(credential), is_async, self._loop_id(is_async)), create)
+
+    def custom_vision_prediction(self, endpoint: str = None, key: str = None) -> Any:
+        """
+        The custom vision SDK is built on msrest, so the client keeps its own keep-alive session
+        instead of sharing the azure-core transport.
+        """
+        endpoint = self._env(endpoint, "AZURE_AI_SERVICES_URL")
+        key = self._env(key, "AZURE_AI_SERVICES_KEY")
+
+        def create():
+            from azure.cognitiveservices.vision.customvision.prediction import CustomVisionPredictionClient
+            from msrest.authentication import ApiKeyCredentials
+            client = CustomVisionPredictionClient(endpoint, ApiKeyCredentials(in_headers={"Prediction-key": key}))
+            return self._configure_msrest(client, "custom_vision_prediction", endpoint)
+
+        return self._get(("custom_vision_prediction", endpoint, key), create)
+
+    def face(self, endpoint: str = None, key: str = None) -> Any:
+        """
+        The face SDK is built on msrest, the client keeps its own keep-alive session.
+        """
+        endpoint = self._env(endpoint, "AZURE_FACE_ENDPOINT")
+        key = self._env(key, "AZURE_FACE_KEY")
+
+        def create():
+            from azure.cognitiveservices.vision.face import FaceClient
+            from msrest.authentication import CognitiveServicesCredentials
+            client = FaceClient(endpoint, CognitiveServicesCredentials(key))
+            return self._configure_msrest(client, "face", endpoint)
+
+        return self._get(("face", endpoint, key), create)
+
+    def close(self) -> None:
+        """
+        Close the sync clients and transports, async ones are closed with aclose().
+        """
+        with self._lock:
+            for cache_key, transport in list(self._transports.items()):
+                if not cache_key[1]:
+                    transport.session.close()
+                    del self._transports[cache_key]
+            for cache_key, client in list(self._clients.items()):
+                if not (len(cache_key) > 3 and cache_key[3]):
+                    client.close()
+                    del self._clients[cache_key]
+
+    async def aclose(self) -> None:
+        """
+        Close the async transports and credentials created on the running event loop.
+        """
+        loop_id = self._loop_id(True)
+        with self._lock:
+            transports = [key for key in self._transports if key[1] and key[2] == loop_id]
+            clients = [key for key in self._clients if len(key) > 4 and key[3] and key[4] == loop_id]
+            credentials = [key for key in self._credentials if key[0] == "aad" and key[1] and key[2] == loop_id]
+            for key in clients:
+                del self._clients[key]
+            sessions = [self._transports.pop(key).session for key in transports]
+            async_credentials = [self._credentials.pop(key) for key in credentials]
+        for session in sessions:
+            await session.close()
+        for credential in async_credentials:
+            await credential.close()
+
+
+registry = ClientRegistry()
@@ -0,0 +1,172 @@
+"""
+USAGE:
+    python ai_content_safety.py
+
+    Set the environment variables with your own values before running the sample:
+    1) CONTENT_SAFETY_ENDPOINT - the endpoint to your content safety resource.
+    2) CONTENT_SAFETY_KEY - your content safety API key
+
+    Screens a stream of messages with the async ContentSafetyClient, many requests at a time.
+    Messages over the service text limit are split at whitespace into chunks, and the severity
+    of each category is the maximum over the chunks. With a threshold, a message stops being
+    analyzed as soon as any category reaches it and its remaining chunks are skipped.
+    Results stream back in input order.
+
+    pip install azure-ai-contentsafety aiohttp
+"""
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Union
+
+from ai_clients import registry
+
+# Characters per analyze_text request
+MAX_TEXT_CHARACTERS = 10_000
+
+DEFAULT_CONCURRENCY = 32
+
+# Look this far back from the limit for whitespace to split at
+SPLIT_WINDOW = 500
+
+
+class ScreeningResult(NamedTuple):
+    index: int
+    severities: Dict[str, int]
+    flagged: bool
+    chunks_analyzed: int
+    chunks_total: int
+    error: BaseException
+
+
+def split_text(text: str, max_characters: int = MAX_TEXT_CHARACTERS) -> List[str]:
+    """
+    Split text into chunks of at most max_characters, at whitespace when there is some near the limit.
+    """
+    chunks = []
+    start = 0
+    while len(text) - start > max_characters:
+        end = start + max_characters
+        cut = max(text.rfind(" ", end - SPLIT_WINDOW, end), text.rfind("\n", end - SPLIT_WINDOW, end))
+        if cut <= start:
+            cut = end
+        chunks.append(text[start:cut])
+        start = cut
+    chunks.append(text[start:])
+    return chunks
+
+
+def _over(severities: Dict[str, int], threshold: Union[int, Dict[str, int]]) -> bool:
+    if threshold is None:
+        return False
+    if isinstance(threshold, dict):
+        return any(severities.get(category, 0) >= limit for category, limit in threshold.items())
+    return any(severity >= threshold for severity in severities.values())
+
+
+async def screen_messages(
+    messages: Iterable[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    threshold: Union[int, Dict[str, int]] = None,
+    categories: Sequence[str] = None,
+    client: Any = None,
+) -> AsyncIterator[ScreeningResult]:
+    """
+    Screen messages with at most concurrency analyze_text requests in flight.
+    :param messages: any iterable of str, consumed lazily
+    :param threshold: severity at which a message is flagged and its remaining chunks skipped,
+        one value for every category or a {category: severity} dict
+    :param categories: categories to analyze, e.g. ["Hate", "Violence"], all by default
+    :param client: an async ContentSafetyClient, defaults to the shared one from the registry
+    :return: async iterator of ScreeningResult in input order
+    """
+    from azure.ai.contentsafety.models import AnalyzeTextOptions
+
+    if client is None:
+        client = registry.content_safety(is_async=True)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def screen_one(index: int, text: str) -> ScreeningResult:
+        chunks = split_text(text)
+        severities: Dict[str, int] = {}
+        analyzed = 0
+        try:
+            for chunk in chunks:
+                async with slots:
+                    response = await client.analyze_text(AnalyzeTextOptions(text=chunk, categories=categories))
+                analyzed += 1
+                for analysis in response.categories_analysis:
+                    severities[analysis.category] = max(severities.get(analysis.category, 0), analysis.severity or 0)
+                if _over(severities, threshold):
+                    break
+        except Exception as error:
+            return ScreeningResult(index, severities, _over(severities, threshold), analyzed, len(chunks), error)
+        return ScreeningResult(index, severities, _over(severities, threshold), analyzed, len(chunks), None)
+
+    # Messages queued ahead of the one being yielded, enough to keep every request slot busy
+    window = concurrency * 2
+    in_flight = deque()
+    try:
+        for index, text in enumerate(messages):
+            in_flight.append(asyncio.ensure_future(screen_one(index, text)))
+            if len(in_flight) >= window:
+                yield await in_flight.popleft()
+        while in_flight:
+            yield await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def screen(
+    messages: Iterable[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    threshold: Union[int, Dict[str, int]] = None,
+    **kwargs: Any,
+) -> Iterator[ScreeningResult]:
+    """
+    Synchronous wrapper around screen_messages() for scripts that do not run an event loop.
+    :return: iterator of ScreeningResult in input order
+    """
+    loop = asyncio.new_event_loop()
+    results = screen_messages(messages, concurrency=concurrency, threshold=threshold, **kwargs)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(registry.aclose())
+        loop.close()
+
+
+def screen_chat_log() -> None:
+    """
+    Screen a chat log, flagging messages with a severity of 4 or more in any category.
+    :return: None
+    """
+    print("\n -- screen_chat_log")
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    messages = [
+        "Hi, how are you today?",
+        "I will kill my self if that dog pooped in the house again!",
+        "Let's meet for lunch tomorrow.",
+        "Thanks for the help! " * 800,
+    ] * 25
+
+    flagged = 0
+    for result in screen(messages, threshold=4):
+        if result.error is not None:
+            print(f"Message {result.index} failed: {result.error}")
+        elif result.flagged:
+            flagged += 1
+            print(f"Message {result.index} flagged after {result.chunks_analyzed}/{result.chunks_total} chunk(s): "
+                  f"{result.severities}")
+    print(f"{flagged} of {len(messages)} message(s) flagged")
+
+
+if __name__ == "__main__":
+    screen_chat_log()
@@ -1,57 +1,63 @@
 import os
-import cv2
 
-from azure.cognitiveservices.vision.customvision.prediction import CustomVisionPredictionClient
-from msrest.authentication import ApiKeyCredentials
 from dotenv import load_dotenv
-load_dotenv()
-
-endpoint = os.environ["AZURE_AI_SERVICES_URL"]
-prediction_key = os.environ["AZURE_AI_SERVICES_KEY"]
 
-prediction_credentials = ApiKeyCredentials(in_headers={
-    "Prediction-key": prediction_key
-})
-predictor = CustomVisionPredictionClient(endpoint, prediction_credentials)
+from ai_cache import cached_call
+from ai_clients import registry
+from ai_preprocess import prepare_image
+from ai_rate_limit import limited
+from ai_render import normalized_to_corners, render, save_or_show
+from ai_telemetry import profiled
+load_dotenv()
 
 
 def classify():
     print("\n -- classify")
+    predictor = registry.custom_vision_prediction()
     classify_project_id = os.environ["CUSTOM_VISION_CLASSIFY_PROJECT_ID"]
     publish_iteration_name = "Iteration2"
 
-    with open(os.path.join("./images/LittleYellowCar.png"), "rb") as image_contents:
-        results = predictor.classify_image(classify_project_id, publish_iteration_name, image_contents.read())
+    image_bytes = prepare_image(os.path.join("./images/LittleYellowCar.png"), "custom_vision_classify").data
+    results = cached_call(
+        "custom_vision.classify_image", image_bytes,
+        lambda: limited(predictor.classify_image, classify_project_id, publish_iteration_name, image_bytes),
+        options={"project_id": classify_project_id},
+        model_version=publish_iteration_name,
+    )
 
-        for prediction in results.predictions:
-            print("\t" + prediction.tag_name +
-                  ": {0:.2f}%".format(prediction.probability * 100))
+    for prediction in results.predictions:
+        print("\t" + prediction.tag_name +
+              ": {0:.2f}%".format(prediction.probability * 100))
 
 
-def detect():
+def detect(output_path: str = None):
     print("\n -- detect")
+    predictor = registry.custom_vision_prediction()
     detect_project_id = os.environ["CUSTOM_VISION_DETECT_PROJECT_ID"]
     publish_iteration_name = "Iteration1"
 
     image_path = os.path.join("./images/SoccerBall.png")
-    with open(image_path, "rb") as image_contents:
-        results = predictor.detect_image(detect_project_id, publish_iteration_name, image_contents.read())
-
-    image = cv2.imread(image_path)
-    for prediction in results.predictions:
-        top_left = (int(prediction.bounding_box.left * image.shape[1]), int(prediction.bounding_box.top * image.shape[0]))
-        bottom_right = (int((prediction.bounding_box.left + prediction.bounding_box.width) * image.shape[1]),
-                        int((prediction.bounding_box.top + prediction.bounding_box.height) * image.shape[0]))
-
-        cv2.rectangle(image, top_left, bottom_right, (0, 255, 0), 2)
-
-        text = f"{prediction.tag_name}: {prediction.probability * 100:.2f}%"
-        text_position = (top_left[0], top_left[1] - 10 if top_left[1] > 20 else top_left[1] + 10)
-        cv2.putText(image, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-
-    cv2.imshow('Image with Bounding Box', image)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    # Decode once, upload a downscaled copy and draw on the original, boxes are normalized
+    prepared = prepare_image(image_path, "custom_vision_detect")
+    results = cached_call(
+        "custom_vision.detect_image", prepared.data,
+        lambda: limited(predictor.detect_image, detect_project_id, publish_iteration_name, prepared.data),
+        options={"project_id": detect_project_id},
+        model_version=publish_iteration_name,
+    )
+
+    with profiled("custom_vision.detect"):
+        boxes = [[p.bounding_box.left, p.bounding_box.top, p.bounding_box.width, p.bounding_box.height]
+                 for p in results.predictions]
+        image = render(
+            prepared.image,
+            boxes=normalized_to_corners(boxes, prepared.width, prepared.height),
+            labels=[f"{p.tag_name}: {p.probability * 100:.2f}%" for p in results.predictions],
+            label_color=(255, 255, 255),
+            font_scale=0.5,
+        )
+
+    save_or_show(image, output_path, 'Image with Bounding Box')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,388 @@
+"""
+USAGE:
+    from ai_doc_columns import ColumnarDocument
+
+    document = ColumnarDocument.from_result(result)
+    del result
+    words = document.in_region("words", page=1, region=(0, 0, 4.25, 5.5))
+    print([document.text("words", i) for i in words])
+    lines = document.at_span("lines", offset=120, length=40)
+
+    Converts a Document Intelligence AnalyzeResult into compact columnar NumPy arrays: one row per
+    word, line, selection mark, paragraph, table cell and style span, with content offsets, page numbers,
+    N x 8 polygons and bounding boxes. Text is kept once, in the document content, and read back by span.
+    Spatial queries go through a packed R-tree per page and kind, built on first use, and span queries
+    through a binary search on sorted offsets, so neither scans the whole document.
+
+    pip install azure-ai-formrecognizer numpy
+"""
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# Children per R-tree node, small enough that a node is checked with one vectorized comparison
+NODE_SIZE = 16
+
+CELL_KINDS = ("content", "rowHeader", "columnHeader", "stubHead", "description")
+
+KINDS = ("words", "lines", "selection_marks", "paragraphs", "cells", "styles")
+
+# Column types other than the defaults, so empty documents get the same dtypes
+DTYPES = {
+    "confidence": "float32",
+    "selected": "bool",
+    "handwritten": "bool",
+    "role": "str",
+    "table": "int32",
+    "row": "int32",
+    "column": "int32",
+    "row_span": "int32",
+    "column_span": "int32",
+    "kind": "int8",
+    "rows": "int32",
+    "columns": "int32",
+    "first_cell": "int64",
+}
+
+
+class Columns:
+    """
+    Named NumPy arrays of equal length, one row per element.
+    """
+
+    def __init__(self, **arrays: Any):
+        self.__dict__.update(arrays)
+        self._names = tuple(arrays)
+
+    def __len__(self) -> int:
+        return len(getattr(self, self._names[0])) if self._names else 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self._names)
+
+    def take(self, indices: Any) -> Dict[str, Any]:
+        """
+        The rows at indices as a dict of arrays.
+        """
+        return {name: getattr(self, name)[indices] for name in self._names}
+
+
+class PackedRTree:
+    """
+    Static R-tree bulk loaded with Sort-Tile-Recursive packing.
+    Every level is one array of bounding boxes, so a query compares whole nodes at once.
+    """
+
+    def __init__(self, boxes: Any, node_size: int = NODE_SIZE):
+        import numpy as np
+
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.node_size = node_size
+        count = len(boxes)
+        # Sort into vertical slices by x center, then each slice by y center
+        leaves = -(-count // node_size)
+        slice_size = node_size * max(1, int(np.ceil(np.sqrt(leaves))))
+        order = np.argsort(boxes[:, 0] + boxes[:, 2], kind="stable")
+        centers_y = boxes[order, 1] + boxes[order, 3]
+        for start in range(0, count, slice_size):
+            part = slice(start, start + slice_size)
+            order[part] = order[part][np.argsort(centers_y[part], kind="stable")]
+        self.order = order
+
+        self.levels = [boxes[order]]
+        while len(self.levels[-1]) > node_size:
+            children = self.levels[-1]
+            parents = -(-len(children) // node_size)
+            padded = np.empty((parents * node_size, 4), dtype=np.float32)
+            padded[:len(children)] = children
+            padded[len(children):, :2] = np.inf
+            padded[len(children):, 2:] = -np.inf
+            grouped = padded.reshape(parents, node_size, 4)
+            self.levels.append(np.concatenate([grouped[:, :, :2].min(axis=1), grouped[:, :, 2:].max(axis=1)], axis=1))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def query(self, region: Sequence[float]) -> Any:
+        """
+        Indices of the boxes that intersect region.
+        :param region: (x1, y1, x2, y2)
+        :return: int64 array of indices into the boxes the tree was built from
+        """
+        import numpy as np
+
+        x1, y1, x2, y2 = region
+        candidates = np.arange(len(self.levels[-1]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth][candidates]
+            hit = (boxes[:, 0] <= x2) & (boxes[:, 2] >= x1) & (boxes[:, 1] <= y2) & (boxes[:, 3] >= y1)
+            candidates = candidates[hit]
+            if depth:
+                children = (candidates[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+                candidates = children[children < len(self.levels[depth - 1])]
+        return self.order[candidates]
+
+
+class _SpanIndex:
+    """
+    Sorted offsets of one kind, with the running maximum of span ends so overlapping spans are handled too.
+    """
+
+    def __init__(self, offsets: Any, lengths: Any):
+        import numpy as np
+
+        self.order = np.argsort(offsets, kind="stable")
+        self.starts = offsets[self.order]
+        self.ends = self.starts + lengths[self.order]
+        self.max_ends = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def query(self, offset: int, length: int) -> Any:
+        import numpy as np
+
+        end = offset + max(length, 1)
+        high = int(np.searchsorted(self.starts, end, side="left"))
+        low = int(np.searchsorted(self.max_ends[:high], offset, side="right"))
+        hit = self.ends[low:high] > offset
+        return np.sort(self.order[low:high][hit])
+
+
+def _polygon(points: Sequence[Any]) -> List[float]:
+    """
+    Flatten a polygon of Points to 8 floats, padded with its last point or NaN when shorter.
+    """
+    flat = []
+    for point in points[:4]:
+        flat.append(point.x)
+        flat.append(point.y)
+    if not flat:
+        return [float("nan")] * 8
+    while len(flat) < 8:
+        flat.extend(flat[-2:])
+    return flat
+
+
+def _span(spans: Sequence[Any]) -> Tuple[int, int]:
+    """
+    The (offset, length) covering every span of an element.
+    """
+    if not spans:
+        return -1, 0
+    offset = spans[0].offset
+    return offset, spans[-1].offset + spans[-1].length - offset
+
+
+def _region(regions: Sequence[Any]) -> Tuple[int, List[float]]:
+    """
+    Page number and polygon of the first bounding region of an element.
+    """
+    if not regions:
+        return 0, _polygon([])
+    return regions[0].page_number, _polygon(regions[0].polygon)
+
+
+def _columns(page: List[int], polygon: List[List[float]], offset: List[int], length: List[int], **extra: Any) -> Columns:
+    import numpy as np
+
+    polygons = np.asarray(polygon, dtype=np.float32).reshape(-1, 8)
+    xs, ys = polygons[:, 0::2], polygons[:, 1::2]
+    if len(polygons):
+        bbox = np.stack([xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)], axis=1)
+    else:
+        bbox = np.zeros((0, 4), dtype=np.float32)
+    return Columns(
+        page=np.asarray(page, dtype=np.int32),
+        offset=np.asarray(offset, dtype=np.int64),
+        length=np.asarray(length, dtype=np.int32),
+        polygon=polygons,
+        bbox=bbox,
+        **{name: np.asarray(values, dtype=DTYPES[name]) for name, values in extra.items()},
+    )
+
+
+class ColumnarDocument:
+    """
+    Columnar view of an AnalyzeResult with spatial and span indexes.
+    """
+
+    def __init__(self, content: str, pages: Columns, tables: Columns, **kinds: Columns):
+        self.content = content
+        self.pages = pages
+        self.tables = tables
+        for kind in KINDS:
+            setattr(self, kind, kinds[kind])
+        self._trees: Dict[Tuple[str, int], Tuple[PackedRTree, Any]] = {}
+        self._spans: Dict[str, _SpanIndex] = {}
+
+    @classmethod
+    def from_result(cls, result: Any) -> "ColumnarDocument":
+        """
+        Convert an AnalyzeResult, or its to_dict() form, walking the object graph once.
+        :return: ColumnarDocument that holds no reference to the result
+        """
+        import numpy as np
+
+        if isinstance(result, dict):
+            from azure.ai.formrecognizer import AnalyzeResult
+            result = AnalyzeResult.from_dict(result)
+
+        pages = result.pages or []
+        words = {"page": [], "polygon": [], "offset": [], "length": [], "confidence": []}
+        lines = {"page": [], "polygon": [], "offset": [], "length": []}
+        marks = {"page": [], "polygon": [], "offset": [], "length": [], "selected": [], "confidence": []}
+        for page in pages:
+            number = page.page_number
+            for word in page.words or []:
+                words["page"].append(number)
+                words["polygon"].append(_polygon(word.polygon or []))
+                words["offset"].append(word.span.offset)
+                words["length"].append(word.span.length)
+                words["confidence"].append(word.confidence)
+            for line in page.lines or []:
+                offset, length = _span(line.spans)
+                lines["page"].append(number)
+                lines["polygon"].append(_polygon(line.polygon or []))
+                lines["offset"].append(offset)
+                lines["length"].append(length)
+            for mark in page.selection_marks or []:
+                marks["page"].append(number)
+                marks["polygon"].append(_polygon(mark.polygon or []))
+                marks["offset"].append(mark.span.offset)
+                marks["length"].append(mark.span.length)
+                marks["selected"].append(mark.state == "selected")
+                marks["confidence"].append(mark.confidence)
+
+        paragraphs = {"page": [], "polygon": [], "offset": [], "length": [], "role": []}
+        for paragraph in result.paragraphs or []:
+            page, polygon = _region(paragraph.bounding_regions)
+            offset, length = _span(paragraph.spans)
+            paragraphs["page"].append(page)
+            paragraphs["polygon"].append(polygon)
+            paragraphs["offset"].append(offset)
+            paragraphs["length"].append(length)
+            paragraphs["role"].append(paragraph.role or "")
+
+        tables = {"page": [], "polygon": [], "offset": [], "length": [], "rows": [], "columns": [], "first_cell": []}
+        cells = {"page": [], "polygon": [], "offset": [], "length": [], "table": [], "row": [], "column": [],
+                 "row_span": [], "column_span": [], "kind": []}
+        for index, table in enumerate(result.tables or []):
+            page, polygon = _region(table.bounding_regions)
+            offset, length = _span(table.spans)
+            tables["page"].append(page)
+            tables["polygon"].append(polygon)
+            tables["offset"].append(offset)
+            tables["length"].append(length)
+            tables["rows"].append(table.row_count)
+            tables["columns"].append(table.column_count)
+            tables["first_cell"].append(len(cells["table"]))
+            for cell in table.cells or []:
+                page, polygon = _region(cell.bounding_regions)
+                offset, length = _span(cell.spans)
+                cells["page"].append(page)
+                cells["polygon"].append(polygon)
+                cells["offset"].append(offset)
+                cells["length"].append(length)
+                cells["table"].append(index)
+                cells["row"].append(cell.row_index)
+                cells["column"].append(cell.column_index)
+                cells["row_span"].append(cell.row_span or 1)
+                cells["column_span"].append(cell.column_span or 1)
+                cells["kind"].append(CELL_KINDS.index(cell.kind) if cell.kind in CELL_KINDS else 0)
+
+        # Styles have no geometry, one row per span
+        styles = {"page": [], "polygon": [], "offset": [], "length": [], "handwritten": [], "confidence": []}
+        for style in result.styles or []:
+            for span in style.spans or []:
+                styles["page"].append(0)
+                styles["polygon"].append(_polygon([]))
+                styles["offset"].append(span.offset)
+                styles["length"].append(span.length)
+                styles["handwritten"].append(bool(style.is_handwritten))
+                styles["confidence"].append(style.confidence)
+
+        return cls(
+            content=result.content or "",
+            pages=Columns(
+                page_number=np.asarray([page.page_number for page in pages], dtype=np.int32),
+                width=np.asarray([page.width or 0 for page in pages], dtype=np.float32),
+                height=np.asarray([page.height or 0 for page in pages], dtype=np.float32),
+                angle=np.asarray([page.angle or 0 for page in pages], dtype=np.float32),
+                unit=np.asarray([page.unit or "" for page in pages]),
+            ),
+            tables=_columns(**tables),
+            words=_columns(**words),
+            lines=_columns(**lines),
+            selection_marks=_columns(**marks),
+            paragraphs=_columns(**paragraphs),
+            cells=_columns(**cells),
+            styles=_columns(**styles),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by the arrays and the content, in bytes.
+        """
+        columns = [self.pages, self.tables] + [getattr(self, kind) for kind in KINDS]
+        return sum(column.nbytes for column in columns) + len(self.content.encode("utf-8"))
+
+    def text(self, kind: str, index: int) -> str:
+        """
+        Content of one element, read from the document content by its span.
+        """
+        columns = getattr(self, kind)
+        offset = int(columns.offset[index])
+        return self.content[offset:offset + int(columns.length[index])] if offset >= 0 else ""
+
+    def texts(self, kind: str, indices: Iterable[int]) -> List[str]:
+        return [self.text(kind, index) for index in indices]
+
+    def _tree(self, kind: str, page: int) -> Tuple[PackedRTree, Any]:
+        key = (kind, page)
+        if key not in self._trees:
+            import numpy as np
+
+            columns = getattr(self, kind)
+            members = np.flatnonzero(columns.page == page)
+            self._trees[key] = (PackedRTree(columns.bbox[members]), members)
+        return self._trees[key]
+
+    def in_region(self, kind: str, page: int, region: Sequence[float], contained: bool = True) -> Any:
+        """
+        Elements of a kind on a page that lie inside a region.
+        :param kind: words, lines, selection_marks, paragraphs or cells
+        :param page: page number, starting at 1
+        :param region: (x1, y1, x2, y2) in the unit of the page
+        :param contained: only elements fully inside the region, otherwise every element touching it
+        :return: int64 array of row indices in reading order
+        """
+        import numpy as np
+
+        tree, members = self._tree(kind, page)
+        found = members[tree.query(region)] if len(tree) else members[:0]
+        if contained and len(found):
+            boxes = getattr(self, kind).bbox[found]
+            x1, y1, x2, y2 = region
+            found = found[(boxes[:, 0] >= x1) & (boxes[:, 1] >= y1) & (boxes[:, 2] <= x2) & (boxes[:, 3] <= y2)]
+        return np.sort(found)
+
+    def at_span(self, kind: str, offset: int, length: int = 1) -> Any:
+        """
+        Elements of a kind whose span overlaps content[offset:offset + length].
+        :return: int64 array of row indices in reading order
+        """
+        if kind not in self._spans:
+            columns = getattr(self, kind)
+            self._spans[kind] = _SpanIndex(columns.offset, columns.length)
+        return self._spans[kind].query(offset, length)
+
+    def table_grid(self, table: int) -> Any:
+        """
+        Cell contents of a table as a row_count x column_count array, spanning cells repeated over their span.
+        """
+        import numpy as np
+
+        grid = np.full((int(self.tables.rows[table]), int(self.tables.columns[table])), "", dtype=object)
+        for index in np.flatnonzero(self.cells.table == table):
+            row, column = int(self.cells.row[index]), int(self.cells.column[index])
+            rows, columns = int(self.cells.row_span[index]), int(self.cells.column_span[index])
+            grid[row:row + rows, column:column + columns] = self.text("cells", index)
+        return grid
@@ -10,62 +10,82 @@ USAGE:
 
 def document_intelligence() -> None:
     print("\n -- document_intelligence")
-    import os
+    import numpy as np
     import requests
 
-    from azure.core.credentials import AzureKeyCredential
-    from azure.ai.formrecognizer import DocumentAnalysisClient
     from dotenv import load_dotenv
+    from ai_cache import cached_call
+    from ai_clients import registry
+    from ai_doc_columns import CELL_KINDS, ColumnarDocument
+    from ai_telemetry import profiled
     load_dotenv()
 
-    # Get the endpoint and key from the environment
-    endpoint = os.environ["AZURE_AI_SERVICES_URL"]
-    key = os.environ["AZURE_AI_SERVICES_KEY"]
-
-    # Create a client
-    credential = AzureKeyCredential(key)
-    client = DocumentAnalysisClient(endpoint, credential)
+    # Get the shared client for the endpoint and key in the environment
+    client = registry.document_analysis()
 
     # Sample document
     file_url = "https://raw.githubusercontent.com/Azure-Samples/cognitive-services-REST-api-samples/master/curl/form-recognizer/sample-layout.pdf"
     file_bytes = requests.get(file_url).content
 
-    # Analyze the document
-    poller = client.begin_analyze_document(model_id="prebuilt-layout", document=file_bytes)
-    result = poller.result()
+    # Analyze the document, or reuse the result of an earlier run
+    result = cached_call(
+        "begin_analyze_document", file_bytes,
+        lambda: client.begin_analyze_document(model_id="prebuilt-layout", document=file_bytes).result(),
+        options={"model_id": "prebuilt-layout"},
+    )
 
-    # Process the result
-    for page in result.pages:
-        print(f"Document Page {page.page_number} has {len(page.lines)} line(s), {len(page.words)} word(s)")
+    # Convert to columnar arrays once and drop the SDK object graph
+    with profiled("document.columns"):
+        document = ColumnarDocument.from_result(result)
+    del result
 
-        for i, line in enumerate(page.lines):
+    # Process the result
+    lines, marks = document.lines, document.selection_marks
+    page_count = len(document.pages) + 1
+    line_counts = np.bincount(lines.page, minlength=page_count)
+    word_counts = np.bincount(document.words.page, minlength=page_count)
+    for page in document.pages.page_number.tolist():
+        print(f"Document Page {page} has {line_counts[page]} line(s), {word_counts[page]} word(s)")
+
+        for i, index in enumerate(np.flatnonzero(lines.page == page)):
             print(f"Line {i}: ")
-            print(f"Content: '{line.content}'")
+            print(f"Content: '{document.text('lines', index)}'")
             print("Bounding polygon, with points ordered clockwise: ")
-            for j in range(len(line.polygon)):
-                print(f" ({line.polygon[j].x}, {line.polygon[j].y})")
+            print("\n".join(f" ({x:g}, {y:g})" for x, y in lines.polygon[index].reshape(-1, 2).tolist()))
 
-        for i, selection_mark in enumerate(page.selection_marks):
-            print(f"Selection Mark {i} is {selection_mark.state}.")
-            print(f"State: {selection_mark.state}")
+        for i, index in enumerate(np.flatnonzero(marks.page == page)):
+            state = "selected" if marks.selected[index] else "unselected"
+            print(f"Selection Mark {i} is {state}.")
+            print(f"State: {state}")
             print("Bounding polygon, with points ordered clockwise: ")
-            for j in range(len(selection_mark.polygon)):
-                print(f" ({selection_mark.polygon[j].x}, {selection_mark.polygon[j].y})")
+            print("\n".join(f" ({x:g}, {y:g})" for x, y in marks.polygon[index].reshape(-1, 2).tolist()))
 
-    for i, paragraph in enumerate(result.paragraphs):
+    for i in range(len(document.paragraphs)):
         print(f"Paragraph {i}: ")
-        print(f"Content: {paragraph.content}")
-
-    for style in result.styles:
-        if style.is_handwritten and style.confidence > 0.8:
-            print("Handwritten content found: ")
-            for span in style.spans:
-                print(f"{result.content[span.offset:span.offset+span.length]}")
-
-    for i, table in enumerate(result.tables):
-        print(f"Table {i} has {table.row_count} rows and {table.column_count} columns.")
-        for cell in table.cells:
-            print(f" Cell ({cell.row_index}, {cell.column_index}) is a '{cell.kind}' with content: {cell.content}")
+        print(f"Content: {document.text('paragraphs', i)}")
+
+    styles = document.styles
+    handwritten = np.flatnonzero(styles.handwritten & (styles.confidence > 0.8))
+    if len(handwritten):
+        print("Handwritten content found: ")
+        for text in document.texts("styles", handwritten):
+            print(text)
+
+    for i in range(len(document.tables)):
+        print(f"Table {i} has {document.tables.rows[i]} rows and {document.tables.columns[i]} columns.")
+        for index in np.flatnonzero(document.cells.table == i):
+            kind = CELL_KINDS[document.cells.kind[index]]
+            print(f" Cell ({document.cells.row[index]}, {document.cells.column[index]}) is a '{kind}' "
+                  f"with content: {document.text('cells', index)}")
+
+    # Spatial and span lookups answer from the indexes instead of scanning every page
+    if len(document.pages):
+        width, height = document.pages.width[0], document.pages.height[0]
+        top_half = document.in_region("words", page=1, region=(0, 0, width, height / 2))
+        print(f"{len(top_half)} word(s) in the top half of page 1")
+    if len(document.words):
+        first_line = document.at_span("lines", int(document.words.offset[0]))
+        print(f"The first word is on line: '{' '.join(document.texts('lines', first_line))}'")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,260 @@
+"""
+USAGE:
+    python ai_doc_revisions.py [path of a PDF] [path of its revision]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) AI_CACHE_PATH - optional, keeps the page results between runs, see ai_cache.py
+
+    Re-analyzes only the pages of a revised PDF that changed. Every page is fingerprinted from
+    what it draws: its content stream, media and crop boxes and rotation, its resources (fonts
+    with their encodings and ToUnicode maps, images, forms, graphics states), and its annotations
+    with their appearance streams and form field values. The result of every page is cached
+    under its fingerprint, one single page job per page. A new upload of a contract or an
+    invoice with a small edit only submits the changed and new pages. Pages that moved are recognised wherever they are.
+
+    The cached and the new page results are spliced into one AnalyzeResult with merge_results()
+    of ai_doc_shards, which renumbers the pages and shifts the content spans. As with shards,
+    tables and paragraphs that cross a page boundary come back as one part per page.
+
+    pip install azure-ai-formrecognizer pypdf aiohttp
+"""
+import asyncio
+import copy
+import hashlib
+import sys
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Name of the page results in the result cache
+OPERATION = "document.page"
+
+
+class Revision(NamedTuple):
+    result: Any
+    # 1-based page numbers that were sent to the service and that came from the cache
+    analyzed: List[int]
+    reused: List[int]
+
+
+class MemoryPageCache:
+    """
+    Page results kept in this process, used when AI_CACHE_PATH is not set.
+    Same get/set interface as ai_cache.ResultCache.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        if key not in self._values:
+            return False, None
+        return True, copy.deepcopy(self._values[key])
+
+    def set(self, key: str, value: Any, payload_size: int = 0) -> None:
+        self._values[key] = copy.deepcopy(value)
+
+
+_memory_cache = MemoryPageCache()
+
+
+# Annotation keys that point back at the page or other fields, or only record when it was edited
+ANNOTATION_SKIP = ("/P", "/Parent", "/Kids", "/M")
+
+
+def _object_digest(value: Any, memo: Dict[Tuple[int, int], bytes], skip: Tuple[str, ...] = ()) -> bytes:
+    """
+    Hash of a PDF object and everything it references: names, numbers and strings, the keys of
+    dictionaries, and the decoded data of streams. Indirect objects are hashed once per document.
+    :param memo: digests of the indirect objects already hashed, shared by the pages of a document
+    :param skip: dictionary keys left out
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(value, IndirectObject):
+        reference = (value.idnum, value.generation)
+        if reference not in memo:
+            # A cycle back to an object being hashed only adds its reference
+            memo[reference] = repr(reference).encode("utf-8")
+            memo[reference] = _object_digest(value.get_object(), memo, skip)
+        return memo[reference]
+    digest = hashlib.sha256()
+    if isinstance(value, DictionaryObject):
+        for name in sorted(value):
+            if name not in skip:
+                digest.update(name.encode("utf-8"))
+                digest.update(_object_digest(value.raw_get(name), memo, skip))
+        if isinstance(value, StreamObject):
+            digest.update(value.get_data())
+    elif isinstance(value, ArrayObject):
+        digest.update(b"[")
+        for item in value:
+            digest.update(_object_digest(item, memo, skip))
+        digest.update(b"]")
+    else:
+        digest.update(f"{type(value).__name__}:{value!r}".encode("utf-8"))
+    return digest.digest()
+
+
+def page_fingerprint(page: Any, memo: Dict[Tuple[int, int], bytes] = None) -> str:
+    """
+    Hash of everything a PDF page draws, equal for a page that was only moved or copied to another file.
+    :param page: pypdf PageObject
+    :param memo: see _object_digest, pass the same dict for all the pages of a document
+    :return: hex digest
+    """
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256()
+    boxes = [[float(value) for value in box] for box in (page.mediabox, page.cropbox)]
+    digest.update(repr((boxes, page.rotation)).encode("utf-8"))
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    # Fonts with their encodings and embedded programs, images, forms, graphics states and color spaces
+    resources = page.get("/Resources")
+    if resources is not None:
+        digest.update(_object_digest(page.raw_get("/Resources"), memo))
+    annotations = page.get("/Annots")
+    for annotation in (annotations.get_object() if annotations is not None else []):
+        # Appearance streams, text and form field values. A widget can take its value from its field.
+        digest.update(_object_digest(annotation, memo, ANNOTATION_SKIP))
+        field = annotation.get_object().get("/Parent")
+        if field is not None:
+            for name in ("/FT", "/V"):
+                digest.update(_object_digest(field.raw_get(name), memo) if name in field else b"-")
+    return digest.hexdigest()
+
+
+def page_key(fingerprint: str, model_id: str, options: Dict[str, Any] = None) -> str:
+    from ai_cache import ResultCache
+
+    return ResultCache.make_key(OPERATION, fingerprint, options={"model_id": model_id, **(options or {})})
+
+
+async def analyze_revision(
+    source: str,
+    model_id: str = "prebuilt-layout",
+    cache: Any = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    client: Any = None,
+    **kwargs: Any,
+) -> Revision:
+    """
+    Analyze a PDF, sending only the pages whose fingerprint has no cached result.
+    :param source: path of a PDF
+    :param cache: ai_cache.ResultCache or anything with the same get/set, get_cache() or an in-process cache by default
+    :param client: async DocumentAnalysisClient, the shared registry client by default
+    :param kwargs: passed to begin_analyze_document, e.g. locale, and part of the cache key
+    :return: Revision with the merged AnalyzeResult
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pypdf import PdfReader
+    from ai_cache import get_cache
+    from ai_clients import registry
+    from ai_doc_shards import ShardResult, merge_results, shard_bytes
+    from ai_lro import LROScheduler
+
+    cache = cache or get_cache() or _memory_cache
+    client = client or registry.document_analysis(is_async=True)
+    loop = asyncio.get_running_loop()
+    # PdfReader is not thread safe, pages are read one at a time off the event loop
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        with open(source, "rb") as file:
+            reader = PdfReader(file)
+
+            def fingerprints() -> List[str]:
+                memo: Dict[Tuple[int, int], bytes] = {}
+                return [page_fingerprint(page, memo) for page in reader.pages]
+
+            keys = [page_key(fingerprint, model_id, kwargs)
+                    for fingerprint in await loop.run_in_executor(executor, fingerprints)]
+            pages: Dict[int, Any] = {}
+            missing: Dict[str, List[int]] = {}
+            for number, key in enumerate(keys, start=1):
+                found, value = cache.get(key)
+                if found:
+                    pages[number] = value
+                else:
+                    # A page repeated in the document is analyzed once
+                    missing.setdefault(key, []).append(number)
+            reused = sorted(pages)
+
+            def jobs() -> Any:
+                for key, numbers in missing.items():
+                    async def begin(number: int = numbers[0]) -> Any:
+                        data = await loop.run_in_executor(executor, shard_bytes, reader, number, number)
+                        return await client.begin_analyze_document(model_id, data, **kwargs)
+                    yield key, "document", begin
+
+            async for job in LROScheduler(max_in_flight=max_in_flight).as_completed(jobs()):
+                if job.error is not None:
+                    raise job.error
+                value = job.result.to_dict()
+                cache.set(job.key, value)
+                for number in missing[job.key]:
+                    pages[number] = copy.deepcopy(value)
+    finally:
+        executor.shutdown(wait=False)
+
+    result = merge_results([ShardResult(number, number, value) for number, value in pages.items()])
+    return Revision(result, sorted(set(pages) - set(reused)), reused)
+
+
+def _revise(source: str, target: str) -> None:
+    """
+    Write a revision of a PDF: the first page replaced with a blank one and a blank page added at the end.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    first = reader.pages[0]
+    writer.add_blank_page(float(first.mediabox.width), float(first.mediabox.height))
+    for page in reader.pages[1:]:
+        writer.add_page(page)
+    writer.add_blank_page(float(first.mediabox.width), float(first.mediabox.height))
+    with open(target, "wb") as file:
+        writer.write(file)
+
+
+async def analyze_revisions(source: str = None, revision: str = None) -> None:
+    """
+    Analyze a PDF, then its revision, and print which pages each run sent to the service.
+    Without a revision, one is made from the PDF with its first page replaced and a page added.
+    :return: None
+    """
+    print("\n -- analyze_revisions")
+    import os
+    import tempfile
+    import time
+    from dotenv import load_dotenv
+    from ai_clients import registry
+    from ai_doc_shards import download
+    load_dotenv()
+
+    temporary = []
+    if source is None:
+        source = download("https://raw.githubusercontent.com/Azure-Samples/cognitive-services-REST-api-samples/master/curl/form-recognizer/sample-layout.pdf")
+        temporary.append(source)
+    if revision is None:
+        handle, revision = tempfile.mkstemp(suffix=".pdf")
+        os.close(handle)
+        _revise(source, revision)
+        temporary.append(revision)
+    try:
+        for path in (source, revision):
+            started = time.perf_counter()
+            outcome = await analyze_revision(path)
+            print(f"{os.path.basename(path)}: {len(outcome.result.pages)} page(s) in "
+                  f"{time.perf_counter() - started:.1f}s, analyzed {outcome.analyzed}, reused {outcome.reused}")
+    finally:
+        await registry.aclose()
+        for path in temporary:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    asyncio.run(analyze_revisions(*sys.argv[1:3]))
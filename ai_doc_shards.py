@@ -0,0 +1,216 @@
+"""
+USAGE:
+    python ai_doc_shards.py [path or URL of a PDF]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Analyzes a large PDF as page-range shards instead of one long job. A URL is streamed to a
+    temporary file, never held in memory, and each shard is cut from the file only when it is
+    submitted, so at most max_in_flight shards of pages_per_shard pages are in memory at once.
+    Shards run concurrently through the LRO scheduler and are merged back into one AnalyzeResult
+    with page numbers and content span offsets shifted to their place in the whole document.
+
+    Tables and paragraphs that cross a shard boundary come back as two parts, one per shard.
+
+    pip install azure-ai-formrecognizer pypdf requests aiohttp
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Tuple
+
+DEFAULT_PAGES_PER_SHARD = 20
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Bytes read at a time when streaming a URL to disk
+DOWNLOAD_CHUNK = 1024 * 1024
+
+# AnalyzeResult lists that are concatenated across shards
+MERGED_LISTS = ("pages", "paragraphs", "tables", "key_value_pairs", "styles", "languages", "documents")
+
+
+class ShardResult(NamedTuple):
+    first_page: int
+    last_page: int
+    result: Any
+
+
+def download(url: str, directory: str = None) -> str:
+    """
+    Stream a URL to a temporary file.
+    :return: path of the file, the caller removes it
+    """
+    import requests
+
+    handle, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(handle, "wb") as file, requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                file.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def shard_ranges(page_count: int, pages_per_shard: int = DEFAULT_PAGES_PER_SHARD) -> List[Tuple[int, int]]:
+    """
+    Split pages 1..page_count into (first, last) ranges of at most pages_per_shard pages.
+    """
+    return [
+        (first, min(first + pages_per_shard - 1, page_count))
+        for first in range(1, page_count + 1, pages_per_shard)
+    ]
+
+
+def shard_bytes(reader: Any, first_page: int, last_page: int) -> bytes:
+    """
+    Write pages first_page..last_page of an open PdfReader to a new PDF in memory.
+    """
+    import io
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for index in range(first_page - 1, last_page):
+        writer.add_page(reader.pages[index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _shift(value: Any, page_offset: int, content_offset: int) -> None:
+    """
+    Shift every page_number and span offset in the to_dict() form of a result, in place.
+    """
+    if isinstance(value, list):
+        for item in value:
+            _shift(item, page_offset, content_offset)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key == "page_number" and isinstance(item, int):
+                value[key] = item + page_offset
+            elif key == "span" and isinstance(item, dict):
+                item["offset"] += content_offset
+            elif key == "spans" and isinstance(item, list):
+                for span in item:
+                    span["offset"] += content_offset
+            else:
+                _shift(item, page_offset, content_offset)
+
+
+def merge_results(shards: List[ShardResult]) -> Any:
+    """
+    Merge shard results into one AnalyzeResult for the whole document.
+    Page content is joined with a newline between shards, as the service does between pages.
+    :param shards: ShardResult for every shard, in any order
+    :return: AnalyzeResult
+    """
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    merged: Dict[str, Any] = {name: [] for name in MERGED_LISTS}
+    contents = []
+    content_offset = 0
+    for shard in sorted(shards, key=lambda item: item.first_page):
+        part = shard.result.to_dict() if hasattr(shard.result, "to_dict") else shard.result
+        _shift(part, shard.first_page - 1, content_offset)
+        for name in MERGED_LISTS:
+            merged[name].extend(part.get(name) or [])
+        merged.setdefault("api_version", part.get("api_version"))
+        merged.setdefault("model_id", part.get("model_id"))
+        content = part.get("content") or ""
+        contents.append(content)
+        content_offset += len(content) + 1
+    merged["content"] = "\n".join(contents)
+    return AnalyzeResult.from_dict(merged)
+
+
+async def analyze_shards(
+    source: str,
+    model_id: str = "prebuilt-layout",
+    pages_per_shard: int = DEFAULT_PAGES_PER_SHARD,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    client: Any = None,
+    **kwargs: Any,
+) -> AsyncIterator[ShardResult]:
+    """
+    Analyze a PDF shard by shard and yield each shard result as it finishes.
+    Page numbers and offsets inside each result are relative to the shard, merge_results() fixes them.
+    :param source: path or http(s) URL of a PDF
+    :param client: async DocumentAnalysisClient, the shared registry client by default
+    :param kwargs: passed to begin_analyze_document, e.g. locale
+    :return: async iterator of ShardResult in completion order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pypdf import PdfReader
+    from ai_clients import registry
+    from ai_lro import LROScheduler
+
+    client = client or registry.document_analysis(is_async=True)
+    is_url = source.startswith(("http://", "https://"))
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(None, download, source) if is_url else source
+    # PdfReader is not thread safe, shards are cut one at a time off the event loop
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        with open(path, "rb") as file:
+            reader = PdfReader(file)
+            ranges = shard_ranges(len(reader.pages), pages_per_shard)
+
+            def jobs() -> Iterator[Tuple[Tuple[int, int], str, Any]]:
+                for first, last in ranges:
+                    async def begin(first: int = first, last: int = last) -> Any:
+                        data = await loop.run_in_executor(executor, shard_bytes, reader, first, last)
+                        return await client.begin_analyze_document(model_id, data, **kwargs)
+                    yield (first, last), "document", begin
+
+            scheduler = LROScheduler(max_in_flight=max_in_flight)
+            async for job in scheduler.as_completed(jobs()):
+                if job.error is not None:
+                    raise job.error
+                yield ShardResult(job.key[0], job.key[1], job.result)
+    finally:
+        executor.shutdown(wait=False)
+        if is_url:
+            os.remove(path)
+
+
+async def analyze_sharded(source: str, model_id: str = "prebuilt-layout", **kwargs: Any) -> Any:
+    """
+    Analyze a PDF as concurrent page-range shards and merge them into one AnalyzeResult.
+    :param kwargs: passed to analyze_shards()
+    :return: AnalyzeResult
+    """
+    shards = [shard async for shard in analyze_shards(source, model_id, **kwargs)]
+    return merge_results(shards)
+
+
+async def analyze_large_document(source: str = None) -> None:
+    """
+    Analyze the layout sample one page per shard and print where each page ended up.
+    :return: None
+    """
+    print("\n -- analyze_large_document")
+    import time
+    from dotenv import load_dotenv
+    from ai_clients import registry
+    load_dotenv()
+
+    source = source or "https://raw.githubusercontent.com/Azure-Samples/cognitive-services-REST-api-samples/master/curl/form-recognizer/sample-layout.pdf"
+    started = time.perf_counter()
+    try:
+        result = await analyze_sharded(source, "prebuilt-layout", pages_per_shard=1)
+    finally:
+        await registry.aclose()
+    print(f"Analyzed {len(result.pages)} page(s) in {time.perf_counter() - started:.1f}s")
+    for page in result.pages:
+        first_line = page.lines[0].spans[0] if page.lines else None
+        text = result.content[first_line.offset:first_line.offset + first_line.length] if first_line else ""
+        print(f"Page {page.page_number} starts with '{text}'")
+
+
+if __name__ == "__main__":
+    asyncio.run(analyze_large_document(*sys.argv[1:2]))
@@ -1,49 +1,165 @@
+"""
+USAGE:
+    python ai_face.py
+    python -m azure_ai face detect_faces_batch <url or path> [<url or path> ...]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_FACE_ENDPOINT - the endpoint to your face resource.
+    2) AZURE_FACE_KEY - your face API key
+
+    Each image is fetched once: the bytes are uploaded with detect_with_stream and the same buffer
+    is decoded to draw the face rectangles. Lists of URLs or files run on a bounded thread pool and
+    the results stream back in input order, so memory stays bounded by the number of images in flight.
+
+    pip install azure-cognitiveservices-vision-face opencv-python numpy requests
+"""
 import os
-import requests
-import cv2
-import numpy as np
+from collections import deque
+from typing import Any, Iterable, Iterator, List, NamedTuple
 
-from azure.cognitiveservices.vision.face import FaceClient
-from msrest.authentication import CognitiveServicesCredentials
-from azure.cognitiveservices.vision.face.models import TrainingStatusType, Person, SnapshotObjectType, OperationStatusType
 from dotenv import load_dotenv
-load_dotenv()
 
-ENDPOINT = os.environ['AZURE_FACE_ENDPOINT']
-KEY = os.environ['AZURE_FACE_KEY']
+from ai_clients import registry
+load_dotenv()
 
-# Create an authenticated FaceClient.
-face_client = FaceClient(ENDPOINT, CognitiveServicesCredentials(KEY))
+DEFAULT_CONCURRENCY = 8
 
-# Detect a face in an image that contains a single face
+# Sample image that contains a single face
 single_face_image_url = 'https://raw.githubusercontent.com/Microsoft/Cognitive-Face-Windows/master/Data/detection1.jpg'
-single_image_name = os.path.basename(single_face_image_url)
-detected_faces = face_client.face.detect_with_url(url=single_face_image_url)
-if not detected_faces:
-    raise Exception('No face detected from image {}'.format(single_image_name))
-
-# Convert width height to a point in a rectangle
-def getRectangle(faceDictionary):
-    rect = faceDictionary.face_rectangle
-    left = rect.left
-    top = rect.top
-    bottom = left + rect.height
-    right = top + rect.width
-    return ((left, top), (bottom, right))
-
-
-# Download the image from the url
-response = requests.get(single_face_image_url)
-nparr = np.frombuffer(response, np.uint8)
-image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-# For each face returned use the face rectangle and draw a red box.
-print('Drawing rectangle around face... see popup for results.')
-for face in detected_faces:
-    top_left, bottom_right = getRectangle(face)
-    cv2.rectangle(image, top_left, bottom_right, (0, 0, 255), 2)
-
-# Display the image in the users default image browser.
-cv2.imshow('Image with Bounding Box', image)
-cv2.waitKey(0)
-cv2.destroyAllWindows()
\ No newline at end of file
+
+
+class FaceResult(NamedTuple):
+    index: int
+    source: str
+    data: bytes
+    faces: List[Any]
+    error: BaseException
+
+
+def face_boxes(faces: List[Any]) -> Any:
+    """
+    Corners of every face rectangle at once.
+    :return: N x 4 (x1, y1, x2, y2) int32 array
+    """
+    from ai_render import xywh_to_corners
+
+    return xywh_to_corners([
+        [face.face_rectangle.left, face.face_rectangle.top, face.face_rectangle.width, face.face_rectangle.height]
+        for face in faces
+    ])
+
+
+def fetch_image(source: str) -> bytes:
+    """
+    Read an image from a URL or a file.
+    """
+    if source.startswith(("http://", "https://")):
+        import requests
+        response = requests.get(source, timeout=30)
+        response.raise_for_status()
+        return response.content
+    with open(source, "rb") as image_file:
+        return image_file.read()
+
+
+def detect_image(source: str, face_client: Any = None) -> FaceResult:
+    """
+    Fetch one image and detect its faces from the fetched bytes.
+    :return: FaceResult with the bytes kept for rendering
+    """
+    import io
+    from ai_rate_limit import limited
+
+    face_client = face_client or registry.face()
+    data = fetch_image(source)
+    # A new stream for every attempt, a retried upload would otherwise start at the end of the buffer
+    faces = limited(
+        lambda: face_client.face.detect_with_stream(io.BytesIO(data), return_face_id=False),
+        endpoint=face_client.config.endpoint,
+    )
+    return FaceResult(0, source, data, faces, None)
+
+
+def detect_many(sources: Iterable[str], concurrency: int = DEFAULT_CONCURRENCY) -> Iterator[FaceResult]:
+    """
+    Detect faces in many images with at most concurrency images in flight.
+    A failed image is yielded with its exception in error instead of stopping the others.
+    :return: iterator of FaceResult in input order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    face_client = registry.face()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        def collect() -> FaceResult:
+            index, source, future = pending.popleft()
+            try:
+                return future.result()._replace(index=index)
+            except Exception as error:
+                return FaceResult(index, source, None, [], error)
+
+        for index, source in enumerate(sources):
+            pending.append((index, source, pool.submit(detect_image, source, face_client)))
+            if len(pending) >= concurrency:
+                yield collect()
+        while pending:
+            yield collect()
+
+
+def annotate(result: FaceResult) -> Any:
+    """
+    Decode the fetched bytes and draw a red box around each face.
+    """
+    from ai_preprocess import decode_image
+    from ai_render import render
+    from ai_telemetry import profiled
+
+    with profiled("face.annotate"):
+        image, _ = decode_image(result.data)
+        return render(image, boxes=face_boxes(result.faces), color=(0, 0, 255))
+
+
+def detect_faces(output_path: str = None) -> None:
+    """
+    Detect the faces in an image and draw a box around each of them.
+    :param output_path: where to write the annotated image, shown in a window when not given
+    :return: None
+    """
+    print("\n -- detect_faces")
+    from ai_render import save_or_show
+
+    # Detect a face in an image that contains a single face
+    single_image_name = os.path.basename(single_face_image_url)
+    result = detect_image(single_face_image_url)
+    if not result.faces:
+        raise Exception('No face detected from image {}'.format(single_image_name))
+
+    # For each face returned use the face rectangle and draw a red box.
+    print('Drawing rectangle around face...')
+    image = annotate(result)
+
+    # Write the image, or display it when no output path is given.
+    save_or_show(image, output_path, 'Image with Bounding Box')
+
+
+def detect_faces_batch(*sources: str, output_dir: str = None) -> None:
+    """
+    Detect faces in a list of URLs or files and print them as they come back.
+    :param output_dir: where to write one annotated image per source, nothing is drawn when not given
+    :return: None
+    """
+    print("\n -- detect_faces_batch")
+    from ai_render import save_or_show
+
+    for result in detect_many(sources or [single_face_image_url]):
+        if result.error is not None:
+            print(f"{result.source}: failed with {result.error}")
+            continue
+        print(f"{result.source}: {len(result.faces)} face(s) at {face_boxes(result.faces).tolist()}")
+        if output_dir:
+            name = f"{result.index:05d}-{os.path.splitext(os.path.basename(result.source))[0]}.png"
+            save_or_show(annotate(result), os.path.join(output_dir, name))
+
+
+if __name__ == "__main__":
+    detect_faces()
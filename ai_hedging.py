@@ -0,0 +1,400 @@
+"""
+USAGE:
+    from ai_hedging import get_hedger
+
+    hedger = get_hedger("text_analytics")
+    result = hedger.call(lambda client: client.analyze_sentiment(documents))
+    result = await get_hedger("text_analytics", is_async=True).acall(lambda client: client.analyze_sentiment(documents))
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource, the primary.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) AI_HEDGE_ENDPOINTS - comma separated endpoints of the same resource kind in other regions
+    4) AI_HEDGE_KEYS - their keys, comma separated in the same order
+
+    Hedged requests against the tail latency of analyze_sentiment, ImageAnalysisClient.analyze and
+    classify_image. A call goes to the first healthy endpoint. When it has not answered after the
+    hedge delay, the same request is also sent to the next endpoint, and whichever answers first
+    wins. The delay is a percentile (p95 by default) of the recent latencies of the endpoint, so
+    only about one call in twenty is duplicated.
+
+    The async acall cancels the losing request. A sync call cannot interrupt a request that is
+    already on the wire: the loser is cancelled if it has not started, and otherwise finishes in
+    the background and is discarded.
+
+    An endpoint that fails with 429, 5xx or a connection error, or is overtaken by its hedge,
+    failure_threshold times in a row is skipped for cooldown seconds, and the next one becomes
+    the primary. A failure of the primary is retried on the next endpoint right away. Errors that
+    any endpoint would return, e.g. 400, are raised without a retry.
+    stats() reports the extra requests hedging costs.
+
+    pip install azure-ai-textanalytics azure-ai-vision-imageanalysis azure-cognitiveservices-vision-customvision aiohttp
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+DEFAULT_PERCENTILE = 95
+
+# Latencies per endpoint the delay is computed from, recent ones only so the delay follows the service
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+# Hedge delay before MIN_SAMPLES latencies are known, and its bounds
+INITIAL_DELAY = 1.0
+MIN_DELAY = 0.05
+MAX_DELAY = 10.0
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+
+# Threads running sync requests, each hedged call can hold one per endpoint
+DEFAULT_MAX_WORKERS = 32
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    Whether another endpoint could succeed where this one failed: throttling, server and connection errors.
+    Any other exception, e.g. a bug in the caller's function, is not held against the endpoint.
+    """
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+
+    connection_errors = (ServiceRequestError, ServiceResponseError, ConnectionError, TimeoutError)
+    try:
+        # Custom vision and face wrap connection errors of requests in msrest's own exception
+        from msrest.exceptions import ClientRequestError
+        connection_errors += (ClientRequestError,)
+    except ImportError:
+        pass
+    if isinstance(error, connection_errors):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class _Endpoint:
+    def __init__(self, url: str, client: Any):
+        self.url = url
+        # A client, or a function returning the client to use for each call
+        self._resolve = client if callable(client) else (lambda: client)
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.wins = 0
+
+    @property
+    def client(self) -> Any:
+        return self._resolve()
+
+
+class Hedger:
+    """
+    Sends a call to one endpoint and hedges it on the next when it is slower than usual.
+    """
+
+    def __init__(
+        self,
+        clients: Sequence[Tuple[str, Any]],
+        percentile: float = DEFAULT_PERCENTILE,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        """
+        :param clients: (endpoint url, client) pairs, in order of preference. A function without
+            arguments can stand in for the client, it is called for every request.
+        """
+        if not clients:
+            raise ValueError("At least one endpoint is needed")
+        self.endpoints = [_Endpoint(url, client) for url, client in clients]
+        self.percentile = percentile
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._counts = {"calls": 0, "requests": 0, "hedged": 0, "failovers": 0, "cancelled": 0, "abandoned": 0}
+
+    def delay(self, endpoint: _Endpoint = None) -> float:
+        """
+        Seconds to wait for an endpoint, the primary by default, before hedging: a percentile of its recent latencies.
+        """
+        endpoint = endpoint or self._order()[0]
+        with self._lock:
+            latencies = sorted(endpoint.latencies)
+        if len(latencies) < MIN_SAMPLES:
+            return INITIAL_DELAY
+        rank = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return min(MAX_DELAY, max(MIN_DELAY, latencies[rank]))
+
+    def _order(self) -> List[_Endpoint]:
+        """
+        Healthy endpoints in order of preference, then the unhealthy ones, the soonest to recover first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = [endpoint for endpoint in self.endpoints if endpoint.unhealthy_until <= now]
+            unhealthy = sorted(
+                (endpoint for endpoint in self.endpoints if endpoint.unhealthy_until > now),
+                key=lambda endpoint: endpoint.unhealthy_until,
+            )
+        return healthy + unhealthy
+
+    def _record(self, endpoint: _Endpoint, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                endpoint.failures = 0
+                endpoint.wins += 1
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.failure_threshold:
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown
+                endpoint.failures = 0
+
+    def _count(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] += value
+
+    def _sent(self, endpoint: _Endpoint) -> None:
+        with self._lock:
+            endpoint.requests += 1
+            self._counts["requests"] += 1
+
+    def _timed(self, function: Callable[[Any], Any], endpoint: _Endpoint) -> Any:
+        started = time.monotonic()
+        result = function(endpoint.client)
+        with self._lock:
+            endpoint.latencies.append(time.monotonic() - started)
+        return result
+
+    def call(self, function: Callable[[Any], Any]) -> Any:
+        """
+        Run function(client) against the primary, hedged on the next endpoint after the delay.
+        :param function: makes the request with the client it is given
+        :return: the first successful result
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+        remaining = self._order()
+        self._count(calls=1)
+
+        def send() -> None:
+            endpoint = remaining.pop(0)
+            future = self._executor.submit(self._timed, function, endpoint)
+            pending[future] = endpoint
+            sent.append(future)
+            self._sent(endpoint)
+
+        pending: Dict[Any, _Endpoint] = {}
+        sent: List[Any] = []
+        send()
+        error = None
+        winner = None
+        try:
+            while pending:
+                timeout = self.delay(next(iter(pending.values()))) if remaining else None
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    self._count(hedged=1)
+                    send()
+                    continue
+                for future in done:
+                    endpoint = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as failure:
+                        if not is_endpoint_failure(failure):
+                            raise
+                        self._record(endpoint, False)
+                        error = error or failure
+                        if not pending and remaining:
+                            self._count(failovers=1)
+                            send()
+                        continue
+                    self._record(endpoint, True)
+                    winner = sent.index(future)
+                    return result
+            raise error
+        finally:
+            # Losers of the race, cancelled if they have not started, discarded otherwise.
+            # Those sent before the winner were too slow, a hedge that lost is not held against its endpoint
+            for future, endpoint in pending.items():
+                if winner is not None and sent.index(future) < winner:
+                    self._record(endpoint, False)
+                self._count(**({"cancelled": 1} if future.cancel() else {"abandoned": 1}))
+
+    async def acall(self, function: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        Async call(), function(client) gets an async client and the losing request is cancelled.
+        :return: the first successful result
+        """
+        remaining = self._order()
+        self._count(calls=1)
+
+        async def timed(endpoint: _Endpoint) -> Any:
+            started = time.monotonic()
+            try:
+                result = await function(endpoint.client)
+            except asyncio.CancelledError:
+                # A lower bound, leaving cancelled losers out would pull the delay down
+                with self._lock:
+                    endpoint.latencies.append(time.monotonic() - started)
+                raise
+            with self._lock:
+                endpoint.latencies.append(time.monotonic() - started)
+            return result
+
+        def send() -> None:
+            endpoint = remaining.pop(0)
+            task = asyncio.ensure_future(timed(endpoint))
+            pending[task] = endpoint
+            sent.append(task)
+            self._sent(endpoint)
+
+        pending: Dict[asyncio.Future, _Endpoint] = {}
+        sent: List[asyncio.Future] = []
+        send()
+        error = None
+        winner = None
+        try:
+            while pending:
+                timeout = self.delay(next(iter(pending.values()))) if remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._count(hedged=1)
+                    send()
+                    continue
+                for task in done:
+                    endpoint = pending.pop(task)
+                    failure = task.exception()
+                    if failure is not None:
+                        if not is_endpoint_failure(failure):
+                            raise failure
+                        self._record(endpoint, False)
+                        error = error or failure
+                        if not pending and remaining:
+                            self._count(failovers=1)
+                            send()
+                        continue
+                    self._record(endpoint, True)
+                    winner = sent.index(task)
+                    return task.result()
+            raise error
+        finally:
+            for task, endpoint in pending.items():
+                if winner is not None and sent.index(task) < winner:
+                    self._record(endpoint, False)
+                task.cancel()
+                self._count(cancelled=1)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Calls, requests sent and the extra traffic of hedging and failover, overall and per endpoint.
+        """
+        now = time.monotonic()
+        with self._lock:
+            counts = dict(self._counts)
+            endpoints = [
+                {"url": endpoint.url, "requests": endpoint.requests, "wins": endpoint.wins,
+                 "healthy": endpoint.unhealthy_until <= now}
+                for endpoint in self.endpoints
+            ]
+        counts["extra_traffic"] = round(counts["requests"] / counts["calls"] - 1, 4) if counts["calls"] else 0.0
+        counts["delay"] = round(self.delay(), 4)
+        counts["endpoints"] = endpoints
+        return counts
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def endpoints_from_env() -> List[Tuple[str, str]]:
+    """
+    :return: (endpoint, key) of the primary followed by those in AI_HEDGE_ENDPOINTS
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    urls = [url.strip() for url in os.environ.get("AI_HEDGE_ENDPOINTS", "").split(",") if url.strip()]
+    keys = [key.strip() for key in os.environ.get("AI_HEDGE_KEYS", "").split(",") if key.strip()]
+    if len(keys) != len(urls):
+        raise ValueError("AI_HEDGE_KEYS needs one key for every endpoint in AI_HEDGE_ENDPOINTS")
+    return [(os.environ["AZURE_AI_SERVICES_URL"], os.environ["AZURE_AI_SERVICES_KEY"])] + list(zip(urls, keys))
+
+
+_hedgers: Dict[Tuple[str, bool], Hedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(service: str, is_async: bool = False, **kwargs: Any) -> Hedger:
+    """
+    The shared hedger of a service over the endpoints from the environment, so its delay keeps adapting.
+    The clients are looked up in the registry for every request, so an async hedger serves any event
+    loop and picks up new clients after registry.close() or registry.aclose().
+    :param service: text_analytics, image_analysis or custom_vision_prediction
+    :param kwargs: passed to Hedger when it is created
+    """
+    from ai_clients import registry
+
+    if service == "custom_vision_prediction" and is_async:
+        raise ValueError("The custom vision client has no async version")
+    cache_key = (service, is_async)
+    with _hedgers_lock:
+        if cache_key not in _hedgers:
+            clients = []
+            for url, credential in endpoints_from_env():
+                if service == "custom_vision_prediction":
+                    resolve = lambda url=url, credential=credential: registry.custom_vision_prediction(url, credential)
+                else:
+                    resolve = lambda url=url, credential=credential: getattr(registry, service)(
+                        url, credential, is_async=is_async
+                    )
+                clients.append((url, resolve))
+            _hedgers[cache_key] = Hedger(clients, **kwargs)
+        return _hedgers[cache_key]
+
+
+def hedged_sentiment() -> None:
+    """
+    Analyze the sentiment of many documents with hedged requests and print what the hedging cost.
+    :return: None
+    """
+    print("\n -- hedged_sentiment")
+    from concurrent.futures import ThreadPoolExecutor
+
+    documents = [
+        "I had the best day of my life.",
+        "I didn't enjoy this at all. I want my money back.",
+    ]
+    hedger = get_hedger("text_analytics")
+    latencies = []
+
+    def analyze(_: int) -> None:
+        started = time.perf_counter()
+        hedger.call(lambda client: client.analyze_sentiment(documents))
+        latencies.append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(analyze, range(200)))
+    latencies.sort()
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms")
+    stats = hedger.stats()
+    print(f"{stats['calls']} call(s), {stats['requests']} request(s), {stats['hedged']} hedged, "
+          f"{stats['failovers']} failover(s), {stats['extra_traffic']:.1%} extra traffic")
+    for endpoint in stats["endpoints"]:
+        print(f"   {endpoint['url']}: {endpoint['requests']} request(s), {endpoint['wins']} answer(s) used, "
+              f"{'healthy' if endpoint['healthy'] else 'unhealthy'}")
+
+
+if __name__ == "__main__":
+    hedged_sentiment()
@@ -17,143 +17,121 @@ USAGE:
 
     pip install azure-ai-vision-imageanalysis
 """
-import os
-import cv2
-
-from azure.ai.vision.imageanalysis import ImageAnalysisClient
-from azure.ai.vision.imageanalysis.models import VisualFeatures
-from azure.core.credentials import AzureKeyCredential
 from dotenv import load_dotenv
-load_dotenv()
 
-# Get the endpoint and key from the environment
-endpoint = os.environ["AZURE_AI_SERVICES_URL"]
-key = os.environ["AZURE_AI_SERVICES_KEY"]
+from ai_cache import cached_call
+from ai_clients import registry
+from ai_preprocess import prepare_image
+from ai_render import points_to_polygons, render, save_or_show, xywh_to_corners
+from ai_telemetry import profiled
+load_dotenv()
 
 
-def get_objects():
+def get_objects(output_path: str = None):
     """
     Load an image and identify objects with tags in the image
     This will draw bounding boxes around the objects in the image
+    :param output_path: where to write the annotated image, shown in a window when not given
     """
     print("\n -- objects")
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
 
     image_path = "./images/ButterflyWithMoon.webp"
-    with open(image_path, "rb") as image_file:
-        file_bytes = image_file.read()
-
-    client = ImageAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(key))
-    result = client.analyze(
-        image_data=file_bytes,
-        visual_features=[VisualFeatures.OBJECTS]
+    # Decode once, upload a downscaled copy and draw on the original
+    prepared = prepare_image(image_path, "objects")
+
+    client = registry.image_analysis()
+    result = cached_call(
+        "image.analyze", prepared.data,
+        lambda: client.analyze(
+            image_data=prepared.data,
+            visual_features=[VisualFeatures.OBJECTS]
+        ),
+        options={"visual_features": ["objects"]},
     )
 
-    image = cv2.imread(image_path)
-
-    values = result.objects.values()
-    for value in values:
-        for obj in value:
-            bbox = obj.bounding_box
-            cv2.putText(
-                image,
-                str(obj.tags),
-                (bbox['x'], bbox['y'] - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.9, (36, 255, 12), 2
-            )
-            cv2.rectangle(
-                image,
-                (bbox['x'], bbox['y']),
-                (bbox['x'] + bbox['w'],
-                 bbox['y'] + bbox['h']),
-                (0, 255, 0), 2
-            )
-
-    cv2.imshow('Image with Bounding Box', image)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
-
-
-def get_caption():
+    with profiled("image.objects"):
+        objects = [obj for value in result.objects.values() for obj in value]
+        boxes = [[obj.bounding_box['x'], obj.bounding_box['y'], obj.bounding_box['w'], obj.bounding_box['h']]
+                 for obj in objects]
+        image = render(
+            prepared.image,
+            boxes=xywh_to_corners(prepared.to_original(boxes)),
+            labels=[str(obj.tags) for obj in objects],
+        )
+
+    save_or_show(image, output_path, 'Image with Bounding Box')
+
+
+def get_caption(output_path: str = None):
     """
     Generate a caption for an image
+    :param output_path: where to write the annotated image, shown in a window when not given
     """
     print("\n -- caption")
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
 
     image_path = "./images/ButterflyWithMoon.webp"
-    with open(image_path, "rb") as image_file:
-        file_bytes = image_file.read()
-
-    client = ImageAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(key))
-    result = client.analyze(
-        image_data=file_bytes,
-        visual_features=[VisualFeatures.CAPTION, VisualFeatures.DENSE_CAPTIONS],
+    prepared = prepare_image(image_path, "dense_captions")
+
+    client = registry.image_analysis()
+    result = cached_call(
+        "image.analyze", prepared.data,
+        lambda: client.analyze(
+            image_data=prepared.data,
+            visual_features=[VisualFeatures.CAPTION, VisualFeatures.DENSE_CAPTIONS],
+        ),
+        options={"visual_features": ["caption", "denseCaptions"]},
     )
 
-    image = cv2.imread(image_path)
-
-    dense_captions = result['denseCaptionsResult']
-    for caption in dense_captions['values']:
-        bbox = caption['boundingBox']
-        cv2.rectangle(image, (bbox['x'], bbox['y']),
-                      (bbox['x'] + bbox['w'],
-                       bbox['y'] + bbox['h']),
-                      (0, 255, 0), 2)
-        cv2.putText(image, caption['text'], (bbox['x'], bbox['y'] - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36, 255, 12), 2)
+    dense_captions = result['denseCaptionsResult']['values']
+    boxes = [[caption['boundingBox'][k] for k in ('x', 'y', 'w', 'h')] for caption in dense_captions]
+    image = render(
+        prepared.image,
+        boxes=xywh_to_corners(prepared.to_original(boxes)),
+        labels=[caption['text'] for caption in dense_captions],
+    )
 
-    cv2.imshow('Image with Bounding Box and Text', image)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    save_or_show(image, output_path, 'Image with Bounding Box and Text')
 
     print(f"Caption: {result['captionResult']}")
 
 
-def get_words():
+def get_words(output_path: str = None):
     """
     Load an image and extract readable text
+    :param output_path: where to write the annotated image, shown in a window when not given
     """
     print("\n -- read")
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
 
     image_path = "./images/SpanishSign.png"
-    with open(image_path, "rb") as image_file:
-        file_bytes = image_file.read()
-
-    client = ImageAnalysisClient(endpoint=endpoint, credential=AzureKeyCredential(key))
-    result = client.analyze(
-        image_data=file_bytes,
-        visual_features=[VisualFeatures.READ],
+    prepared = prepare_image(image_path, "read")
+
+    client = registry.image_analysis()
+    result = cached_call(
+        "image.analyze", prepared.data,
+        lambda: client.analyze(
+            image_data=prepared.data,
+            visual_features=[VisualFeatures.READ],
+        ),
+        options={"visual_features": ["read"]},
     )
 
-    image = cv2.imread(image_path)
-
-    for block in result.read.blocks:
-        for line in block.lines:
-            line_box = line['boundingPolygon']
-            top_left = (line_box[0]['x'], line_box[0]['y'])
-            bottom_right = (line_box[2]['x'], line_box[2]['y'])
-            cv2.rectangle(
-                image,
-                top_left,
-                bottom_right,
-                (0, 0, 255), 2
-            )
-            for word in line.words:
-                word_box = word['boundingPolygon']
-                top_left = (word_box[0]['x'], word_box[0]['y'])
-                bottom_right = (word_box[2]['x'], word_box[2]['y'])
-                cv2.rectangle(
-                    image,
-                    top_left,
-                    bottom_right,
-                    (0, 255, 0), 2
-                )
-                print(f"Word: {word['text']}")
-                print(f"Confidence: {word['confidence']}")
-
-    cv2.imshow('Image with Bounding Box', image)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    lines = [line for block in result.read.blocks for line in block.lines]
+    words = [word for line in lines for word in line.words]
+    for word in words:
+        print(f"Word: {word['text']}")
+        print(f"Confidence: {word['confidence']}")
+
+    image = prepared.image
+    with profiled("image.read"):
+        line_polygons = prepared.to_original(points_to_polygons([line['boundingPolygon'] for line in lines]))
+        word_polygons = prepared.to_original(points_to_polygons([word['boundingPolygon'] for word in words]))
+        render(image, polygons=line_polygons, color=(0, 0, 255))
+        render(image, polygons=word_polygons, color=(0, 255, 0))
+
+    save_or_show(image, output_path, 'Image with Bounding Box')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,340 @@
+"""
+USAGE:
+    python ai_jobs.py sample_jobs.jsonl results.jsonl [--workers 8] [--processes] [--checkpoint-every 100]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) CUSTOM_VISION_DETECT_PROJECT_ID - for custom_vision.detect jobs that do not name a project
+    4) AI_RATE_LIMIT / AI_RATE_LIMIT_DIR - optional, see ai_rate_limit.py
+
+    Runs a JSONL file of jobs, one per line, across a thread or process pool:
+
+    {"id": "a1", "op": "text.sentiment", "input": {"documents": ["I had the best day of my life."]}}
+    {"id": "b7", "op": "image.read", "input": {"path": "./images/SpanishSign.png"}}
+    {"id": "c3", "op": "custom_vision.detect", "input": {"path": "./images/SoccerBall.png"}}
+    {"id": "d9", "op": "document.layout", "input": {"url": "https://.../sample-layout.pdf"}}
+
+    The input is streamed, only a bounded window of jobs is in flight, and one line is written to the
+    output for every job, in input order, with either a result or an error. Every checkpoint_every
+    jobs the output is flushed and the input offset and output size are written to <output>.checkpoint.
+    Running the same command again after a crash truncates the output back to the last checkpoint
+    and continues from the matching input offset, so no job is lost or written twice. Results are
+    appended to an existing output, what was there before the run is never truncated. The checkpoint
+    records the path and size of its input, an unfinished run is only resumed with the same input.
+
+    pip install azure-ai-textanalytics azure-ai-vision-imageanalysis azure-ai-formrecognizer
+    pip install azure-cognitiveservices-vision-customvision opencv-python numpy requests
+"""
+import argparse
+import enum
+import json
+import os
+import sys
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+DEFAULT_WORKERS = 8
+DEFAULT_CHECKPOINT_EVERY = 100
+
+# Jobs queued per worker, bounds memory while keeping every worker busy
+WINDOW_PER_WORKER = 4
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+
+
+def handler(operation: str) -> Callable:
+    """
+    Register a function that runs the jobs of an operation, it receives the input object of the job
+    and returns anything to_jsonable() can convert.
+    Handlers must be defined at module level to be usable from a process pool.
+    """
+    def decorator(function: Callable) -> Callable:
+        HANDLERS[operation] = function
+        return function
+    return decorator
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    Convert SDK models, enums and NumPy values to plain JSON types.
+    """
+    if isinstance(value, enum.Enum):
+        return to_jsonable(value.value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    for method in ("as_dict", "to_dict"):
+        if callable(getattr(value, method, None)):
+            return to_jsonable(getattr(value, method)())
+    if hasattr(value, "__dict__"):
+        return {key: to_jsonable(item) for key, item in vars(value).items() if not key.startswith("_")}
+    return str(value)
+
+
+def _read_source(job_input: Dict[str, Any]) -> bytes:
+    if "path" in job_input:
+        with open(job_input["path"], "rb") as file:
+            return file.read()
+    import requests
+    response = requests.get(job_input["url"], timeout=60)
+    response.raise_for_status()
+    return response.content
+
+
+@handler("text.sentiment")
+def text_sentiment(job_input: Dict[str, Any]) -> Any:
+    from ai_cache import cached_call
+    from ai_clients import registry
+
+    documents = job_input.get("documents") or [job_input["text"]]
+    options = {key: job_input[key] for key in ("language", "show_opinion_mining") if key in job_input}
+    client = registry.text_analytics()
+    result = cached_call(
+        "analyze_sentiment", documents,
+        lambda: client.analyze_sentiment(documents, **options),
+        options=options,
+    )
+    return list(result)
+
+
+@handler("image.read")
+def image_read(job_input: Dict[str, Any]) -> Any:
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
+    from ai_cache import cached_call
+    from ai_clients import registry
+    from ai_preprocess import prepare_image
+    from ai_render import points_to_polygons
+
+    prepared = prepare_image(_read_source(job_input), "read")
+    client = registry.image_analysis()
+    result = cached_call(
+        "image.analyze", prepared.data,
+        lambda: client.analyze(image_data=prepared.data, visual_features=[VisualFeatures.READ]),
+        options={"visual_features": ["read"]},
+    )
+    lines = [line for block in result.read.blocks for line in block.lines]
+    # Polygons are mapped back to the original image, the upload may have been downscaled
+    polygons = prepared.to_original(points_to_polygons([line["boundingPolygon"] for line in lines]))
+    return {
+        "lines": [
+            {"text": line["text"], "polygon": polygon.ravel().tolist()}
+            for line, polygon in zip(lines, polygons)
+        ],
+    }
+
+
+@handler("custom_vision.detect")
+def custom_vision_detect(job_input: Dict[str, Any]) -> Any:
+    from ai_cache import cached_call
+    from ai_clients import registry
+    from ai_preprocess import prepare_image
+    from ai_rate_limit import limited
+
+    project_id = job_input.get("project_id") or os.environ["CUSTOM_VISION_DETECT_PROJECT_ID"]
+    iteration = job_input.get("iteration", "Iteration1")
+    prepared = prepare_image(_read_source(job_input), "custom_vision_detect")
+    predictor = registry.custom_vision_prediction()
+    result = cached_call(
+        "custom_vision.detect_image", prepared.data,
+        lambda: limited(predictor.detect_image, project_id, iteration, prepared.data),
+        options={"project_id": project_id},
+        model_version=iteration,
+    )
+    # Boxes are normalized, they apply to the original image as they are
+    return [
+        {
+            "tag": prediction.tag_name,
+            "probability": prediction.probability,
+            "box": [prediction.bounding_box.left, prediction.bounding_box.top,
+                    prediction.bounding_box.width, prediction.bounding_box.height],
+        }
+        for prediction in result.predictions
+    ]
+
+
+@handler("document.layout")
+def document_layout(job_input: Dict[str, Any]) -> Any:
+    from ai_cache import cached_call
+    from ai_clients import registry
+
+    model_id = job_input.get("model_id", "prebuilt-layout")
+    document = _read_source(job_input)
+    client = registry.document_analysis()
+    result = cached_call(
+        "begin_analyze_document", document,
+        lambda: client.begin_analyze_document(model_id=model_id, document=document).result(),
+        options={"model_id": model_id},
+    )
+    return result.to_dict()
+
+
+def execute(line: bytes) -> str:
+    """
+    Run one JSONL job line and return its output line, failures are reported in the line instead of raised.
+    """
+    job_id = operation = None
+    try:
+        job = json.loads(line)
+        job_id, operation = job.get("id"), job.get("op")
+        if operation not in HANDLERS:
+            raise KeyError(f"Unknown operation '{operation}'")
+        result = to_jsonable(HANDLERS[operation](job.get("input") or {}))
+        record = {"id": job_id, "op": operation, "result": result}
+    except Exception as error:
+        record = {"id": job_id, "op": operation, "error": {"type": type(error).__name__, "message": str(error)}}
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _init_worker() -> None:
+    from dotenv import load_dotenv
+    import ai_telemetry
+    from ai_rate_limit import install_from_env
+    load_dotenv()
+    # Every worker process shares the endpoint limiter through AI_RATE_LIMIT_DIR
+    install_from_env()
+    ai_telemetry.install_from_env()
+
+
+def _jobs(input_file: Any) -> Iterator[Tuple[int, bytes]]:
+    """
+    Non blank lines of the input with the offset right after each one.
+    """
+    offset = input_file.tell()
+    for line in input_file:
+        offset += len(line)
+        if line.strip():
+            yield offset, line
+
+
+def read_checkpoint(checkpoint_path: str) -> Dict[str, Any]:
+    """
+    :return: the checkpoint, None when there is none
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def start_checkpoint(checkpoint_path: str, input_path: str, output_path: str) -> Dict[str, Any]:
+    """
+    The checkpoint to start from: the last one of an unfinished run of the same input, or a new
+    run appended to the output as it is.
+    :raises ValueError: when an unfinished run of another input, or of a changed input, left the checkpoint
+    """
+    source = {"input_path": os.path.abspath(input_path), "input_size": os.path.getsize(input_path)}
+    checkpoint = read_checkpoint(checkpoint_path)
+    if checkpoint is not None and not checkpoint.get("finished"):
+        if any(checkpoint.get(name, value) != value for name, value in source.items()):
+            raise ValueError(
+                f"{checkpoint_path} belongs to an unfinished run of {checkpoint.get('input_path')} "
+                f"({checkpoint.get('input_size')} bytes), resume it with that input or delete the checkpoint"
+            )
+        return {**checkpoint, **source}
+    if checkpoint is not None and all(checkpoint.get(name) == value for name, value in source.items()):
+        # The same input again, everything is already in the output
+        return checkpoint
+    output_size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    return {**source, "input_offset": 0, "output_size": output_size, "completed": 0, "finished": False}
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint: Dict[str, int]) -> None:
+    """
+    Replace the checkpoint atomically, a crash leaves either the old or the new one.
+    """
+    temp_path = f"{checkpoint_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, checkpoint_path)
+
+
+def run_jobs(
+    input_path: str,
+    output_path: str,
+    workers: int = DEFAULT_WORKERS,
+    processes: bool = False,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    checkpoint_path: str = None,
+) -> int:
+    """
+    Run every job of a JSONL file and write one output line per job, resuming from the last checkpoint.
+    :param workers: size of the pool
+    :param processes: use a process pool instead of threads, for CPU heavy preprocessing
+    :param checkpoint_every: jobs written between checkpoints
+    :return: number of jobs completed, including those of earlier runs
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    workers, checkpoint_every = int(workers), int(checkpoint_every)
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+    checkpoint = start_checkpoint(checkpoint_path, input_path, output_path)
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    window = workers * WINDOW_PER_WORKER
+
+    with open(input_path, "rb") as input_file, open(output_path, "ab") as output_file, \
+            pool_class(max_workers=workers, initializer=_init_worker) as pool:
+        # Drop anything written after the last checkpoint, those jobs run again. output_size is
+        # the size the output had when the run started until the first checkpoint is written.
+        output_file.truncate(checkpoint["output_size"])
+        output_file.seek(0, os.SEEK_END)
+        input_file.seek(checkpoint["input_offset"])
+        completed = checkpoint["completed"]
+        pending = deque()
+
+        def write_oldest() -> None:
+            nonlocal completed
+            end_offset, future = pending.popleft()
+            output_file.write(future.result().encode("utf-8"))
+            completed += 1
+            if completed % checkpoint_every == 0:
+                output_file.flush()
+                os.fsync(output_file.fileno())
+                write_checkpoint(checkpoint_path, {
+                    **checkpoint, "input_offset": end_offset, "output_size": output_file.tell(), "completed": completed,
+                })
+
+        for end_offset, line in _jobs(input_file):
+            pending.append((end_offset, pool.submit(execute, line)))
+            if len(pending) >= window:
+                write_oldest()
+        while pending:
+            write_oldest()
+
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        write_checkpoint(checkpoint_path, {
+            **checkpoint, "input_offset": input_file.tell(), "output_size": output_file.tell(),
+            "completed": completed, "finished": True,
+        })
+    return completed
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python ai_jobs.py", description="Run a JSONL file of jobs")
+    parser.add_argument("input", help="JSONL file with one {id, op, input} job per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY)
+    options = parser.parse_args(argv)
+
+    print("\n -- run_jobs")
+    try:
+        completed = run_jobs(options.input, options.output, options.workers, options.processes, options.checkpoint_every)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"{completed} job(s) completed, results in {options.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,392 @@
+"""
+USAGE:
+    python ai_lang_detect.py
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Detects the language of most documents locally and only sends the ambiguous ones to
+    detect_language. A script used by a single language (kana, hangul, thai, greek, ...) decides
+    on its own. Latin script text is compared with character trigram profiles and stopword lists
+    of common languages and decided locally when it is long enough, both clearly pick the same
+    language and enough of its words are stopwords of that language. Close relatives (Danish,
+    Swedish, Norwegian, Afrikaans, Catalan, Galician, Romanian) have profiles too, and text that
+    looks like one of them goes to the service. Everything else, e.g. short text, Cyrillic, Arabic,
+    Hebrew or Han only text, goes to the service.
+
+    The documents are then sent to sentiment, entities or key phrases grouped by language, each
+    with an explicit language hint, so the service does not auto-detect them again.
+
+    pip install azure-ai-textanalytics aiohttp
+"""
+import math
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+# Share of the letters that have to be in one script for the script to decide
+MIN_SCRIPT_SHARE = 0.9
+MIN_SCRIPT_LETTERS = 8
+
+# Latin text is decided locally only when it has enough letters and the best profile wins clearly
+MIN_NGRAM_LETTERS = 40
+MIN_NGRAM_SIMILARITY = 0.12
+MIN_NGRAM_MARGIN = 0.05
+
+PROFILE_SIZE = 300
+
+# Scripts that identify a language on their own, keyed by the first word of the unicode character name
+SCRIPT_LANGUAGES = {
+    "HIRAGANA": "ja",
+    "KATAKANA": "ja",
+    "HANGUL": "ko",
+    "THAI": "th",
+    "GREEK": "el",
+    "GEORGIAN": "ka",
+    "ARMENIAN": "hy",
+    "TAMIL": "ta",
+    "TELUGU": "te",
+    "KANNADA": "kn",
+    "MALAYALAM": "ml",
+    "GUJARATI": "gu",
+    "GURMUKHI": "pa",
+    "KHMER": "km",
+    "LAO": "lo",
+    "SINHALA": "si",
+}
+
+LANGUAGE_NAMES = {
+    "ja": "Japanese", "ko": "Korean", "th": "Thai", "el": "Greek", "ka": "Georgian", "hy": "Armenian",
+    "ta": "Tamil", "te": "Telugu", "kn": "Kannada", "ml": "Malayalam", "gu": "Gujarati", "pa": "Punjabi",
+    "km": "Khmer", "lo": "Lao", "si": "Sinhala", "en": "English", "es": "Spanish", "fr": "French",
+    "de": "German", "it": "Italian", "pt": "Portuguese", "nl": "Dutch",
+}
+
+# Close relatives of the languages above. They have profiles so that their text is not taken for
+# Dutch, Portuguese or Spanish, but a text that looks like one of them goes to the service.
+REJECT_LANGUAGES = frozenset(("da", "sv", "no", "af", "ca", "gl", "ro"))
+
+# detect_language returns these names where the other calls expect a BCP 47 style hint
+SERVICE_LANGUAGE_HINTS = {"zh_chs": "zh-hans", "zh_cht": "zh-hant"}
+
+# Seed text of the trigram profiles, everyday prose with the most frequent words of each language
+SEED_TEXT = {
+    "en": "The weather was good and we walked with the dog to the park in the morning. It is one of the "
+          "things that I like to do when there is time, because the air is fresh and the people are friendly. "
+          "They said that the new shop would open next week, but nobody knows when it will have what we need. "
+          "We have been waiting for this for a long time and would like to see it happen soon. "
+          "Thank you for the help, this is the best service I have ever had and I will come back again.",
+    "es": "El tiempo era bueno y paseamos con el perro por el parque por la mañana. Es una de las cosas que "
+          "me gusta hacer cuando hay tiempo, porque el aire es fresco y la gente es amable. Dijeron que la nueva "
+          "tienda abriría la próxima semana, pero nadie sabe cuándo tendrá lo que necesitamos. Hemos esperado "
+          "esto durante mucho tiempo y queremos que suceda pronto. Gracias por la ayuda, este es el mejor "
+          "servicio que he tenido y volveré otra vez con mis amigos de la ciudad.",
+    "fr": "Le temps était beau et nous avons promené le chien dans le parc le matin. C'est une des choses que "
+          "j'aime faire quand il y a du temps, parce que l'air est frais et les gens sont aimables. Ils ont dit "
+          "que le nouveau magasin ouvrirait la semaine prochaine, mais personne ne sait quand il aura ce dont "
+          "nous avons besoin. Nous attendons cela depuis longtemps et nous voulons que cela arrive bientôt. "
+          "Merci pour l'aide, c'est le meilleur service que j'ai eu et je reviendrai avec mes amis.",
+    "de": "Das Wetter war gut und wir sind am Morgen mit dem Hund durch den Park gegangen. Das ist eine der "
+          "Sachen, die ich gerne mache, wenn ich Zeit habe, weil die Luft frisch ist und die Leute freundlich "
+          "sind. Sie haben gesagt, dass der neue Laden nächste Woche öffnet, aber niemand weiß, wann er das "
+          "haben wird, was wir brauchen. Wir warten schon lange darauf und möchten, dass es bald passiert. "
+          "Vielen Dank für die Hilfe, das ist der beste Service, den ich je hatte, und ich komme wieder.",
+    "it": "Il tempo era bello e abbiamo portato il cane nel parco la mattina. È una delle cose che mi piace "
+          "fare quando c'è tempo, perché l'aria è fresca e la gente è gentile. Hanno detto che il nuovo negozio "
+          "aprirà la prossima settimana, ma nessuno sa quando avrà quello di cui abbiamo bisogno. Lo aspettiamo "
+          "da molto tempo e vorremmo che succedesse presto. Grazie per l'aiuto, questo è il migliore servizio "
+          "che abbia mai avuto e tornerò ancora con i miei amici della città.",
+    "pt": "O tempo estava bom e passeamos com o cachorro no parque de manhã. É uma das coisas que eu gosto de "
+          "fazer quando tenho tempo, porque o ar é fresco e as pessoas são simpáticas. Disseram que a nova loja "
+          "vai abrir na próxima semana, mas ninguém sabe quando terá o que nós precisamos. Estamos esperando "
+          "isso há muito tempo e queremos que aconteça logo. Obrigado pela ajuda, este é o melhor serviço que "
+          "já tive e vou voltar outra vez com os meus amigos da cidade.",
+    "nl": "Het weer was goed en we hebben 's ochtends met de hond in het park gewandeld. Het is een van de "
+          "dingen die ik graag doe als er tijd is, omdat de lucht fris is en de mensen vriendelijk zijn. Ze "
+          "zeiden dat de nieuwe winkel volgende week open gaat, maar niemand weet wanneer die heeft wat wij "
+          "nodig hebben. We wachten hier al lang op en willen dat het snel gebeurt. Bedankt voor de hulp, dit "
+          "is de beste service die ik ooit heb gehad en ik kom zeker terug met mijn vrienden uit de stad.",
+    "da": "Vejret var godt, og vi gik en tur med hunden i parken om morgenen. Det er en af de ting, som jeg "
+          "godt kan lide at gøre, når der er tid, fordi luften er frisk og folk er venlige. De sagde, at den nye "
+          "butik ville åbne i næste uge, men ingen ved, hvornår den har det, vi har brug for. Vi har ventet på "
+          "det længe og vil gerne have, at det sker snart. Tak for hjælpen, det er den bedste service, jeg "
+          "nogensinde har fået, og jeg kommer igen med mine venner fra byen.",
+    "sv": "Vädret var fint och vi gick med hunden i parken på morgonen. Det är en av de saker som jag tycker "
+          "om att göra när det finns tid, eftersom luften är frisk och människorna är vänliga. De sa att den nya "
+          "affären skulle öppna nästa vecka, men ingen vet när den kommer att ha det vi behöver. Vi har väntat "
+          "på det länge och vill att det ska hända snart. Tack för hjälpen, det här är den bästa service jag "
+          "någonsin har fått och jag kommer tillbaka med mina vänner från staden.",
+    "no": "Været var fint, og vi gikk tur med hunden i parken om morgenen. Det er en av de tingene jeg liker "
+          "å gjøre når det er tid, fordi luften er frisk og folk er hyggelige. De sa at den nye butikken skulle "
+          "åpne neste uke, men ingen vet når den får det vi trenger. Vi har ventet på dette lenge og vil gjerne "
+          "at det skjer snart. Takk for hjelpen, dette er den beste servicen jeg noen gang har fått, og jeg "
+          "kommer tilbake med vennene mine fra byen.",
+    "af": "Die weer was goed en ons het die oggend met die hond in die park gestap. Dit is een van die dinge "
+          "wat ek graag doen as daar tyd is, omdat die lug vars is en die mense vriendelik is. Hulle het gesê "
+          "dat die nuwe winkel volgende week oopmaak, maar niemand weet wanneer dit sal hê wat ons nodig het "
+          "nie. Ons wag al lank hierop en wil hê dit moet gou gebeur. Baie dankie vir die hulp, dit is die "
+          "beste diens wat ek nog ooit gehad het en ek sal weer kom saam met my vriende uit die stad.",
+    "ca": "El temps era bo i vam passejar amb el gos pel parc al matí. És una de les coses que m'agrada fer "
+          "quan hi ha temps, perquè l'aire és fresc i la gent és amable. Van dir que la nova botiga obriria la "
+          "setmana vinent, però ningú no sap quan tindrà el que necessitem. Ho esperem des de fa molt de temps "
+          "i volem que passi aviat. Gràcies per l'ajuda, aquest és el millor servei que he tingut mai i tornaré "
+          "una altra vegada amb els meus amics de la ciutat.",
+    "gl": "O tempo estaba bo e paseamos co can polo parque pola mañá. É unha das cousas que me gusta facer "
+          "cando hai tempo, porque o aire é fresco e a xente é amable. Dixeron que a nova tenda abriría a "
+          "próxima semana, pero ninguén sabe cando terá o que necesitamos. Agardamos isto dende hai moito "
+          "tempo e queremos que aconteza axiña. Grazas pola axuda, este é o mellor servizo que tiven nunca e "
+          "volverei outra vez cos meus amigos da cidade.",
+    "ro": "Vremea a fost bună și ne-am plimbat cu câinele prin parc dimineața. Este unul dintre lucrurile pe "
+          "care îmi place să le fac când am timp, pentru că aerul este proaspăt și oamenii sunt prietenoși. Au "
+          "spus că noul magazin se va deschide săptămâna viitoare, dar nimeni nu știe când va avea ce ne "
+          "trebuie. Așteptăm asta de mult timp și vrem să se întâmple curând. Mulțumesc pentru ajutor, acesta "
+          "este cel mai bun serviciu pe care l-am avut și mă voi întoarce cu prietenii mei din oraș.",
+}
+
+
+# The most frequent words of each language, a strong signal even in a sentence
+STOPWORDS = {
+    "en": "the and of to a in is it that for was with on as have be at this but they you i not are by from or "
+          "had we his her an will my all would there their what so if about which when one your me do",
+    "es": "de la que el en y a los se del las un por con no una su para es al lo como más pero sus le ya o "
+          "este fue ha me si sin sobre muy también hasta hay donde quien desde todo nos durante",
+    "fr": "de la le et les des en un une du est que pour qui dans ne pas sur au plus par avec il se ce sont "
+          "elle nous vous mais ou je son sa aux leur été très cette était ont",
+    "de": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an er "
+          "hat aus bei sind noch nach wie wird einer um über so zum war haben nur oder aber ich",
+    "it": "di e il la che in a per un è del non sono una della con i le si da al lo gli mi ma come anche "
+          "nel più alla questo ha ci suo sua dei delle loro essere era",
+    "pt": "de a o que e do da em um para com não uma os no se na por mais as dos como mas ao ele das à seu "
+          "sua ou quando muito nos já eu também só pelo pela até isso",
+    "nl": "de en van het een in is dat op te zijn met voor niet aan er die ook als bij door maar om dan "
+          "zou of wat mijn hij we ze worden heeft kan naar nog hebben",
+    "da": "og i at det er en til på de som med den for af ikke har jeg der var et vi kan men om så sig "
+          "han hun fra ved eller skal når have nu hvor også efter mig",
+    "sv": "och i att det som en på är av för med till den har de inte om ett jag var men så från vi kan "
+          "han hon eller när ska nu också efter mig hade vara",
+    "no": "og i det er som en på til av for at med har de ikke den jeg var et om men så vi kan han hun "
+          "fra eller skal når nå også etter meg hadde være",
+    "af": "die en van is in om te dat nie het 'n wat vir op met ek sy hy ons hulle was word as by aan "
+          "maar ook kan sal daar nog dit",
+    "ca": "de la el i a que en les els per un una és amb no del al es va com més però ho hi seu són "
+          "també si quan molt aquest aquesta",
+    "gl": "de o a que e do da en un unha para con non os no se na por máis as dos como pero ao das seu "
+          "súa ou cando moito nos xa eu tamén pola polo ata iso",
+    "ro": "și de în la a cu pe că nu un o din pentru este care se mai sunt ce sau dar au fost ca al lui "
+          "ei el ea prin când foarte acest această",
+}
+
+# Stopword hits the best language needs ahead of the runner-up
+MIN_STOPWORD_LEAD = 2
+
+# Share of the words of the text that have to be stopwords of the best language. Prose has about
+# a third, text in a language without a profile shares a few short words at most.
+MIN_STOPWORD_SHARE = 0.2
+
+
+class Detection(NamedTuple):
+    # Language hint for the other text calls, None when the language is unknown
+    language: str
+    name: str
+    confidence: float
+    # "script", "ngram" or "service"
+    source: str
+
+
+def _script(character: str) -> str:
+    name = unicodedata.name(character, "")
+    if name.startswith("CJK"):
+        return "HAN"
+    return name.split(" ", 1)[0]
+
+
+def _trigrams(text: str) -> Counter:
+    counts = Counter()
+    for word in "".join(character if character.isalpha() else " " for character in text.lower()).split():
+        padded = f" {word} "
+        counts.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return counts
+
+
+def _vector(counts: Counter, size: int = None) -> Dict[str, float]:
+    items = counts.most_common(size)
+    norm = math.sqrt(sum(count * count for _, count in items)) or 1.0
+    return {gram: count / norm for gram, count in items}
+
+
+_profiles: Dict[str, Dict[str, float]] = {}
+
+
+def _get_profiles() -> Dict[str, Dict[str, float]]:
+    if not _profiles:
+        _profiles.update({language: _vector(_trigrams(text), PROFILE_SIZE) for language, text in SEED_TEXT.items()})
+    return _profiles
+
+
+def _words(text: str) -> List[str]:
+    return "".join(character if character.isalpha() else " " for character in text.lower()).split()
+
+
+def stopword_hits(text: str) -> List[Tuple[str, int]]:
+    """
+    :return: [(language, number of words of text in its stopword list)] best first
+    """
+    global _stopwords
+    if _stopwords is None:
+        _stopwords = {language: frozenset(words.split()) for language, words in STOPWORDS.items()}
+    words = _words(text)
+    hits = [(language, sum(word in stopwords for word in words)) for language, stopwords in _stopwords.items()]
+    return sorted(hits, key=lambda item: item[1], reverse=True)
+
+
+_stopwords: Dict[str, frozenset] = None
+
+
+def ngram_scores(text: str) -> List[Tuple[str, float]]:
+    """
+    Cosine similarity of the trigrams of text with each language profile.
+    :return: [(language, similarity)] best first
+    """
+    vector = _vector(_trigrams(text))
+    scores = [
+        (language, sum(weight * profile.get(gram, 0.0) for gram, weight in vector.items()))
+        for language, profile in _get_profiles().items()
+    ]
+    return sorted(scores, key=lambda item: item[1], reverse=True)
+
+
+def detect_local(text: str) -> Detection:
+    """
+    Detect the language without calling the service.
+    :return: Detection, with language None when the text is ambiguous and should go to the service
+    """
+    letters = [character for character in text[:2000] if character.isalpha()]
+    scripts = Counter(_script(character) for character in letters)
+    if len(letters) >= MIN_SCRIPT_LETTERS:
+        # Japanese mixes kana with Han characters, any kana decides for Japanese
+        kana = scripts["HIRAGANA"] + scripts["KATAKANA"]
+        if kana and (kana + scripts["HAN"]) / len(letters) >= MIN_SCRIPT_SHARE:
+            return Detection("ja", LANGUAGE_NAMES["ja"], (kana + scripts["HAN"]) / len(letters), "script")
+        script, count = scripts.most_common(1)[0]
+        share = count / len(letters)
+        if share >= MIN_SCRIPT_SHARE and script in SCRIPT_LANGUAGES:
+            language = SCRIPT_LANGUAGES[script]
+            return Detection(language, LANGUAGE_NAMES[language], share, "script")
+        if share >= MIN_SCRIPT_SHARE and script == "LATIN" and len(letters) >= MIN_NGRAM_LETTERS:
+            # The trigram profile and the stopwords have to agree, on a language that is not rejected
+            (best, similarity), (_, runner_up) = ngram_scores(text[:2000])[:2]
+            margin = (similarity - runner_up) / similarity if similarity else 0.0
+            (word_best, hits), (_, word_runner_up) = stopword_hits(text[:2000])[:2]
+            if (
+                best == word_best
+                and best not in REJECT_LANGUAGES
+                and similarity >= MIN_NGRAM_SIMILARITY
+                and margin >= MIN_NGRAM_MARGIN
+                and hits - word_runner_up >= MIN_STOPWORD_LEAD
+                and hits >= MIN_STOPWORD_SHARE * len(_words(text[:2000]))
+            ):
+                return Detection(best, LANGUAGE_NAMES[best], round(min(1.0, 0.5 + margin), 2), "ngram")
+    return Detection(None, None, 0.0, "local")
+
+
+def detect_languages(documents: Sequence[str], country_hint: str = None, **kwargs: Any) -> List[Detection]:
+    """
+    Detect the language of every document, locally when possible and with detect_language otherwise.
+    :param country_hint: passed to detect_language for the ambiguous documents
+    :param kwargs: passed to ai_text_batch.analyze_documents, e.g. concurrency
+    :return: a Detection per document, in input order
+    """
+    detections = [detect_local(text) for text in documents]
+    ambiguous = [index for index, detection in enumerate(detections) if detection.language is None]
+    if ambiguous:
+        from ai_text_batch import analyze_documents
+
+        if country_hint is not None:
+            kwargs["country_hint"] = country_hint
+        for batch_result in analyze_documents([documents[index] for index in ambiguous], "detect_language", **kwargs):
+            result = batch_result.result
+            index = ambiguous[batch_result.index]
+            if result.is_error or result.primary_language.iso6391_name == "(Unknown)":
+                detections[index] = Detection(None, None, 0.0, "service")
+                continue
+            language = result.primary_language.iso6391_name
+            detections[index] = Detection(
+                SERVICE_LANGUAGE_HINTS.get(language, language), result.primary_language.name,
+                result.primary_language.confidence_score, "service",
+            )
+    return detections
+
+
+def group_by_language(detections: Sequence[Detection]) -> Dict[str, List[int]]:
+    """
+    :return: {language: [document index]}, documents of unknown language under None
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, detection in enumerate(detections):
+        groups.setdefault(detection.language, []).append(index)
+    return groups
+
+
+def analyze_by_language(
+    documents: Sequence[str],
+    operation: str = "analyze_sentiment",
+    detections: Sequence[Detection] = None,
+    **kwargs: Any,
+) -> Iterator[Any]:
+    """
+    Run a text analytics operation with an explicit language hint on every document.
+    Documents go out grouped by language, so each request holds documents of one language.
+    :param operation: analyze_sentiment, recognize_entities, extract_key_phrases, ...
+    :param detections: the result of detect_languages() when already known
+    :param kwargs: passed to ai_text_batch.analyze_documents, e.g. concurrency
+    :return: iterator of BatchResult(index in documents, result), grouped by language
+    """
+    from azure.ai.textanalytics import TextDocumentInput
+    from ai_text_batch import BatchResult, analyze_documents
+
+    detections = detections or detect_languages(documents)
+    order = [index for indices in group_by_language(detections).values() for index in indices]
+    inputs = [
+        # Documents of unknown language get the default language of the client
+        TextDocumentInput(id=str(index), text=documents[index], language=detections[index].language)
+        for index in order
+    ]
+    # A request never mixes two groups
+    for batch_result in analyze_documents(inputs, operation, split_on=lambda document: document.language, **kwargs):
+        yield BatchResult(order[batch_result.index], batch_result.result)
+
+
+def language_grouped_sentiment() -> None:
+    """
+    Detect the languages of a mixed corpus, mostly locally, and analyze sentiment with language hints.
+    :return: None
+    """
+    print("\n -- language_grouped_sentiment")
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    documents = [
+        "I had the best day of my life, the weather was perfect and the food was great.",
+        "Fue el mejor día de mi vida, el tiempo era perfecto y la comida estaba buenísima.",
+        "C'était le plus beau jour de ma vie, le temps était parfait et la nourriture excellente.",
+        "犬を散歩に連れて行くことは、身体的な運動と精神的な刺激の両方を提供します。",
+        "오늘은 내 인생 최고의 날이었습니다.",
+        "Это был лучший день в моей жизни.",
+        "Great!",
+    ]
+    detections = detect_languages(documents)
+    for text, detection in zip(documents, detections):
+        print(f"{detection.source:>7}: {detection.name} ({detection.confidence:.2f}) '{text[:40]}'")
+    local = sum(detection.source in ("script", "ngram") for detection in detections)
+    print(f"{local} of {len(documents)} document(s) detected without a service call")
+
+    for index, result in sorted(analyze_by_language(documents, "analyze_sentiment", detections)):
+        if result.is_error:
+            print(f"Document {index} failed with code '{result.error.code}'")
+        else:
+            print(f"Document {index} [{detections[index].language}] overall sentiment: {result.sentiment}")
+
+
+if __name__ == "__main__":
+    language_grouped_sentiment()
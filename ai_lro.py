@@ -0,0 +1,244 @@
+"""
+USAGE:
+    python ai_lro.py
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Keeps many long-running operations (begin_analyze_healthcare_entities, begin_analyze_actions,
+    begin_analyze_document) in flight on one event loop instead of blocking a thread on each
+    poller.result(). The scheduler drives the async pollers itself: it waits at least as long as the
+    service asks for in Retry-After, and otherwise polls around the time jobs of the same kind
+    have been observed to finish.
+
+    pip install azure-ai-textanalytics azure-ai-formrecognizer aiohttp
+"""
+import asyncio
+import email.utils
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+DEFAULT_MAX_IN_FLIGHT = 100
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 10.0
+
+BeginCallable = Callable[[], Awaitable[Any]]
+WaitHook = Callable[[str, float], None]
+
+# Called with (kind, seconds) after every sleep between polls of any scheduler
+_wait_hooks: List[WaitHook] = []
+
+
+class JobResult(NamedTuple):
+    key: Any
+    kind: str
+    result: Any
+    error: BaseException
+    elapsed: float
+
+
+def parse_retry_after(headers: Any) -> float:
+    """
+    Read the delay the service asked for from retry-after-ms, x-ms-retry-after-ms or Retry-After.
+    :param headers: response headers, any mapping with case insensitive get() or plain dict
+    :return: seconds, or None when no header is present
+    """
+    lowered = {name.lower(): value for name, value in dict(headers or {}).items()}
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if lowered.get(name):
+            try:
+                return float(lowered[name]) / 1000.0
+            except ValueError:
+                pass
+    value = lowered.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+
+
+def add_wait_hook(hook: WaitHook) -> None:
+    """
+    Report the time every scheduler spends waiting between polls, e.g. to telemetry.
+    :param hook: called with (kind, seconds) after each sleep
+    """
+    if hook not in _wait_hooks:
+        _wait_hooks.append(hook)
+
+
+class CompletionEstimator:
+    """
+    Exponential moving average of how long each kind of job takes to finish.
+    """
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._averages: Dict[str, float] = {}
+
+    def observe(self, kind: str, elapsed: float) -> None:
+        average = self._averages.get(kind)
+        self._averages[kind] = elapsed if average is None else average + self.smoothing * (elapsed - average)
+
+    def expected(self, kind: str) -> float:
+        return self._averages.get(kind)
+
+
+class LROScheduler:
+    """
+    Multiplexes long-running operations over one event loop with a cap on jobs in flight.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        min_interval: float = MIN_POLL_INTERVAL,
+        max_interval: float = MAX_POLL_INTERVAL,
+        on_done: Callable[[JobResult], None] = None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.on_done = on_done
+        self.estimator = CompletionEstimator()
+        self.poll_wait = 0.0
+
+    def next_delay(self, kind: str, elapsed: float, previous: float, retry_after: float = None) -> float:
+        """
+        Pick how long to sleep before the next status request.
+        Before the expected completion time sleep until shortly before it, after it back off exponentially.
+        :param kind: job kind, used to look up observed completion times
+        :param elapsed: seconds since the job was submitted
+        :param previous: the last delay used for this job, 0 for the first poll
+        :param retry_after: seconds requested by the service, a lower bound when present
+        :return: seconds
+        """
+        expected = self.estimator.expected(kind)
+        if expected is not None and elapsed < expected * 0.9:
+            delay = expected * 0.9 - elapsed
+        elif previous:
+            delay = previous * 1.5
+        else:
+            delay = self.min_interval
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _wait(self, kind: str, poller: Any, started: float) -> Any:
+        polling_method = poller.polling_method()
+        if not hasattr(polling_method, "update_status"):
+            return await poller.result()
+
+        delay = 0.0
+        while not polling_method.finished():
+            pipeline_response = getattr(polling_method, "_pipeline_response", None)
+            headers = pipeline_response.http_response.headers if pipeline_response is not None else None
+            delay = self.next_delay(kind, time.monotonic() - started, delay, parse_retry_after(headers))
+            await asyncio.sleep(delay)
+            self.poll_wait += delay
+            for hook in _wait_hooks:
+                hook(kind, delay)
+            await polling_method.update_status()
+        # The status is terminal so result() only fetches and deserializes the final resource
+        return await poller.result()
+
+    async def _run_job(self, key: Any, kind: str, begin: BeginCallable) -> JobResult:
+        started = time.monotonic()
+        try:
+            poller = await begin()
+            result = await self._wait(kind, poller, started)
+        except Exception as error:
+            return JobResult(key, kind, None, error, time.monotonic() - started)
+        elapsed = time.monotonic() - started
+        self.estimator.observe(kind, elapsed)
+        return JobResult(key, kind, result, None, elapsed)
+
+    async def as_completed(self, jobs: Iterable[Tuple[Any, str, BeginCallable]]) -> AsyncIterator[JobResult]:
+        """
+        Start jobs up to max_in_flight at a time and yield each one as it finishes.
+        A failed job is yielded with its exception in error instead of stopping the others.
+        :param jobs: iterable of (key, kind, begin) where begin() returns the awaitable from a begin_* call
+        :return: async iterator of JobResult in completion order
+        """
+        jobs = iter(jobs)
+        pending = set()
+        try:
+            while True:
+                for key, kind, begin in jobs:
+                    pending.add(asyncio.ensure_future(self._run_job(key, kind, begin)))
+                    if len(pending) >= self.max_in_flight:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    job_result = task.result()
+                    if self.on_done is not None:
+                        self.on_done(job_result)
+                    yield job_result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run(self, jobs: Iterable[Tuple[Any, str, BeginCallable]]) -> Dict[Any, JobResult]:
+        """
+        Run every job and collect the results by key.
+        """
+        return {job_result.key: job_result async for job_result in self.as_completed(jobs)}
+
+
+async def analyze_many() -> None:
+    """
+    Run healthcare, multi action and layout jobs side by side and print them as they finish.
+    :return: None
+    """
+    print("\n -- analyze_many")
+    from azure.ai.textanalytics import RecognizeEntitiesAction, AnalyzeSentimentAction
+    from ai_clients import registry
+
+    healthcare_documents = [
+        ["Patient needs to take 100 mg of ibuprofen, and 3 mg of potassium."],
+        ["Patient needs to take 50 mg of ibuprofen, and 2 mg of Coumadin."],
+    ]
+    review_documents = [
+        ["Foo Company has the best tacos I have ever had!"],
+        ["Bar Company is the worst place to get a burger"],
+    ]
+    layout_url = "https://raw.githubusercontent.com/Azure-Samples/cognitive-services-REST-api-samples/master/curl/form-recognizer/sample-layout.pdf"
+
+    text_client = registry.text_analytics(is_async=True)
+    document_client = registry.document_analysis(is_async=True)
+    try:
+        jobs = []
+        for i, documents in enumerate(healthcare_documents):
+            jobs.append((f"healthcare-{i}", "healthcare",
+                         lambda documents=documents: text_client.begin_analyze_healthcare_entities(documents)))
+        for i, documents in enumerate(review_documents):
+            jobs.append((f"actions-{i}", "actions",
+                         lambda documents=documents: text_client.begin_analyze_actions(
+                             documents, actions=[RecognizeEntitiesAction(), AnalyzeSentimentAction()])))
+        jobs.append(("layout", "document",
+                     lambda: document_client.begin_analyze_document_from_url("prebuilt-layout", layout_url)))
+
+        scheduler = LROScheduler(max_in_flight=50)
+        async for job in scheduler.as_completed(jobs):
+            if job.error is not None:
+                print(f"Job {job.key} failed after {job.elapsed:.1f}s: {job.error}")
+            elif job.kind == "document":
+                print(f"Job {job.key} finished in {job.elapsed:.1f}s with {len(job.result.pages)} page(s)")
+            else:
+                count = 0
+                async for _ in job.result:
+                    count += 1
+                print(f"Job {job.key} finished in {job.elapsed:.1f}s with {count} document result(s)")
+        print(f"Time spent waiting between polls: {scheduler.poll_wait:.1f}s")
+    finally:
+        await registry.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(analyze_many())
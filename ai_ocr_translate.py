@@ -0,0 +1,269 @@
+"""
+USAGE:
+    python ai_ocr_translate.py [image path ...]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) AI_TRANSLATION_MEMORY_PATH - optional, SQLite file of the translation memory (default: ./.ai_translation_memory.sqlite)
+
+    Reads the text lines of many images with Image Analysis READ and translates them. Lines are
+    deduplicated across all images, looked up in a persistent translation memory keyed by
+    (text, source language, target language), and only the strings never seen before are sent,
+    packed into as few translate requests as the element and character limits allow, each
+    request translating into every target language at once.
+
+    pip install azure-ai-vision-imageanalysis azure-ai-translation-text opencv-python numpy
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+# Per-request limits, see https://learn.microsoft.com/azure/ai-services/translator/service-limits
+MAX_ELEMENTS = 1000
+# The characters of a request are counted once for each target language
+MAX_CHARACTERS = 50_000
+
+DEFAULT_MEMORY_PATH = ".ai_translation_memory.sqlite"
+
+# Source language key used when the service detects the language
+AUTO = "auto"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory (
+    source TEXT NOT NULL,
+    source_language TEXT NOT NULL,
+    target_language TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    detected_language TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (source, source_language, target_language)
+);
+"""
+
+
+class OcrLine(NamedTuple):
+    text: str
+    polygon: Any
+
+
+class TranslationMemory:
+    """
+    Persistent translations keyed by source text, source language and target language, backed by SQLite.
+    """
+
+    def __init__(self, path: str = DEFAULT_MEMORY_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def lookup(self, texts: Sequence[str], source_language: str, targets: Sequence[str]) -> Dict[Tuple[str, str], str]:
+        """
+        Known translations of texts into targets.
+        :return: {(text, target): translation} for the pairs in memory
+        """
+        found = {}
+        with self._lock:
+            # Keep well under SQLite's limit of bound parameters per statement
+            for start in range(0, len(texts), 500):
+                chunk = list(texts[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT source, target_language, translation FROM memory "
+                    f"WHERE source_language = ? AND source IN ({', '.join('?' * len(chunk))})",
+                    [source_language or AUTO, *chunk],
+                )
+                for source, target, translation in rows:
+                    if target in targets:
+                        found[(source, target)] = translation
+            self.hits += len(found)
+            self.misses += len(texts) * len(targets) - len(found)
+        return found
+
+    def store(self, rows: Iterable[Tuple[str, str, str, str, str]]) -> None:
+        """
+        :param rows: (source, source_language, target_language, translation, detected_language)
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?, ?)",
+                [(source, language or AUTO, target, translation, detected, now)
+                 for source, language, target, translation, detected in rows],
+            )
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def pack_requests(
+    texts: Sequence[str],
+    target_count: int = 1,
+    max_elements: int = MAX_ELEMENTS,
+    max_characters: int = MAX_CHARACTERS,
+) -> Iterator[List[str]]:
+    """
+    Group texts into requests within the element and character limits, in order.
+    A text over the character limit on its own is sent alone, the service reports it as an error.
+    """
+    batch: List[str] = []
+    characters = 0
+    for text in texts:
+        cost = len(text) * target_count
+        if batch and (len(batch) >= max_elements or characters + cost > max_characters):
+            yield batch
+            batch, characters = [], 0
+        batch.append(text)
+        characters += cost
+    if batch:
+        yield batch
+
+
+def unique_texts(texts: Iterable[str]) -> List[str]:
+    """
+    Distinct non blank texts, in order of first appearance.
+    """
+    return list(dict.fromkeys(text for text in texts if text and text.strip()))
+
+
+def translate_texts(
+    texts: Iterable[str],
+    targets: Sequence[str],
+    from_language: str = None,
+    memory: TranslationMemory = None,
+    client: Any = None,
+) -> Dict[str, Dict[str, str]]:
+    """
+    Translate texts into every target language, each distinct text reaches the service at most once.
+    :param targets: target language codes, e.g. ["en", "fr"]
+    :param from_language: source language code, detected by the service when not given
+    :param memory: translation memory, the one at AI_TRANSLATION_MEMORY_PATH by default
+    :return: {text: {target: translation}}
+    """
+    from ai_clients import registry
+
+    memory = memory or get_memory()
+    targets = list(targets)
+    distinct = unique_texts(texts)
+    known = memory.lookup(distinct, from_language, targets)
+
+    # Texts missing the same targets are translated together, usually a single group with every target
+    groups: Dict[Tuple[str, ...], List[str]] = {}
+    for text in distinct:
+        missing = tuple(target for target in targets if (text, target) not in known)
+        if missing:
+            groups.setdefault(missing, []).append(text)
+
+    if groups:
+        client = client or registry.translation()
+    for missing, group in groups.items():
+        for batch in pack_requests(group, len(missing)):
+            response = client.translate(body=batch, to_language=list(missing), from_language=from_language)
+            rows = []
+            for text, item in zip(batch, response):
+                detected = item.detected_language.language if item.detected_language else from_language
+                for translation in item.translations:
+                    known[(text, translation.to)] = translation.text
+                    rows.append((text, from_language, translation.to, translation.text, detected))
+                    if from_language is None and detected:
+                        # Also serve later calls that name the source language
+                        rows.append((text, detected, translation.to, translation.text, detected))
+            memory.store(rows)
+
+    return {text: {target: known.get((text, target)) for target in targets} for text in distinct}
+
+
+def read_lines(source: str, client: Any = None) -> Tuple[Any, List[OcrLine]]:
+    """
+    READ the text lines of one image, polygons mapped back to the original image.
+    :return: (PreparedImage, lines)
+    """
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
+    from ai_cache import cached_call
+    from ai_clients import registry
+    from ai_preprocess import prepare_image
+    from ai_render import points_to_polygons
+    from ai_telemetry import profiled
+
+    prepared = prepare_image(source, "read")
+    client = client or registry.image_analysis()
+    result = cached_call(
+        "image.analyze", prepared.data,
+        lambda: client.analyze(image_data=prepared.data, visual_features=[VisualFeatures.READ]),
+        options={"visual_features": ["read"]},
+    )
+    with profiled("ocr_translate.read"):
+        lines = [line for block in result.read.blocks for line in block.lines] if result.read else []
+        polygons = prepared.to_original(points_to_polygons([line["boundingPolygon"] for line in lines]))
+        return prepared, [OcrLine(line["text"], polygon) for line, polygon in zip(lines, polygons)]
+
+
+def translate_images(
+    sources: Sequence[str],
+    targets: Sequence[str],
+    from_language: str = None,
+    concurrency: int = 8,
+    memory: TranslationMemory = None,
+) -> List[Tuple[str, List[OcrLine], Dict[str, Dict[str, str]]]]:
+    """
+    READ every image concurrently, then translate the distinct lines of all of them together.
+    :return: [(source, lines, {text: {target: translation}})] in input order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        lines_per_image = [lines for _, lines in pool.map(read_lines, sources)]
+    translations = translate_texts(
+        (line.text for lines in lines_per_image for line in lines), targets, from_language, memory
+    )
+    return [
+        (source, lines, {line.text: translations[line.text] for line in lines if line.text in translations})
+        for source, lines in zip(sources, lines_per_image)
+    ]
+
+
+_default_memory = None
+_default_lock = threading.Lock()
+
+
+def get_memory() -> TranslationMemory:
+    """
+    The shared translation memory at AI_TRANSLATION_MEMORY_PATH.
+    """
+    global _default_memory
+    with _default_lock:
+        if _default_memory is None:
+            _default_memory = TranslationMemory(os.environ.get("AI_TRANSLATION_MEMORY_PATH", DEFAULT_MEMORY_PATH))
+        return _default_memory
+
+
+def translate_signs(*sources: str) -> None:
+    """
+    Translate the text of sign images into English and French.
+    :return: None
+    """
+    print("\n -- translate_signs")
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    sources = sources or ["./images/SpanishSign.png"]
+    for source, lines, translations in translate_images(sources, ["en", "fr"]):
+        print(f"{source}:")
+        for line in lines:
+            translated = translations.get(line.text, {})
+            print(f" '{line.text}' -> " + ", ".join(f"{target}: '{text}'" for target, text in translated.items()))
+    memory = get_memory()
+    print(f"Translation memory hits: {memory.hits}, misses: {memory.misses}")
+
+
+if __name__ == "__main__":
+    translate_signs(*sys.argv[1:])
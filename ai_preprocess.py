@@ -0,0 +1,178 @@
+"""
+USAGE:
+    from ai_preprocess import prepare_image
+
+    prepared = prepare_image("./images/ButterflyWithMoon.webp", "objects")
+    result = client.analyze(image_data=prepared.data, visual_features=[VisualFeatures.OBJECTS])
+    boxes = prepared.to_original([[bbox['x'], bbox['y'], bbox['w'], bbox['h']]])
+
+    Decodes an image once and produces the bytes to upload: downscaled to the largest resolution
+    the feature benefits from and re-encoded within the service size limit. The decoded original
+    is kept for drawing, and to_original() maps coordinates returned for the uploaded image back
+    to the original one. The original file is uploaded untouched when re-encoding would not make it smaller.
+
+    pip install opencv-python numpy
+"""
+from typing import Any, Tuple, Union
+
+# Longest side, in pixels, past which a feature stops getting better results
+MAX_SIDE = {
+    "tags": 1024,
+    "objects": 1024,
+    "caption": 1024,
+    "dense_captions": 1024,
+    "people": 1024,
+    "smart_crops": 1024,
+    # Text keeps getting more legible with resolution, stay well under the 16000px service limit
+    "read": 3200,
+    # Custom Vision resizes to its model input size, compact domains use 512 or smaller
+    "custom_vision_classify": 512,
+    "custom_vision_detect": 1024,
+}
+
+# Largest upload each service accepts
+MAX_BYTES = {
+    "image_analysis": 20 * 1024 * 1024,
+    "custom_vision": 4 * 1024 * 1024,
+}
+
+# Formats each service accepts without conversion, by file signature
+ACCEPTED_FORMATS = {
+    "image_analysis": ("jpeg", "png", "gif", "bmp", "webp", "tiff"),
+    "custom_vision": ("jpeg", "png", "gif", "bmp"),
+}
+
+JPEG_QUALITY = 85
+READ_JPEG_QUALITY = 92
+
+# Files at full resolution under this size are uploaded as they are without trying to re-encode them
+SMALL_FILE_BYTES = 256 * 1024
+
+
+def _service(feature: str) -> str:
+    return "custom_vision" if feature.startswith("custom_vision") else "image_analysis"
+
+
+def image_format(data: bytes) -> str:
+    """
+    Detect the format of encoded image bytes from their signature.
+    :return: jpeg, png, gif, bmp, webp, tiff or None
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] in (b"GIF8",):
+        return "gif"
+    if data[:2] == b"BM":
+        return "bmp"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+class PreparedImage:
+    """
+    A decoded image together with the bytes to upload and the scale between the two.
+    """
+
+    def __init__(self, image: Any, data: bytes, scale: float):
+        self.image = image
+        self.data = data
+        self.scale = scale
+
+    @property
+    def width(self) -> int:
+        return self.image.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.image.shape[0]
+
+    def to_original(self, coordinates: Any) -> Any:
+        """
+        Map pixel coordinates or sizes returned for the uploaded image back to the original image.
+        :param coordinates: array-like of any shape, e.g. N x 4 boxes or N x 8 polygons
+        :return: numpy int32 array of the same shape
+        """
+        import numpy as np
+
+        array = np.asarray(coordinates, dtype=np.float64)
+        if self.scale != 1.0:
+            array = array / self.scale
+        return np.rint(array).astype(np.int32)
+
+
+def decode_image(source: Union[str, bytes]) -> Tuple[Any, bytes]:
+    """
+    Read and decode an image file or encoded bytes.
+    :return: (BGR numpy array, encoded bytes)
+    """
+    import cv2
+    import numpy as np
+
+    if isinstance(source, str):
+        with open(source, "rb") as image_file:
+            data = image_file.read()
+    else:
+        data = bytes(source)
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("The image could not be decoded")
+    return image, data
+
+
+def prepare_image(
+    source: Union[str, bytes],
+    feature: str = "objects",
+    max_side: int = None,
+    max_bytes: int = None,
+) -> PreparedImage:
+    """
+    Decode an image once and build the upload for a feature.
+    :param source: path to an image file or encoded image bytes
+    :param feature: a key of MAX_SIDE, decides the resolution and the size limit
+    :param max_side: override the longest side of the upload
+    :param max_bytes: override the size limit of the upload
+    :return: PreparedImage
+    """
+    import cv2
+
+    service = _service(feature)
+    max_side = max_side or MAX_SIDE[feature]
+    max_bytes = max_bytes or MAX_BYTES[service]
+    image, original = decode_image(source)
+
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    keep_original = scale == 1.0 and image_format(original) in ACCEPTED_FORMATS[service]
+    if keep_original and len(original) <= min(max_bytes, SMALL_FILE_BYTES):
+        return PreparedImage(image, original, 1.0)
+
+    quality = READ_JPEG_QUALITY if feature == "read" else JPEG_QUALITY
+    while True:
+        if scale < 1.0:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            upload = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        else:
+            upload = image
+        ok, encoded = cv2.imencode(".jpg", upload, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("The image could not be encoded")
+        data = encoded.tobytes()
+        if len(data) <= max_bytes:
+            break
+        # Trade quality first, then resolution
+        if quality > 60:
+            quality -= 10
+        else:
+            scale *= 0.8
+
+    if keep_original and scale == 1.0 and len(original) <= len(data):
+        return PreparedImage(image, original, 1.0)
+    # Report the scale actually used, after rounding the resized dimensions
+    if scale < 1.0:
+        scale = upload.shape[1] / width
+    return PreparedImage(image, data, scale)
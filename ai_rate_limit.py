@@ -0,0 +1,417 @@
+"""
+USAGE:
+    import ai_rate_limit
+    ai_rate_limit.install(rate=15)          # before the first client is created
+
+    text_analytics_client = registry.text_analytics()
+    result = ai_rate_limit.limited(predictor.detect_image, project_id, iteration, image_bytes)
+
+    Set the environment variables to install the limiter with install_from_env():
+    1) AI_RATE_LIMIT - requests per second allowed on each endpoint, the limiter is off when not set.
+    2) AI_RATE_LIMIT_DIR - optional directory, e.g. /dev/shm, where the limiter state is shared between processes.
+
+    One limiter per endpoint, shared by every client of the registry: text analytics, image analysis,
+    document intelligence, translation and content safety through pipeline policies, custom vision and
+    face through limited(). Each request takes a token from a bucket refilled at the allowed rate and
+    a slot under a concurrency limit. A 429 pauses the whole endpoint until its Retry-After has passed
+    and halves both the rate and the concurrency limit, successful calls raise them back slowly
+    (AIMD), so the callers together settle just under the quota instead of retrying independently.
+
+    With AI_RATE_LIMIT_DIR the token bucket, the current rate and the pause live in a memory mapped
+    file locked with fcntl, so separate processes on the host share them. The concurrency limit
+    is per process. File sharing is only available on POSIX systems.
+"""
+import hashlib
+import os
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+# Multiplier applied to the rate and the concurrency limit on a 429
+DECREASE = 0.5
+
+# Fraction of the configured rate added back after each successful call
+RATE_INCREASE = 0.01
+
+MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 32
+
+# Pause used when a 429 comes without a Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+
+# Retries of a 429 for msrest based clients, which do not retry 429 themselves
+MSREST_RETRIES = 3
+
+# Sleep between checks for a free concurrency slot from async code
+ASYNC_SLOT_POLL = 0.005
+
+_STATE_FORMAT = "dddd"
+_STATE_SIZE = struct.calcsize(_STATE_FORMAT)
+
+
+class _LocalState:
+    """
+    Token bucket state (tokens, updated, rate, paused_until) of one process.
+    """
+
+    def __init__(self, initial: List[float]):
+        self._values = list(initial)
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> List[float]:
+        self._lock.acquire()
+        return self._values
+
+    def __exit__(self, *args: Any) -> None:
+        self._lock.release()
+
+
+class _FileState:
+    """
+    Token bucket state in a memory mapped file, locked with flock between processes and a lock between threads.
+    """
+
+    def __init__(self, path: str, initial: List[float]):
+        import fcntl
+        import mmap
+
+        self._fcntl = fcntl
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < _STATE_SIZE:
+                os.ftruncate(self._fd, _STATE_SIZE)
+                os.pwrite(self._fd, struct.pack(_STATE_FORMAT, *initial), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, _STATE_SIZE)
+        self._values = None
+
+    def __enter__(self) -> List[float]:
+        self._lock.acquire()
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        self._values = list(struct.unpack_from(_STATE_FORMAT, self._map))
+        return self._values
+
+    def __exit__(self, *args: Any) -> None:
+        struct.pack_into(_STATE_FORMAT, self._map, 0, *self._values)
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+        self._lock.release()
+
+
+class RateLimiter:
+    """
+    Token bucket with AIMD control of the rate and of the number of requests in flight for one endpoint.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        state_path: str = None,
+    ):
+        self.max_rate = float(rate)
+        self.min_rate = self.max_rate * 0.05
+        self.burst = float(burst or max(1.0, rate))
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        initial = [self.burst, time.time(), self.max_rate, 0.0]
+        self._state = _FileState(state_path, initial) if state_path else _LocalState(initial)
+        self._slots = threading.Condition()
+
+    @property
+    def rate(self) -> float:
+        with self._state as state:
+            return state[2]
+
+    def _take_token(self) -> float:
+        """
+        Take a token if one is available.
+        :return: 0 when a token was taken, otherwise the seconds to wait before trying again
+        """
+        with self._state as state:
+            tokens, updated, rate, paused_until = state
+            now = time.time()
+            if now < paused_until:
+                return paused_until - now
+            tokens = min(self.burst, tokens + (now - updated) * rate)
+            state[1] = now
+            if tokens >= 1.0:
+                state[0] = tokens - 1.0
+                return 0.0
+            state[0] = tokens
+            return (1.0 - tokens) / rate
+
+    def _try_slot(self) -> bool:
+        with self._slots:
+            if self.in_flight < max(MIN_CONCURRENCY, int(self.concurrency)):
+                self.in_flight += 1
+                return True
+            return False
+
+    def wait_token(self) -> None:
+        while True:
+            delay = self._take_token()
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def async_wait_token(self) -> None:
+        import asyncio
+        while True:
+            delay = self._take_token()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def acquire(self) -> None:
+        """
+        Block until a concurrency slot and a token are available.
+        """
+        with self._slots:
+            while self.in_flight >= max(MIN_CONCURRENCY, int(self.concurrency)):
+                self._slots.wait()
+            self.in_flight += 1
+        self.wait_token()
+
+    async def async_acquire(self) -> None:
+        import asyncio
+        while not self._try_slot():
+            await asyncio.sleep(ASYNC_SLOT_POLL)
+        await self.async_wait_token()
+
+    def release(self, succeeded: bool = True) -> None:
+        """
+        Give the slot back, a successful call raises the limits additively.
+        """
+        with self._slots:
+            self.in_flight -= 1
+            if succeeded:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+            self._slots.notify()
+        if succeeded:
+            with self._state as state:
+                state[2] = min(self.max_rate, state[2] + self.max_rate * RATE_INCREASE)
+
+    def on_throttled(self, retry_after: float = None) -> None:
+        """
+        Record a 429: pause the endpoint for Retry-After and cut the rate and the concurrency limit.
+        The limits are cut once per pause, the other requests that were already in flight only extend it.
+        """
+        pause = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+        with self._state as state:
+            now = time.time()
+            first = now >= state[3]
+            state[0] = 0.0
+            if first:
+                state[2] = max(self.min_rate, state[2] * DECREASE)
+            state[3] = max(state[3], now + pause)
+        with self._slots:
+            self.throttled += 1
+            if first:
+                self.concurrency = max(MIN_CONCURRENCY, self.concurrency * DECREASE)
+
+
+def _retry_after(response: Any) -> float:
+    from ai_lro import parse_retry_after
+    return parse_retry_after(response.http_response.headers)
+
+
+def _policies() -> Dict[str, type]:
+    """
+    Pipeline policy classes, defined on first use so importing this module does not import azure-core.
+    """
+    global _policy_classes
+    if _policy_classes:
+        return _policy_classes
+    from azure.core.pipeline.policies import AsyncHTTPPolicy, AsyncRetryPolicy, HTTPPolicy, RetryPolicy
+
+    class RateLimitPolicy(HTTPPolicy):
+        """
+        Per-call policy, holds a slot and a token of the endpoint limiter for the whole call.
+        """
+
+        def __init__(self, limiter: RateLimiter):
+            super().__init__()
+            self.limiter = limiter
+
+        def send(self, request: Any) -> Any:
+            self.limiter.acquire()
+            succeeded = False
+            try:
+                response = self.next.send(request)
+                succeeded = response.http_response.status_code != 429
+                if not succeeded:
+                    # Retries ran out, still let the other callers know
+                    self.limiter.on_throttled(_retry_after(response))
+                return response
+            finally:
+                self.limiter.release(succeeded)
+
+    class AsyncRateLimitPolicy(AsyncHTTPPolicy):
+        def __init__(self, limiter: RateLimiter):
+            super().__init__()
+            self.limiter = limiter
+
+        async def send(self, request: Any) -> Any:
+            await self.limiter.async_acquire()
+            succeeded = False
+            try:
+                response = await self.next.send(request)
+                succeeded = response.http_response.status_code != 429
+                if not succeeded:
+                    # Retries ran out, still let the other callers know
+                    self.limiter.on_throttled(_retry_after(response))
+                return response
+            finally:
+                self.limiter.release(succeeded)
+
+    class RateLimitRetryPolicy(RetryPolicy):
+        """
+        Retries a 429 after the shared pause and with a fresh token, instead of on the client's own timer.
+        """
+
+        def __init__(self, limiter: RateLimiter, **kwargs: Any):
+            super().__init__(**kwargs)
+            self.limiter = limiter
+
+        def sleep(self, settings: Dict[str, Any], transport: Any, response: Any = None) -> None:
+            if response is not None and response.http_response.status_code == 429:
+                self.limiter.on_throttled(_retry_after(response))
+                self.limiter.wait_token()
+                return
+            super().sleep(settings, transport, response)
+
+    class AsyncRateLimitRetryPolicy(AsyncRetryPolicy):
+        def __init__(self, limiter: RateLimiter, **kwargs: Any):
+            super().__init__(**kwargs)
+            self.limiter = limiter
+
+        async def sleep(self, settings: Dict[str, Any], transport: Any, response: Any = None) -> None:
+            if response is not None and response.http_response.status_code == 429:
+                self.limiter.on_throttled(_retry_after(response))
+                await self.limiter.async_wait_token()
+                return
+            await super().sleep(settings, transport, response)
+
+    _policy_classes = {
+        "policy": RateLimitPolicy,
+        "async_policy": AsyncRateLimitPolicy,
+        "retry": RateLimitRetryPolicy,
+        "async_retry": AsyncRateLimitRetryPolicy,
+    }
+    return _policy_classes
+
+
+_policy_classes: Dict[str, type] = {}
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+_settings: Dict[str, Any] = {}
+
+
+def _endpoint_key(endpoint: str) -> str:
+    return endpoint.rstrip("/").lower()
+
+
+def get_limiter(endpoint: str) -> RateLimiter:
+    """
+    The limiter of an endpoint, None when install() has not been called.
+    """
+    if not _settings:
+        return None
+    key = _endpoint_key(endpoint)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            state_path = None
+            if _settings["state_dir"]:
+                name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+                state_path = os.path.join(_settings["state_dir"], f"ai-rate-limit-{name}")
+            limiter = _limiters[key] = RateLimiter(
+                _settings["rate"], _settings["burst"], _settings["max_concurrency"], state_path
+            )
+        return limiter
+
+
+def install(
+    rate: float,
+    burst: float = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    state_dir: str = None,
+    client_registry: Any = None,
+) -> None:
+    """
+    Rate limit every client the registry creates from now on, one limiter per endpoint.
+    Calling it again only changes the settings of limiters created afterwards.
+    :param rate: requests per second allowed on each endpoint
+    :param burst: tokens the bucket holds, one second worth of requests by default
+    :param max_concurrency: upper bound of the AIMD concurrency limit
+    :param state_dir: directory of the state files shared between processes, e.g. /dev/shm
+    """
+    if client_registry is None:
+        from ai_clients import registry as client_registry
+
+    with _limiters_lock:
+        first = not _settings
+        _settings.update(rate=rate, burst=burst, max_concurrency=max_concurrency, state_dir=state_dir)
+    if not first:
+        return
+
+    def policies(service: str, endpoint: str, is_async: bool) -> List[Any]:
+        return [_policies()["async_policy" if is_async else "policy"](get_limiter(endpoint))]
+
+    def retry_policy(service: str, endpoint: str, is_async: bool) -> Any:
+        return _policies()["async_retry" if is_async else "retry"](get_limiter(endpoint))
+
+    client_registry.add_policies(policies)
+    client_registry.set_retry_policy(retry_policy)
+
+
+def install_from_env(client_registry: Any = None) -> bool:
+    """
+    install() with the settings in AI_RATE_LIMIT and AI_RATE_LIMIT_DIR.
+    :return: True when the limiter was installed
+    """
+    rate = os.environ.get("AI_RATE_LIMIT")
+    if not rate:
+        return False
+    install(float(rate), state_dir=os.environ.get("AI_RATE_LIMIT_DIR"), client_registry=client_registry)
+    return True
+
+
+def limited(function: Callable, *args: Any, endpoint: str = None, **kwargs: Any) -> Any:
+    """
+    Call an msrest client method (custom vision, face) under the endpoint limiter, retrying 429 responses.
+    Calls the function directly when the limiter is not installed.
+    :param endpoint: the endpoint of the client, AZURE_AI_SERVICES_URL by default
+    """
+    limiter = get_limiter(endpoint or os.environ.get("AZURE_AI_SERVICES_URL", "")) if _settings else None
+    if limiter is None:
+        return function(*args, **kwargs)
+    from ai_lro import parse_retry_after
+
+    # Streams passed as arguments are rewound before a retry
+    streams = [(value, value.tell()) for value in (*args, *kwargs.values())
+               if hasattr(value, "seek") and hasattr(value, "tell") and getattr(value, "seekable", lambda: True)()]
+    for attempt in range(MSREST_RETRIES + 1):
+        if attempt:
+            for stream, position in streams:
+                stream.seek(position)
+        limiter.acquire()
+        succeeded = False
+        try:
+            result = function(*args, **kwargs)
+            succeeded = True
+            return result
+        except Exception as error:
+            response = getattr(error, "response", None)
+            if getattr(response, "status_code", None) != 429 or attempt == MSREST_RETRIES:
+                raise
+            limiter.on_throttled(parse_retry_after(getattr(response, "headers", None)))
+        finally:
+            limiter.release(succeeded)
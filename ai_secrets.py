@@ -0,0 +1,223 @@
+"""
+USAGE:
+    python ai_secrets.py
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_KEYVAULT_URL - the URL of your Key Vault.
+    2) AZURE_CLIENT_ID, AZURE_TENANT_ID, AZURE_CLIENT_SECRET - or any other DefaultAzureCredential source.
+    3) AI_SECRET_CACHE_PATH - optional, file used to persist the cache between runs.
+    4) AI_SECRET_CACHE_KEY - required with AI_SECRET_CACHE_PATH, a Fernet key used to encrypt that file.
+       Create one with: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+    5) AI_SECRET_CACHE_TTL - optional, seconds a secret is kept before it is fetched again (default: 3600).
+
+    Keeps Key Vault secrets in memory so building a client does not cost a Key Vault round-trip.
+    A background thread fetches each secret again before its TTL runs out, and the AzureKeyCredential
+    handed out for a secret is updated in place, so a rotated key reaches every client without a restart.
+
+    pip install azure-keyvault-secrets azure-identity cryptography
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+
+# Fraction of the TTL after which the background thread fetches a secret again
+REFRESH_AHEAD = 0.8
+
+# Wait this long before retrying a failed background refresh
+RETRY_DELAY = 30
+
+
+class _Entry:
+    __slots__ = ("value", "fetched", "credential")
+
+    def __init__(self, value: str, fetched: float):
+        self.value = value
+        self.fetched = fetched
+        self.credential = None
+
+
+class SecretCache:
+    """
+    In-process cache of Key Vault secrets with TTL, background refresh and optional encrypted persistence.
+    """
+
+    def __init__(
+        self,
+        secret_client: Any,
+        ttl: float = DEFAULT_TTL,
+        refresh_ahead: float = REFRESH_AHEAD,
+        persist_path: str = None,
+        persist_key: bytes = None,
+    ):
+        if persist_path and not persist_key:
+            raise ValueError("persist_key is required to encrypt the secrets written to persist_path")
+        self.secret_client = secret_client
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.persist_path = persist_path
+        self.persist_key = persist_key
+        self._entries: Dict[str, _Entry] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        if persist_path:
+            self._load()
+
+    def get(self, name: str) -> str:
+        """
+        Return the secret value, fetching it from Key Vault only when it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and time.time() - entry.fetched < self.ttl:
+                return entry.value
+        return self.refresh(name).value
+
+    def key_credential(self, name: str) -> Any:
+        """
+        An AzureKeyCredential for the secret that is updated in place whenever the secret changes.
+        """
+        from azure.core.credentials import AzureKeyCredential
+
+        value = self.get(name)
+        with self._lock:
+            entry = self._entries[name]
+            if entry.credential is None:
+                entry.credential = AzureKeyCredential(value)
+            return entry.credential
+
+    def refresh(self, name: str) -> _Entry:
+        """
+        Fetch the secret from Key Vault now and push a changed value into its credential.
+        """
+        value = self.secret_client.get_secret(name).value
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._entries[name] = _Entry(value, time.time())
+            else:
+                if entry.value != value and entry.credential is not None:
+                    entry.credential.update(value)
+                entry.value = value
+                entry.fetched = time.time()
+            self._retry_at.pop(name, None)
+            if self.persist_path:
+                self._save()
+        self._wake.set()
+        return entry
+
+    def start(self) -> "SecretCache":
+        """
+        Start the background refresh thread.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="secret-cache-refresh", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _next_refresh(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                name: self._retry_at.get(name, entry.fetched + self.ttl * self.refresh_ahead)
+                for name, entry in self._entries.items()
+            }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            now = time.time()
+            due = self._next_refresh()
+            for name, refresh_at in due.items():
+                if refresh_at > now:
+                    continue
+                try:
+                    self.refresh(name)
+                except Exception:
+                    # Keep serving the current value, it is still valid until the TTL runs out
+                    logger.exception("Refreshing secret '%s' failed", name)
+                    with self._lock:
+                        self._retry_at[name] = time.time() + RETRY_DELAY
+            due = self._next_refresh()
+            timeout = max(0.0, min(due.values()) - time.time()) if due else None
+            self._wake.wait(timeout)
+
+    def _fernet(self) -> Any:
+        from cryptography.fernet import Fernet
+        return Fernet(self.persist_key)
+
+    def _save(self) -> None:
+        data = {name: {"value": entry.value, "fetched": entry.fetched} for name, entry in self._entries.items()}
+        token = self._fernet().encrypt(json.dumps(data).encode("utf-8"))
+        temp_path = f"{self.persist_path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(token)
+        os.replace(temp_path, self.persist_path)
+
+    def _load(self) -> None:
+        from cryptography.fernet import InvalidToken
+
+        if not os.path.exists(self.persist_path):
+            return
+        with open(self.persist_path, "rb") as file:
+            token = file.read()
+        try:
+            data = json.loads(self._fernet().decrypt(token))
+        except InvalidToken:
+            logger.warning("Ignoring secret cache %s, it was encrypted with another key", self.persist_path)
+            return
+        for name, item in data.items():
+            self._entries[name] = _Entry(item["value"], item["fetched"])
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_secret_cache() -> SecretCache:
+    """
+    The started, shared cache for the vault in AZURE_KEYVAULT_URL.
+    :return: SecretCache
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            from azure.keyvault.secrets import SecretClient
+            from dotenv import load_dotenv
+            from ai_clients import registry
+            load_dotenv()
+
+            persist_key = os.environ.get("AI_SECRET_CACHE_KEY")
+            _default_cache = SecretCache(
+                SecretClient(vault_url=os.environ["AZURE_KEYVAULT_URL"], credential=registry.aad_credential()),
+                ttl=float(os.environ.get("AI_SECRET_CACHE_TTL", DEFAULT_TTL)),
+                persist_path=os.environ.get("AI_SECRET_CACHE_PATH"),
+                persist_key=persist_key.encode("utf-8") if persist_key else None,
+            ).start()
+        return _default_cache
+
+
+if __name__ == "__main__":
+    cache = get_secret_cache()
+    started = time.perf_counter()
+    cache.get("ai-services-key")
+    print(f"First lookup took {(time.perf_counter() - started) * 1000:.1f} ms")
+    started = time.perf_counter()
+    cache.get("ai-services-key")
+    print(f"Cached lookup took {(time.perf_counter() - started) * 1000:.3f} ms")
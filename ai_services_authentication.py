@@ -19,15 +19,14 @@ def authentication_with_api_key() -> None:
     """
     print("\n -- authentication_with_api_key")
     import os
-    from azure.core.credentials import AzureKeyCredential
-    from azure.ai.textanalytics import TextAnalyticsClient
     from dotenv import load_dotenv
+    from ai_clients import registry
     load_dotenv()
 
     endpoint = os.environ["AZURE_AI_SERVICES_URL"]
     key = os.environ["AZURE_AI_SERVICES_KEY"]
 
-    text_analytics_client = TextAnalyticsClient(endpoint, AzureKeyCredential(key))
+    text_analytics_client = registry.text_analytics(endpoint, registry.key_credential(key))
 
     # English text
     doc = [
@@ -51,15 +50,15 @@ def authentication_with_azure_active_directory() -> None:
     """
     print("\n -- authentication_with_azure_active_directory")
     import os
-    from azure.ai.textanalytics import TextAnalyticsClient
-    from azure.identity import DefaultAzureCredential
     from dotenv import load_dotenv
+    from ai_clients import registry
     load_dotenv()
 
     endpoint = os.environ["AZURE_AI_SERVICES_URL"]
-    credential = DefaultAzureCredential()
+    # Shared DefaultAzureCredential, tokens are cached and refreshed ahead of expiry
+    credential = registry.aad_credential()
 
-    text_analytics_client = TextAnalyticsClient(endpoint, credential=credential)
+    text_analytics_client = registry.text_analytics(endpoint, credential=credential)
 
     # Spanish text
     doc = [
@@ -79,24 +78,19 @@ def authentication_with_azure_active_directory() -> None:
 def authentication_with_api_key_from_vault() -> None:
     print("\n -- authentication_with_api_key_from_vault")
     import os
-    from azure.identity import DefaultAzureCredential
-    from azure.core.credentials import AzureKeyCredential
-    from azure.ai.textanalytics import TextAnalyticsClient
-    from azure.keyvault.secrets import SecretClient
     from dotenv import load_dotenv
+    from ai_clients import registry
+    from ai_secrets import get_secret_cache
     load_dotenv()
 
-    key_vault_url = os.environ["AZURE_KEYVAULT_URL"]
     ai_services_url = os.environ["AZURE_AI_SERVICES_URL"]
 
-    credential = DefaultAzureCredential()
-    client = SecretClient(vault_url=key_vault_url, credential=credential)
-
+    # The secret is cached in process and refreshed in the background,
+    # a rotated key is pushed into this same credential object
     secret_name = "ai-services-key"
-    secret = client.get_secret(secret_name)
-    key = secret.value
+    credential = get_secret_cache().key_credential(secret_name)
 
-    text_analytics_client = TextAnalyticsClient(ai_services_url, AzureKeyCredential(key))
+    text_analytics_client = registry.text_analytics(ai_services_url, credential)
 
     # Japanese text
     doc = [
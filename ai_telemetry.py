@@ -0,0 +1,464 @@
+"""
+USAGE:
+    import ai_telemetry
+    ai_telemetry.install()                  # before the first client is created
+    ai_telemetry.serve(9464)                # optional, Prometheus text at /metrics, JSON at /metrics.json
+
+    ... run any sample ...
+    print(ai_telemetry.metrics.prometheus())
+
+    Set the environment variables to turn telemetry on with install_from_env():
+    1) AI_TELEMETRY - set to 1 to record metrics for every client of the registry.
+    2) AI_TELEMETRY_PORT - optional, port of the metrics endpoint.
+    3) AI_PROFILE_SAMPLE_RATE - optional, fraction of result processing blocks run under cProfile (default: 0).
+
+    A per-call pipeline policy records, for each service and operation, a latency histogram with
+    p50/p95/p99, request and response bytes, retries and throttled (429) responses. When the service
+    reports its own processing time the remainder is recorded as network and client overhead, which
+    covers DNS, TLS, upload and download. The LRO scheduler reports time spent waiting between polls.
+    The msrest clients (custom vision, face) are recorded from a requests response hook instead:
+    their latency ends when the response headers arrive, and calls that get no response at all
+    (connection errors, timeouts) are not recorded.
+    Result processing in the samples runs inside profiled(), which profiles a sampled fraction of runs.
+"""
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+# Histogram bucket upper bounds in seconds, about 25% apart from 1 ms to 2 minutes
+BUCKETS = tuple(round(0.001 * 1.25 ** i, 6) for i in range(53))
+
+# Response headers in which the services report their processing time, in milliseconds
+SERVICE_TIME_HEADERS = ("x-envoy-upstream-service-time", "x-ms-processing-time")
+
+_ID_SEGMENT = re.compile(r"^(?:[0-9a-fA-F-]{16,}|\d+)$")
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram, percentiles are interpolated inside the bucket.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        low, high = 0, len(self.buckets)
+        while low < high:
+            middle = (low + high) // 2
+            if self.buckets[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        self.counts[low] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class _Series:
+    __slots__ = ("latency", "overhead", "requests", "errors", "retries", "throttled", "request_bytes", "response_bytes")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.overhead = Histogram()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class Metrics:
+    """
+    Thread-safe store of the per-operation series, the poll waits and the profiles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._poll_wait: Dict[str, Histogram] = {}
+        self.profiles: Dict[str, Any] = {}
+
+    def record(
+        self,
+        service: str,
+        operation: str,
+        seconds: float,
+        status: int = None,
+        request_bytes: int = 0,
+        response_bytes: int = 0,
+        retries: int = 0,
+        throttled: int = 0,
+        service_seconds: float = None,
+    ) -> None:
+        with self._lock:
+            series = self._series.get((service, operation))
+            if series is None:
+                series = self._series[(service, operation)] = _Series()
+            series.latency.observe(seconds)
+            # With retries the call also spans the failed attempts and the backoff between them
+            if service_seconds is not None and not retries:
+                series.overhead.observe(max(0.0, seconds - service_seconds))
+            series.requests += 1
+            series.errors += status is None or status >= 400
+            series.retries += retries
+            series.throttled += throttled
+            series.request_bytes += request_bytes
+            series.response_bytes += response_bytes
+
+    def record_poll_wait(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._poll_wait.get(kind)
+            if histogram is None:
+                histogram = self._poll_wait[kind] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Every series as plain data, with latency percentiles in seconds.
+        """
+        with self._lock:
+            operations = [
+                {
+                    "service": service,
+                    "operation": operation,
+                    "latency": series.latency.summary(),
+                    "network_overhead": series.overhead.summary(),
+                    "requests": series.requests,
+                    "errors": series.errors,
+                    "retries": series.retries,
+                    "throttled": series.throttled,
+                    "request_bytes": series.request_bytes,
+                    "response_bytes": series.response_bytes,
+                }
+                for (service, operation), series in sorted(self._series.items())
+            ]
+            poll_wait = {kind: histogram.summary() for kind, histogram in sorted(self._poll_wait.items())}
+        return {"operations": operations, "poll_wait": poll_wait}
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def prometheus(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        def labels(**values: str) -> str:
+            return ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                            for name, value in values.items())
+
+        def histogram_lines(name: str, label: str, histogram: Histogram) -> List[str]:
+            lines = []
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{label}}} {histogram.total}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+            return lines
+
+        counters = ("requests", "errors", "retries", "throttled", "request_bytes", "response_bytes")
+        output = ["# TYPE ai_request_seconds histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            for (service, operation), series in items:
+                output.extend(histogram_lines("ai_request_seconds", labels(service=service, operation=operation), series.latency))
+            output.append("# TYPE ai_network_overhead_seconds histogram")
+            for (service, operation), series in items:
+                if series.overhead.count:
+                    output.extend(histogram_lines(
+                        "ai_network_overhead_seconds", labels(service=service, operation=operation), series.overhead
+                    ))
+            for counter in counters:
+                output.append(f"# TYPE ai_{counter}_total counter")
+                for (service, operation), series in items:
+                    output.append(f"ai_{counter}_total{{{labels(service=service, operation=operation)}}} {getattr(series, counter)}")
+            output.append("# TYPE ai_poll_wait_seconds histogram")
+            for kind, histogram in sorted(self._poll_wait.items()):
+                output.extend(histogram_lines("ai_poll_wait_seconds", labels(kind=kind), histogram))
+        return "\n".join(output) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+            self._poll_wait.clear()
+            self.profiles.clear()
+
+
+metrics = Metrics()
+
+
+def operation_name(method: str, url: str) -> str:
+    """
+    Method and URL path with ids replaced, so every call of an operation lands in the same series.
+    """
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    segments = path.split("/")[1:]
+    return f"{method} /" + "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in segments)
+
+
+def _request_bytes(http_request: Any) -> int:
+    body = http_request.body
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    length = http_request.headers.get("Content-Length")
+    return int(length) if length else 0
+
+
+def _response_bytes(http_response: Any) -> int:
+    length = http_response.headers.get("Content-Length")
+    if length:
+        return int(length)
+    try:
+        return len(http_response.body())
+    except Exception:
+        # Streamed bodies that have not been read are not counted
+        return 0
+
+
+def _service_seconds(headers: Any) -> float:
+    for header in SERVICE_TIME_HEADERS:
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) / 1000.0
+            except ValueError:
+                return None
+    return None
+
+
+def _record(service: str, request: Any, response: Any, seconds: float) -> None:
+    http_request = request.http_request
+    status = throttled = retries = 0
+    response_bytes, service_seconds = 0, None
+    if response is not None:
+        http_response = response.http_response
+        status = http_response.status_code
+        history = response.context.get("history") or []
+        retries = len(history)
+        throttled = sum(1 for attempt in history if getattr(attempt.http_response, "status_code", None) == 429)
+        throttled += status == 429
+        response_bytes = _response_bytes(http_response)
+        service_seconds = _service_seconds(http_response.headers)
+    metrics.record(
+        service, operation_name(http_request.method, http_request.url), seconds,
+        status=status or None, request_bytes=_request_bytes(http_request), response_bytes=response_bytes,
+        retries=retries, throttled=throttled, service_seconds=service_seconds,
+    )
+
+
+def _record_msrest(service: str, response: Any, *args: Any, **kwargs: Any) -> None:
+    """
+    requests response hook of the msrest clients, response is a requests.Response.
+    """
+    request = response.request
+    # Attempts retried by urllib3 inside the requests adapter
+    history = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+    length = response.headers.get("Content-Length")
+    metrics.record(
+        service, operation_name(request.method, request.url), response.elapsed.total_seconds(),
+        status=response.status_code, request_bytes=_request_bytes(request),
+        # The body is read by msrest after the hook, only a declared length is counted
+        response_bytes=int(length) if length else 0,
+        retries=len(history),
+        throttled=sum(1 for attempt in history if attempt.status == 429) + (response.status_code == 429),
+        service_seconds=_service_seconds(response.headers),
+    )
+
+
+def _policies() -> Dict[str, type]:
+    """
+    Pipeline policy classes, defined on first use so importing this module does not import azure-core.
+    """
+    global _policy_classes
+    if _policy_classes:
+        return _policy_classes
+    from azure.core.pipeline.policies import AsyncHTTPPolicy, HTTPPolicy
+
+    class TelemetryPolicy(HTTPPolicy):
+        """
+        Per-call policy, times the whole call including the retries made by the RetryPolicy after it.
+        """
+
+        def __init__(self, service: str):
+            super().__init__()
+            self.service = service
+
+        def send(self, request: Any) -> Any:
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.next.send(request)
+                return response
+            finally:
+                _record(self.service, request, response, time.perf_counter() - started)
+
+    class AsyncTelemetryPolicy(AsyncHTTPPolicy):
+        def __init__(self, service: str):
+            super().__init__()
+            self.service = service
+
+        async def send(self, request: Any) -> Any:
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await self.next.send(request)
+                return response
+            finally:
+                _record(self.service, request, response, time.perf_counter() - started)
+
+    _policy_classes = {"policy": TelemetryPolicy, "async_policy": AsyncTelemetryPolicy}
+    return _policy_classes
+
+
+_policy_classes: Dict[str, type] = {}
+_installed = []
+
+
+def install(client_registry: Any = None) -> None:
+    """
+    Record metrics for every client the registry creates from now on,
+    and the time LRO schedulers wait between polls.
+    """
+    from ai_lro import add_wait_hook
+
+    add_wait_hook(metrics.record_poll_wait)
+    if client_registry is None:
+        from ai_clients import registry as client_registry
+    if client_registry in _installed:
+        return
+    _installed.append(client_registry)
+
+    def policies(service: str, endpoint: str, is_async: bool) -> List[Any]:
+        return [_policies()["async_policy" if is_async else "policy"](service)]
+
+    client_registry.add_policies(policies)
+    client_registry.add_msrest_hooks(lambda service, endpoint: [functools.partial(_record_msrest, service)])
+
+
+def install_from_env(client_registry: Any = None) -> bool:
+    """
+    install() and serve() as set in AI_TELEMETRY and AI_TELEMETRY_PORT.
+    :return: True when telemetry was installed
+    """
+    if os.environ.get("AI_TELEMETRY", "").lower() not in ("1", "true", "yes"):
+        return False
+    install(client_registry)
+    port = os.environ.get("AI_TELEMETRY_PORT")
+    if port:
+        serve(int(port))
+    return True
+
+
+def serve(port: int = 9464, host: str = "127.0.0.1") -> Any:
+    """
+    Serve /metrics in the Prometheus text format and /metrics.json from a daemon thread.
+    :return: the HTTPServer, call shutdown() to stop it
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/metrics":
+                body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = metrics.to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="ai-telemetry", daemon=True).start()
+    return server
+
+
+class profiled:
+    """
+    Context manager that runs a sampled fraction of the blocks it wraps under cProfile,
+    and accumulates the statistics per name in metrics.profiles.
+    """
+
+    _active = threading.local()
+
+    def __init__(self, name: str, sample_rate: float = None):
+        self.name = name
+        if sample_rate is None:
+            sample_rate = float(os.environ.get("AI_PROFILE_SAMPLE_RATE") or 0)
+        self.sample_rate = sample_rate
+        self._profile = None
+
+    def __enter__(self) -> "profiled":
+        # Only one profiler can run per thread, nested blocks are part of the outer profile
+        if self.sample_rate and not getattr(self._active, "on", False) and random.random() < self.sample_rate:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._active.on = True
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self._profile is None:
+            return
+        self._profile.disable()
+        self._active.on = False
+        import pstats
+        with metrics._lock:
+            stats = metrics.profiles.get(self.name)
+            if stats is None:
+                metrics.profiles[self.name] = pstats.Stats(self._profile)
+            else:
+                stats.add(self._profile)
+
+
+def profile_report(name: str, limit: int = 20) -> None:
+    """
+    Print the functions with the most cumulative time in the sampled profiles of a block.
+    """
+    stats = metrics.profiles.get(name)
+    if stats is None:
+        print(f"No profile sampled for '{name}'")
+        return
+    stats.sort_stats("cumulative").print_stats(limit)
@@ -0,0 +1,422 @@
+"""
+USAGE:
+    python ai_text_aggregate.py
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Corpus level aggregates of text analytics results in fixed memory: entity frequency by category,
+    the heaviest entities and entity pairs, the sentiment distribution per source, languages and
+    key phrases. Results are folded in one document at a time and dropped, so the results of tens
+    of millions of documents never have to be held at once.
+
+    Exact counts are kept only for small key spaces (categories, sentiment labels, sources,
+    languages). Entities, entity pairs and key phrases go into a count-min sketch, which estimates
+    the count of any key within a known error, and a SpaceSaving summary of the heaviest keys.
+    Both have a fixed size, are built from a hash that is stable across processes, and add up,
+    so aggregates built by parallel workers merge into the aggregate of the whole corpus.
+
+    pip install azure-ai-textanalytics aiohttp numpy
+"""
+import asyncio
+import hashlib
+import heapq
+import pickle
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# 4 rows of 2**18 uint32 counters, 4 MB, overestimates by at most ~1e-5 of the total with 98% probability
+SKETCH_WIDTH = 2 ** 18
+SKETCH_DEPTH = 4
+
+TOP_K = 1000
+
+# Entities of one document taken into the co-occurrence counts, the pairs grow quadratically
+MAX_PAIR_ENTITIES = 32
+
+SENTIMENTS = ("positive", "neutral", "negative", "mixed")
+
+# Separates the parts of composite keys, e.g. category and entity text
+SEPARATOR = "\x1f"
+
+
+def stable_hash(key: str) -> int:
+    """
+    64 bit hash that is the same in every process, unlike hash() of a str.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class CountMinSketch:
+    """
+    Fixed size frequency estimates for any number of distinct keys, never below the true count.
+    """
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        import numpy as np
+
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+
+    def _columns(self, keys: Sequence[str]) -> Any:
+        import numpy as np
+
+        hashes = np.fromiter((stable_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        # Double hashing, one column per row from two 32 bit halves
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((low[None, :] + rows * high[None, :]) % np.uint64(self.width)).astype(np.intp)
+
+    def add_many(self, keys: Sequence[str], counts: Sequence[int] = None) -> None:
+        import numpy as np
+
+        if not keys:
+            return
+        counts = np.ones(len(keys), dtype=np.uint32) if counts is None else np.asarray(counts, dtype=np.uint32)
+        columns = self._columns(keys)
+        rows = np.broadcast_to(np.arange(self.depth)[:, None], columns.shape)
+        np.add.at(self.table, (rows, columns), counts[None, :])
+        self.total += int(counts.sum())
+
+    def add(self, key: str, count: int = 1) -> None:
+        self.add_many([key], [count])
+
+    def estimate_many(self, keys: Sequence[str]) -> List[int]:
+        import numpy as np
+
+        if not keys:
+            return []
+        columns = self._columns(keys)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0).tolist()
+
+    def estimate(self, key: str) -> int:
+        return self.estimate_many([key])[0]
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Only sketches of the same width and depth can be merged")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+
+class SpaceSaving:
+    """
+    The heaviest keys of a stream with at most capacity counters (Metwally et al.).
+    Every key counted more than total / capacity times is kept, and a count overestimates
+    the true count by at most the error recorded with it.
+    """
+
+    def __init__(self, capacity: int = TOP_K):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # One entry per key, an entry whose count is below the current count is refreshed when popped
+        self._heap: List[Tuple[int, str]] = []
+
+    def _minimum(self) -> Tuple[int, str]:
+        while True:
+            count, key = self._heap[0]
+            current = self.counts[key]
+            if current == count:
+                return count, key
+            heapq.heapreplace(self._heap, (current, key))
+
+    def add(self, key: str, count: int = 1) -> None:
+        if key in self.counts:
+            self.counts[key] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (count, key))
+            return
+        # Replace the smallest counter, the new key may have been counted up to its value before
+        minimum, evicted = self._minimum()
+        del self.counts[evicted], self.errors[evicted]
+        self.counts[key] = minimum + count
+        self.errors[key] = minimum
+        heapq.heapreplace(self._heap, (minimum + count, key))
+
+    def top(self, n: int = 10) -> List[Tuple[str, int, int]]:
+        """
+        :return: [(key, count, error)] heaviest first
+        """
+        return [(key, count, self.errors[key]) for key, count in heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])]
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """
+        Combine two summaries (Agarwal et al., mergeable summaries). A key missing from a full
+        summary may have been counted up to that summary's smallest count, which goes to its error.
+        """
+        own_floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        other_floor = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        counts, errors = {}, {}
+        for key in self.counts.keys() | other.counts.keys():
+            counts[key] = self.counts.get(key, own_floor) + other.counts.get(key, other_floor)
+            errors[key] = self.errors.get(key, own_floor) + other.errors.get(key, other_floor)
+        kept = heapq.nlargest(self.capacity, counts.items(), key=lambda item: item[1])
+        self.counts = dict(kept)
+        self.errors = {key: errors[key] for key in self.counts}
+        self._heap = [(count, key) for key, count in kept]
+        heapq.heapify(self._heap)
+        return self
+
+
+class TextAggregate:
+    """
+    Mergeable corpus aggregate of text analytics results.
+    """
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, top_k: int = TOP_K):
+        self.documents = 0
+        self.errors = 0
+        self.categories: Counter = Counter()
+        self.languages: Counter = Counter()
+        self.sentiment: Dict[str, Counter] = {}
+        self.entity_sketch = CountMinSketch(width, depth)
+        self.pair_sketch = CountMinSketch(width, depth)
+        self.top_entities = SpaceSaving(top_k)
+        self.top_pairs = SpaceSaving(top_k)
+        self.top_phrases = SpaceSaving(top_k)
+
+    def add(self, result: Any, source: str = "") -> None:
+        """
+        Fold the result of one document into the aggregate.
+        :param result: a document result of any text analytics call, the list of action results of one
+            document from begin_analyze_actions, or a BatchResult from ai_text_batch
+        :param source: where the document came from, the key of the sentiment distribution
+        """
+        result = getattr(result, "result", result)
+        action_results = result if isinstance(result, list) else [result]
+        if all(getattr(action, "is_error", False) for action in action_results):
+            self.errors += 1
+            return
+        self.documents += 1
+
+        entities = {}
+        for action in action_results:
+            if getattr(action, "is_error", False):
+                continue
+            for entity in getattr(action, "entities", None) or []:
+                # Linked entities have a name and no category
+                category = getattr(entity, "category", None) or getattr(entity, "data_source", None) or "Linked"
+                text = getattr(entity, "normalized_text", None) or getattr(entity, "text", None) or entity.name
+                entities.setdefault(f"{category}{SEPARATOR}{normalize(text)}", category)
+            sentiment = getattr(action, "sentiment", None)
+            if sentiment is not None:
+                self.sentiment.setdefault(source, Counter())[sentiment] += 1
+            language = getattr(action, "primary_language", None)
+            if language is not None:
+                self.languages[language.iso6391_name] += 1
+            phrases = getattr(action, "key_phrases", None)
+            for phrase in phrases or []:
+                self.top_phrases.add(normalize(phrase))
+
+        # An entity counts once per document, however often it is mentioned
+        keys = list(entities)
+        self.categories.update(entities.values())
+        self.entity_sketch.add_many(keys)
+        for key in keys:
+            self.top_entities.add(key)
+        paired = sorted(keys[:MAX_PAIR_ENTITIES])
+        pairs = [f"{first}{SEPARATOR * 2}{second}" for index, first in enumerate(paired) for second in paired[index + 1:]]
+        self.pair_sketch.add_many(pairs)
+        for pair in pairs:
+            self.top_pairs.add(pair)
+
+    def consume(self, results: Iterable[Any], source: str = "") -> "TextAggregate":
+        """
+        Fold a stream of document results, e.g. poller.result() or ai_text_batch.analyze_documents().
+        """
+        for result in results:
+            self.add(result, source)
+        return self
+
+    async def consume_async(self, results: Any, source: str = "") -> "TextAggregate":
+        """
+        Fold an async stream of document results, e.g. the AsyncItemPaged of an async poller.
+        """
+        async for result in results:
+            self.add(result, source)
+        return self
+
+    def merge(self, other: "TextAggregate") -> "TextAggregate":
+        """
+        Add the aggregate of another part of the corpus to this one.
+        """
+        self.documents += other.documents
+        self.errors += other.errors
+        self.categories.update(other.categories)
+        self.languages.update(other.languages)
+        for source, counts in other.sentiment.items():
+            self.sentiment.setdefault(source, Counter()).update(counts)
+        self.entity_sketch.merge(other.entity_sketch)
+        self.pair_sketch.merge(other.pair_sketch)
+        self.top_entities.merge(other.top_entities)
+        self.top_pairs.merge(other.top_pairs)
+        self.top_phrases.merge(other.top_phrases)
+        return self
+
+    def entity_count(self, text: str, category: str) -> int:
+        """
+        Estimated number of documents that mention an entity, never below the true number.
+        """
+        return self.entity_sketch.estimate(f"{category}{SEPARATOR}{normalize(text)}")
+
+    def pair_count(self, first: Tuple[str, str], second: Tuple[str, str]) -> int:
+        """
+        Estimated number of documents that mention two entities, each given as (text, category).
+        """
+        first_key, second_key = sorted(f"{category}{SEPARATOR}{normalize(text)}" for text, category in (first, second))
+        return self.pair_sketch.estimate(f"{first_key}{SEPARATOR * 2}{second_key}")
+
+    def entities(self, n: int = 10, category: str = None) -> List[Tuple[str, str, int]]:
+        """
+        :return: [(category, text, documents)] of the most frequent entities
+        """
+        found = []
+        for key, count, _ in self.top_entities.top(len(self.top_entities.counts)):
+            entity_category, text = key.split(SEPARATOR, 1)
+            if category is None or entity_category == category:
+                found.append((entity_category, text, count))
+                if len(found) == n:
+                    break
+        return found
+
+    def pairs(self, n: int = 10) -> List[Tuple[str, str, int]]:
+        """
+        :return: [(first entity, second entity, documents)] of the most frequent co-occurrences
+        """
+        return [(*key.split(SEPARATOR * 2), count) for key, count, _ in self.top_pairs.top(n)]
+
+    def sentiment_distribution(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: {source: {label: fraction of its documents}}
+        """
+        distribution = {}
+        for source, counts in self.sentiment.items():
+            total = sum(counts.values())
+            distribution[source] = {label: counts[label] / total for label in SENTIMENTS}
+        return distribution
+
+    @property
+    def nbytes(self) -> int:
+        return self.entity_sketch.nbytes + self.pair_sketch.nbytes
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str) -> "TextAggregate":
+        """
+        Read an aggregate written by save(). Only load files you wrote, pickle runs code on load.
+        """
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+async def aggregate_documents(
+    documents: Iterable[Tuple[str, str]],
+    chunk_size: int = 25,
+    max_in_flight: int = 20,
+    client: Any = None,
+    aggregate: TextAggregate = None,
+) -> TextAggregate:
+    """
+    Recognize entities and analyze sentiment with begin_analyze_actions and aggregate the results as jobs finish.
+    Only the documents of the jobs in flight are held in memory.
+    :param documents: iterable of (source, text), consumed lazily
+    :param chunk_size: documents per job, 25 at most for analyze actions
+    :return: the aggregate
+    """
+    from azure.ai.textanalytics import AnalyzeSentimentAction, RecognizeEntitiesAction
+    from ai_clients import registry
+    from ai_lro import LROScheduler
+
+    client = client or registry.text_analytics(is_async=True)
+    aggregate = aggregate or TextAggregate()
+
+    def jobs() -> Iterable[Tuple[List[str], str, Any]]:
+        chunk: List[Tuple[str, str]] = []
+        for document in documents:
+            chunk.append(document)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def scheduled() -> Iterable[Tuple[List[str], str, Any]]:
+        for chunk in jobs():
+            texts = [text for _, text in chunk]
+            yield [source for source, _ in chunk], "actions", lambda texts=texts: client.begin_analyze_actions(
+                texts, actions=[RecognizeEntitiesAction(), AnalyzeSentimentAction()]
+            )
+
+    async for job in LROScheduler(max_in_flight=max_in_flight).as_completed(scheduled()):
+        if job.error is not None:
+            aggregate.errors += len(job.key)
+            continue
+        sources = iter(job.key)
+        async for action_results in job.result:
+            aggregate.add(action_results, next(sources))
+    return aggregate
+
+
+async def aggregate_reviews() -> None:
+    """
+    Aggregate reviews from two sources in parallel, merge the partial aggregates and print the corpus view.
+    :return: None
+    """
+    print("\n -- aggregate_reviews")
+    from dotenv import load_dotenv
+    from ai_clients import registry
+    load_dotenv()
+
+    reviews = {
+        "web": [
+            "Foo Company has the best tacos I have ever had!",
+            "The tacos at Foo Company in Seattle were cold.",
+        ] * 50,
+        "app": [
+            "Bar Company is the worst place to get a burger",
+            "Bar Company in Portland has friendly staff and great burgers.",
+        ] * 50,
+    }
+    try:
+        # One partial aggregate per worker, merged at the end
+        parts = await asyncio.gather(*(
+            aggregate_documents(zip([source] * len(texts), texts)) for source, texts in reviews.items()
+        ))
+    finally:
+        await registry.aclose()
+    total = parts[0]
+    for part in parts[1:]:
+        total.merge(part)
+
+    print(f"{total.documents} document(s), {total.errors} error(s), {total.nbytes / 2 ** 20:.0f} MB of sketches")
+    print(f"Entities by category: {dict(total.categories.most_common())}")
+    for category, text, count in total.entities(5):
+        print(f"   {category}: '{text}' in {count} document(s)")
+    for first, second, count in total.pairs(3):
+        print(f"   '{first.split(SEPARATOR)[1]}' with '{second.split(SEPARATOR)[1]}' in {count} document(s)")
+    for source, distribution in total.sentiment_distribution().items():
+        print(f"Sentiment of {source}: " + ", ".join(f"{label} {share:.0%}" for label, share in distribution.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(aggregate_reviews())
@@ -10,17 +10,13 @@
 
     pip install azure-ai-textanalytics
 """
-import os
-
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.textanalytics import TextAnalyticsClient, RecognizeEntitiesAction, AnalyzeSentimentAction
 from dotenv import load_dotenv
-load_dotenv()
-
-endpoint = os.environ["AZURE_AI_SERVICES_URL"]
-key = os.environ["AZURE_AI_SERVICES_KEY"]
 
-text_analytics_client = TextAnalyticsClient(endpoint, AzureKeyCredential(key))
+from ai_cache import cached_call
+from ai_clients import registry
+from ai_lang_detect import detect_languages
+from ai_telemetry import profiled
+load_dotenv()
 
 
 def detect_language() -> None:
@@ -42,10 +38,10 @@ def detect_language() -> None:
         Explorando juntos el aire libre, la cola del perro se agita con emoción, disfrutando de cada olor y vista en el camino.
         """
     ]
-    result = text_analytics_client.detect_language(doc)
-    for idx, doc in enumerate(result):
-        print(f"Document {idx + 1} has detected language: {doc.primary_language.name}")
-        print(f"Confidence score: {doc.primary_language.confidence_score}")
+    # Common scripts and languages are detected locally, only the ambiguous documents are sent
+    for idx, detection in enumerate(detect_languages(doc)):
+        print(f"Document {idx + 1} has detected language: {detection.name} ({detection.source})")
+        print(f"Confidence score: {detection.confidence}")
 
 
 def sentiment_analysis() -> None:
@@ -54,6 +50,7 @@ def sentiment_analysis() -> None:
     :return: None
     """
     print("\n -- sentiment_analysis")
+    text_analytics_client = registry.text_analytics()
 
     documents = [
         """I had the best day of my life. """,
@@ -61,7 +58,7 @@ def sentiment_analysis() -> None:
         """I didn't enjoy this at all. I want my money back. """,
     ]
 
-    result = text_analytics_client.analyze_sentiment(documents)
+    result = cached_call("analyze_sentiment", documents, lambda: text_analytics_client.analyze_sentiment(documents))
     docs = [doc for doc in result if not doc.is_error]
 
     print("Let's visualize the sentiment of each of these documents")
@@ -76,6 +73,7 @@ def recognize_entities() -> None:
     :return: None
     """
     print("\n -- recognize_entities")
+    text_analytics_client = registry.text_analytics()
 
     reviews = [
         """I work for Foo Company, and we hired Bartastic for our annual founding ceremony. The food
@@ -83,7 +81,7 @@ def recognize_entities() -> None:
         """Foo Company is over the moon about the service we received from Bartastic, the best sliders ever!!!!"""
     ]
 
-    result = text_analytics_client.recognize_entities(reviews)
+    result = cached_call("recognize_entities", reviews, lambda: text_analytics_client.recognize_entities(reviews))
     result = [review for review in result if not review.is_error]
 
     for idx, review in enumerate(result):
@@ -97,6 +95,7 @@ def linked_entities() -> None:
     :return: None
     """
     print("\n -- linked_entities")
+    text_analytics_client = registry.text_analytics()
     documents = [
         """
         Microsoft was founded by Bill Gates with some friends he met at Harvard.
@@ -105,7 +104,9 @@ def linked_entities() -> None:
         """
     ]
 
-    result = text_analytics_client.recognize_linked_entities(documents)
+    result = cached_call(
+        "recognize_linked_entities", documents, lambda: text_analytics_client.recognize_linked_entities(documents)
+    )
     docs = [doc for doc in result if not doc.is_error]
     for doc in docs:
         for entity in doc.entities:
@@ -118,13 +119,16 @@ def recognized_pii() -> None:
     :return: None
     """
     print("\n -- recognized_pii")
+    text_analytics_client = registry.text_analytics()
     documents = [
         """Parker Doe has repaid all of their loans as of 2020-04-25.
         Their SSN is 859-98-0987. To contact them, use their phone number
         555-555-5555."""
     ]
 
-    result = text_analytics_client.recognize_pii_entities(documents)
+    result = cached_call(
+        "recognize_pii_entities", documents, lambda: text_analytics_client.recognize_pii_entities(documents)
+    )
     docs = [doc for doc in result if not doc.is_error]
 
     for idx, doc in enumerate(docs):
@@ -140,24 +144,29 @@ def get_key_phrases() -> None:
     :return: None
     """
     print("\n -- get_key_phrases")
+    text_analytics_client = registry.text_analytics()
     articles = [
         """
         Redmond, WA. Employees at Microsoft can be excited about the new coffee shop that will open on campus
         once workers no longer have to work remotely...
         """
     ]
-    result = text_analytics_client.extract_key_phrases(articles)
+    result = cached_call("extract_key_phrases", articles, lambda: text_analytics_client.extract_key_phrases(articles))
     for idx, doc in enumerate(result):
         if not doc.is_error:
-            print(f"Key phrases: {", ".join(doc.key_phrases)}")
+            print(f"Key phrases: {', '.join(doc.key_phrases)}")
 
 
-def healthcare_analysis() -> None:
+def healthcare_analysis(output_path: str = None) -> None:
     """
     Analyze healthcare data.
+    The results are streamed page by page into compact records instead of being held all at once.
+    :param output_path: write the records to this .jsonl or .parquet file instead of printing them
     :return: None
     """
     print("\n -- healthcare_analysis")
+    from ai_text_records import stream_records, write_records
+    text_analytics_client = registry.text_analytics()
     documents = [
         """
         Patient needs to take 100 mg of ibuprofen, and 3 mg of potassium. Also needs to take
@@ -169,29 +178,33 @@ def healthcare_analysis() -> None:
     ]
 
     poller = text_analytics_client.begin_analyze_healthcare_entities(documents)
-    result = poller.result()
-
-    docs = [doc for doc in result if not doc.is_error]
-
-    for doc in docs:
-        for entity in doc.entities:
-            print(f"Entity: {entity.text}")
-            print(f"   Normalized Text: {entity.normalized_text}")
-            print(f"   Category: {entity.category}")
-            print(f"   Subcategory: {entity.subcategory}")
-            print(f"   Offset: {entity.offset}")
-            print(f"   Confidence score: {entity.confidence_score}")
-            if entity.data_sources is not None:
-                print(f"   Data Sources: {[data_source.name for data_source in entity.data_sources]}")
-            if entity.assertion is not None:
-                print("   Assertion:")
-                print(f"      Conditionality: {entity.assertion.conditionality}")
-                print(f"      Certainty: {entity.assertion.certainty}")
-                print(f"      Association: {entity.assertion.association}")
-        for relation in doc.entity_relations:
-            print(f"Relation type: {relation.relation_type} has the following roles")
-            for role in relation.roles:
-                print(f"   Role '{role.name}' with entity '{role.entity.text}'")
+    records = stream_records(poller.result())
+    if output_path:
+        print(f"{write_records(records, output_path)} record(s) written to {output_path}")
+        return
+
+    with profiled("text.healthcare"):
+        for record in records:
+            if record.error is not None:
+                continue
+            for entity in record.entities:
+                print(f"Entity: {entity.text}")
+                print(f"   Normalized Text: {entity.normalized_text}")
+                print(f"   Category: {entity.category}")
+                print(f"   Subcategory: {entity.subcategory}")
+                print(f"   Offset: {entity.offset}")
+                print(f"   Confidence score: {entity.confidence_score}")
+                if entity.data_sources:
+                    print(f"   Data Sources: {[source.split(':')[0] for source in entity.data_sources]}")
+                if entity.certainty is not None or entity.conditionality is not None or entity.association is not None:
+                    print("   Assertion:")
+                    print(f"      Conditionality: {entity.conditionality}")
+                    print(f"      Certainty: {entity.certainty}")
+                    print(f"      Association: {entity.association}")
+            for relation in record.relations:
+                print(f"Relation type: {relation.relation_type} has the following roles")
+                for name, entity in relation.roles:
+                    print(f"   Role '{name}' with entity '{record.entities[entity].text}'")
 
 
 def multi_analysis() -> None:
@@ -200,6 +213,9 @@ def multi_analysis() -> None:
     :return:
     """
     print("\n -- multi_analysis")
+    from azure.ai.textanalytics import RecognizeEntitiesAction, AnalyzeSentimentAction
+    from ai_text_records import actions_record, stream_records
+    text_analytics_client = registry.text_analytics()
     documents = [
         """Foo Company has the best tacos I have ever had!""",
         """Bar Company is the worst place to get a burger""",
@@ -209,29 +225,20 @@ def multi_analysis() -> None:
         RecognizeEntitiesAction(),
         AnalyzeSentimentAction()
     ])
-    document_results = poller.result()
-    for doc, action_results in zip(documents, document_results):
+    # One compact record per document, built as the result pages arrive
+    for doc, record in zip(documents, stream_records(poller.result(), actions_record)):
         print(f"\nDocument text: {doc}")
-        for poller in action_results:
-            if poller.kind == "EntityRecognition":
-                print("   Results of Recognize Entities Action:")
-                for entity in poller.entities:
-                    print(f"      Entity: {entity.text}")
-                    print(f"         Category: {entity.category}")
-                    print(f"         Confidence Score: {entity.confidence_score}")
-
-            elif poller.kind == "SentimentAnalysis":
-                print("   Results of Analyze Sentiment action:")
-                print(f"      Overall sentiment: {poller.sentiment}")
-                print(f"      Scores: positive={poller.confidence_scores.positive}; \
-                    neutral={poller.confidence_scores.neutral}; \
-                    negative={poller.confidence_scores.negative} \n"
-                )
-
-            elif poller.is_error is True:
-                print(
-                    f"...Is an error with code '{poller.error.code}' and message '{poller.error.message}'"
-                )
+        if record.error is not None:
+            print(f"...Is an error: {record.error}")
+            continue
+        print("   Results of Recognize Entities Action:")
+        for entity in record.entities:
+            print(f"      Entity: {entity.text}")
+            print(f"         Category: {entity.category}")
+            print(f"         Confidence Score: {entity.confidence_score}")
+        print("   Results of Analyze Sentiment action:")
+        print(f"      Overall sentiment: {record.sentiment}")
+        print(f"      Scores: positive={record.positive}; neutral={record.neutral}; negative={record.negative}\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,220 @@
+"""
+USAGE:
+    python ai_text_batch.py
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Splits any iterable of documents into chunks that fit the per-request limits of the
+    Text Analytics service, keeps several chunks in flight at once through the async
+    TextAnalyticsClient and streams the results back in input order.
+
+    Per-document errors are not filtered out, every result comes back as a
+    BatchResult(index, result) and result.is_error tells you if the service rejected it.
+    When a whole request fails (413, 400, or a network error after the retries), each of its
+    documents comes back as a DocumentError with the status as code, and the other requests go on.
+
+    pip install azure-ai-textanalytics aiohttp
+"""
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, NamedTuple, Tuple
+
+from ai_clients import registry
+
+# Documents per request, see https://aka.ms/azsdk/textanalytics/data-limits
+MAX_DOCUMENTS = {
+    "detect_language": 1000,
+    "analyze_sentiment": 10,
+    "recognize_entities": 5,
+    "recognize_pii_entities": 5,
+    "recognize_linked_entities": 5,
+    "extract_key_phrases": 10,
+}
+
+# The service rejects requests over 1 MB, leave room for the JSON envelope
+MAX_REQUEST_BYTES = 900_000
+
+DEFAULT_CONCURRENCY = 8
+
+
+class BatchResult(NamedTuple):
+    index: int
+    result: Any
+
+
+def _document_bytes(document: Any) -> int:
+    if isinstance(document, str):
+        text = document
+    elif isinstance(document, dict):
+        text = document.get("text", "")
+    else:
+        text = getattr(document, "text", "")
+    return len(text.encode("utf-8"))
+
+
+def _document_id(document: Any, position: int) -> str:
+    if isinstance(document, dict):
+        return str(document.get("id", position))
+    return str(getattr(document, "id", None) or position)
+
+
+def chunk_error_results(chunk: List[Any], error: Exception) -> List[Any]:
+    """
+    One DocumentError per document of a request that failed as a whole.
+    """
+    from azure.ai.textanalytics import DocumentError, TextAnalyticsError
+
+    status = getattr(error, "status_code", None)
+    code = getattr(getattr(error, "error", None), "code", None) or (str(status) if status else type(error).__name__)
+    message = getattr(error, "message", None) or str(error)
+    return [
+        DocumentError(id=_document_id(document, position), error=TextAnalyticsError(code=code, message=message))
+        for position, document in enumerate(chunk)
+    ]
+
+
+def chunk_documents(
+    documents: Iterable[Any],
+    operation: str,
+    max_documents: int = None,
+    max_request_bytes: int = MAX_REQUEST_BYTES,
+    split_on: Callable[[Any], Any] = None,
+) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Split documents into chunks that fit in a single request.
+    A single document over max_request_bytes is sent on its own so the service can report the error for it.
+    :param documents: any iterable of str, dict or TextDocumentInput, consumed lazily
+    :param operation: name of the TextAnalyticsClient method the chunks are for
+    :param max_documents: override the per-request document count for the operation
+    :param max_request_bytes: upper bound for the text in one request
+    :param split_on: a new chunk is started wherever split_on(document) changes, e.g. the language
+    :return: iterator of (index of the first document, documents in the chunk)
+    """
+    if operation not in MAX_DOCUMENTS:
+        raise ValueError(f"Unsupported operation '{operation}', expected one of {sorted(MAX_DOCUMENTS)}")
+    max_documents = max_documents or MAX_DOCUMENTS[operation]
+
+    start = 0
+    chunk = []
+    chunk_bytes = 0
+    chunk_key = None
+    for index, document in enumerate(documents):
+        size = _document_bytes(document)
+        key = split_on(document) if split_on is not None else None
+        if chunk and (len(chunk) >= max_documents or chunk_bytes + size > max_request_bytes or key != chunk_key):
+            yield start, chunk
+            start = index
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(document)
+        chunk_bytes += size
+        chunk_key = key
+    if chunk:
+        yield start, chunk
+
+
+async def analyze_batches(
+    documents: Iterable[Any],
+    operation: str = "analyze_sentiment",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    client: Any = None,
+    max_documents: int = None,
+    split_on: Callable[[Any], Any] = None,
+    **kwargs: Any,
+) -> AsyncIterator[BatchResult]:
+    """
+    Run a Text Analytics operation over a corpus, many requests at a time.
+    Results are yielded in input order as soon as every chunk before them has finished.
+    :param documents: any iterable of str, dict or TextDocumentInput, consumed lazily
+    :param operation: detect_language, analyze_sentiment, recognize_entities, recognize_pii_entities,
+        recognize_linked_entities or extract_key_phrases
+    :param concurrency: number of requests in flight at once
+    :param client: an async TextAnalyticsClient, defaults to the shared one from the registry
+    :param max_documents: override the per-request document count for the operation
+    :param split_on: see chunk_documents()
+    :param kwargs: passed to every call, e.g. language="en" or model_version="latest"
+    :return: async iterator of BatchResult(index, result)
+    """
+    if client is None:
+        client = registry.text_analytics(is_async=True)
+    call = getattr(client, operation)
+
+    from azure.core.exceptions import (
+        ClientAuthenticationError, HttpResponseError, ServiceRequestError, ServiceResponseError,
+    )
+
+    async def send(start: int, chunk: List[Any]) -> List[BatchResult]:
+        try:
+            results = await call(chunk, **kwargs)
+        except ClientAuthenticationError:
+            # Every other request would fail the same way
+            raise
+        except (HttpResponseError, ServiceRequestError, ServiceResponseError) as error:
+            results = chunk_error_results(chunk, error)
+        return [BatchResult(start + offset, result) for offset, result in enumerate(results)]
+
+    chunks = chunk_documents(documents, operation, max_documents=max_documents, split_on=split_on)
+    in_flight = deque()
+    try:
+        for start, chunk in chunks:
+            in_flight.append(asyncio.ensure_future(send(start, chunk)))
+            if len(in_flight) >= concurrency:
+                for batch_result in await in_flight.popleft():
+                    yield batch_result
+        while in_flight:
+            for batch_result in await in_flight.popleft():
+                yield batch_result
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def analyze_documents(
+    documents: Iterable[Any],
+    operation: str = "analyze_sentiment",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    **kwargs: Any,
+) -> Iterator[BatchResult]:
+    """
+    Synchronous wrapper around analyze_batches() for scripts that do not run an event loop.
+    :return: iterator of BatchResult(index, result) in input order
+    """
+    loop = asyncio.new_event_loop()
+    results = analyze_batches(documents, operation, concurrency=concurrency, **kwargs)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(registry.aclose())
+        loop.close()
+
+
+def batch_sentiment_analysis() -> None:
+    """
+    Analyze the sentiment of a larger set of documents, including one the service rejects.
+    :return: None
+    """
+    print("\n -- batch_sentiment_analysis")
+
+    documents = [
+        """I had the best day of my life. """,
+        """I think I want some ice cream.""",
+        """I didn't enjoy this at all. I want my money back. """,
+        "",
+    ] * 25
+
+    for index, result in analyze_documents(documents, "analyze_sentiment"):
+        if result.is_error:
+            print(f"Document {index} failed with code '{result.error.code}'")
+        else:
+            print(f"Document {index} overall sentiment: {result.sentiment}")
+
+
+if __name__ == "__main__":
+    batch_sentiment_analysis()
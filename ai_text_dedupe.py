@@ -0,0 +1,390 @@
+"""
+USAGE:
+    python ai_text_dedupe.py
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Collapses duplicate and near-duplicate documents before they are sent to text analytics,
+    e.g. templates, retweets or messages that only differ in a signature or whitespace.
+    Only one representative per cluster is analyzed, its result is copied to every member.
+
+    Exact duplicates are documents that are equal after collapsing whitespace and NFKC
+    normalization. Their copies get entity, sentence and opinion offsets remapped to the
+    member's own text. Near-duplicates are found with MinHash signatures of character shingles
+    and LSH banding. Every member is compared with its representative directly, never through a
+    chain of other members. In the copies for near-duplicates, entities and sentences are moved to
+    where their text occurs in the member. Any whose text the member does not contain are dropped.
+
+    recognize_pii_entities and analyze_healthcare_entities only collapse exact duplicates.
+    A near-duplicate can hold a name or a medication its representative does not, and missing
+    it is worse than the extra call.
+
+    pip install azure-ai-textanalytics aiohttp numpy
+"""
+import asyncio
+import copy
+import unicodedata
+from typing import Any, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+# Estimated Jaccard similarity of the shingle sets above which documents are near-duplicates
+SIMILARITY_THRESHOLD = 0.8
+
+# 16 bands of 8 rows, pairs at 0.8 similarity share a band with probability ~0.947, at 0.9 ~0.9999
+NUM_PERM = 128
+BANDS = 16
+
+SHINGLE_SIZE = 5
+
+# Operations that only collapse exact duplicates
+EXACT_ONLY_OPERATIONS = {"recognize_pii_entities", "analyze_healthcare_entities"}
+
+# Documents per analyze healthcare job
+HEALTHCARE_CHUNK = 25
+
+_permutations = None
+
+
+class Duplicate(NamedTuple):
+    # Index of the analyzed document, the document itself for representatives
+    representative: int
+    # Equal to the representative after normalize(), offsets can be remapped exactly
+    exact: bool
+    similarity: float
+
+
+def normalize(text: str) -> str:
+    return _normalize_with_offsets(text)[0]
+
+
+def _normalize_with_offsets(text: str) -> Tuple[str, List[int], List[int]]:
+    """
+    Collapse whitespace and apply NFKC one character at a time.
+    :return: (normalized text, start in text of every normalized character, end in text of every normalized character)
+    """
+    parts: List[str] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    space = False
+    for index, character in enumerate(text):
+        if character.isspace():
+            space = bool(parts)
+            continue
+        if space:
+            parts.append(" ")
+            starts.append(index - 1)
+            ends.append(index)
+            space = False
+        for piece in unicodedata.normalize("NFKC", character):
+            parts.append(piece)
+            starts.append(index)
+            ends.append(index + 1)
+    return "".join(parts), starts, ends
+
+
+def _get_permutations() -> Tuple[Any, Any, Any]:
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+
+        random = np.random.default_rng(20240601)
+        shingle_weights = random.integers(1, 2 ** 63, SHINGLE_SIZE, dtype=np.uint64) | np.uint64(1)
+        multipliers = random.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+        offsets = random.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+        _permutations = shingle_weights, multipliers, offsets
+    return _permutations
+
+
+def minhash(text: str) -> Any:
+    """
+    MinHash signature of the character shingles of the casefolded, normalized text.
+    :return: numpy uint64 array of NUM_PERM values
+    """
+    import numpy as np
+
+    shingle_weights, multipliers, offsets = _get_permutations()
+    text = normalize(text).casefold()
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        codes = np.concatenate([codes, np.zeros(SHINGLE_SIZE - len(codes), dtype=np.uint64)])
+    # Polynomial hash of every shingle, then one multiply-shift hash per permutation, all mod 2**64
+    shingles = np.unique(np.lib.stride_tricks.sliding_window_view(codes, SHINGLE_SIZE) @ shingle_weights)
+    return ((shingles[:, None] * multipliers + offsets) >> np.uint64(32)).min(axis=0)
+
+
+def find_duplicates(
+    texts: Sequence[str],
+    threshold: float = SIMILARITY_THRESHOLD,
+    exact_only: bool = False,
+) -> List[Duplicate]:
+    """
+    Assign every document to the first earlier document it duplicates, or to itself.
+    :param threshold: estimated Jaccard similarity for near-duplicates
+    :param exact_only: only collapse documents that are equal after normalize()
+    :return: a Duplicate per document, in input order
+    """
+    import numpy as np
+
+    rows = NUM_PERM // BANDS
+    exact: Dict[str, int] = {}
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(BANDS)]
+    signatures: Dict[int, Any] = {}
+    duplicates: List[Duplicate] = []
+    for index, text in enumerate(texts):
+        key = normalize(text)
+        if key in exact:
+            duplicates.append(Duplicate(exact[key], True, 1.0))
+            continue
+        if exact_only:
+            exact[key] = index
+            duplicates.append(Duplicate(index, True, 1.0))
+            continue
+
+        signature = minhash(text)
+        bands = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(BANDS)]
+        candidates = {candidate for band, value in enumerate(bands) for candidate in buckets[band].get(value, ())}
+        best, similarity = index, 0.0
+        for candidate in sorted(candidates):
+            estimate = float(np.mean(signatures[candidate] == signature))
+            if estimate >= threshold and estimate > similarity:
+                best, similarity = candidate, estimate
+        if best != index:
+            duplicates.append(Duplicate(best, False, similarity))
+            continue
+
+        # Only representatives go into the index, members are compared with them directly
+        exact[key] = index
+        signatures[index] = signature
+        for band, value in enumerate(bands):
+            buckets[band].setdefault(value, []).append(index)
+        duplicates.append(Duplicate(index, True, 1.0))
+    return duplicates
+
+
+def _is_span(value: Any) -> bool:
+    return (
+        isinstance(getattr(value, "offset", None), int)
+        and isinstance(getattr(value, "length", None), int)
+        and isinstance(getattr(value, "text", None), str)
+    )
+
+
+def _casefold_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """
+    :return: casefolded text, and the position in text of each of its characters
+    """
+    folded: List[str] = []
+    origins: List[int] = []
+    for position, character in enumerate(text):
+        character = character.casefold()
+        folded.append(character)
+        origins.extend([position] * len(character))
+    return "".join(folded), origins
+
+
+def _find_nearest(text: str, needle: str, expected: int) -> Tuple[int, int]:
+    """
+    Find needle in text ignoring case, the occurrence closest to expected when there are several.
+    :return: (offset, length) in text, offset -1 when not found
+    """
+    folded, origins = _casefold_with_offsets(text)
+    folded_needle = needle.casefold()
+    if not folded_needle:
+        return -1, 0
+    best = -1
+    position = folded.find(folded_needle)
+    while position != -1:
+        if best == -1 or abs(origins[position] - expected) < abs(origins[best] - expected):
+            best = position
+        position = folded.find(folded_needle, position + 1)
+    if best == -1:
+        return -1, 0
+    start = origins[best]
+    return start, origins[best + len(folded_needle) - 1] + 1 - start
+
+
+def _remap(value: Any, move: Any, seen: set) -> bool:
+    """
+    Move every span reachable from value with move(span), which returns False when the span is lost.
+    Lists drop the spans that are lost, and linked entities left without matches.
+    :return: False when value is a span that was lost
+    """
+    if id(value) in seen:
+        return True
+    seen.add(id(value))
+    if isinstance(value, list):
+        value[:] = [
+            item for item in value
+            if _remap(item, move, seen) and getattr(item, "matches", None) != []
+        ]
+        return True
+    if not hasattr(value, "__dict__") or isinstance(value, type):
+        return True
+    if _is_span(value) and not move(value):
+        return False
+    for attribute in vars(value).values():
+        if isinstance(attribute, list) or hasattr(attribute, "__dict__"):
+            _remap(attribute, move, seen)
+    return True
+
+
+def fan_out(result: Any, representative: str, member: str, exact: bool) -> Any:
+    """
+    Copy the result of the representative for a member of its cluster.
+    :param exact: the member is equal to the representative after normalize()
+    :return: a copy of result with spans moved to the member's text, result itself for an identical text
+    """
+    if representative == member or getattr(result, "is_error", False):
+        return result
+    result = copy.deepcopy(result)
+
+    if exact:
+        _, starts, _ = _normalize_with_offsets(representative)
+        _, member_starts, member_ends = _normalize_with_offsets(member)
+        # Normalized position of every original position of the representative
+        positions = [0] * (len(representative) + 1)
+        normalized = len(starts)
+        for original in range(len(representative), -1, -1):
+            while normalized > 0 and starts[normalized - 1] >= original:
+                normalized -= 1
+            positions[original] = normalized
+
+        def move(span: Any) -> bool:
+            start = positions[min(span.offset, len(representative))]
+            end = positions[min(span.offset + span.length, len(representative))]
+            if start >= len(member_starts) or end <= start:
+                return False
+            span.offset = member_starts[start]
+            span.length = member_ends[end - 1] - span.offset
+            span.text = member[span.offset:span.offset + span.length]
+            return True
+    else:
+        scale = len(member) / max(1, len(representative))
+
+        def move(span: Any) -> bool:
+            # Members may differ in case, the span takes the member's own text
+            offset, length = _find_nearest(member, span.text, int(span.offset * scale))
+            if offset == -1:
+                return False
+            span.offset, span.length = offset, length
+            span.text = member[offset:offset + length]
+            return True
+
+    _remap(result, move, set())
+    if isinstance(getattr(result, "redacted_text", None), str):
+        redacted = list(member)
+        for entity in result.entities:
+            redacted[entity.offset:entity.offset + entity.length] = "*" * entity.length
+        result.redacted_text = "".join(redacted)
+    return result
+
+
+async def _analyze_healthcare(texts: Sequence[str], max_in_flight: int, **kwargs: Any) -> List[Any]:
+    from ai_clients import registry
+    from ai_lro import LROScheduler
+
+    client = registry.text_analytics(is_async=True)
+    jobs = (
+        (start, "healthcare", lambda chunk=list(texts[start:start + HEALTHCARE_CHUNK]):
+            client.begin_analyze_healthcare_entities(chunk, **kwargs))
+        for start in range(0, len(texts), HEALTHCARE_CHUNK)
+    )
+    results: List[Any] = [None] * len(texts)
+    try:
+        async for job in LROScheduler(max_in_flight=max_in_flight).as_completed(jobs):
+            if job.error is not None:
+                raise job.error
+            index = job.key
+            async for document in job.result:
+                results[index] = document
+                index += 1
+    finally:
+        await registry.aclose()
+    return results
+
+
+def analyze_deduplicated(
+    documents: Sequence[str],
+    operation: str = "analyze_sentiment",
+    threshold: float = SIMILARITY_THRESHOLD,
+    duplicates: Sequence[Duplicate] = None,
+    max_in_flight: int = 8,
+    **kwargs: Any,
+) -> Iterator[Any]:
+    """
+    Run a text analytics operation on one representative per cluster and copy the results to the members.
+    :param operation: an operation of ai_text_batch, e.g. analyze_sentiment or recognize_entities,
+        or analyze_healthcare_entities
+    :param duplicates: the result of find_duplicates() when already known
+    :param max_in_flight: healthcare jobs in flight at once
+    :param kwargs: passed to ai_text_batch.analyze_documents or begin_analyze_healthcare_entities
+    :return: iterator of BatchResult(index, result) in input order
+    """
+    from ai_text_batch import BatchResult, analyze_documents
+
+    duplicates = duplicates or find_duplicates(
+        documents, threshold, exact_only=operation in EXACT_ONLY_OPERATIONS
+    )
+    representatives = [index for index, duplicate in enumerate(duplicates) if duplicate.representative == index]
+    texts = [documents[index] for index in representatives]
+    if operation == "analyze_healthcare_entities":
+        analyzed = iter(asyncio.run(_analyze_healthcare(texts, max_in_flight, **kwargs)))
+    else:
+        analyzed = (batch_result.result for batch_result in analyze_documents(texts, operation, **kwargs))
+
+    results: Dict[int, Any] = {}
+    index = 0
+    for position, result in enumerate(analyzed):
+        results[representatives[position]] = result
+        # Every document before the next representative has its result now
+        limit = representatives[position + 1] if position + 1 < len(representatives) else len(documents)
+        while index < limit:
+            duplicate = duplicates[index]
+            yield BatchResult(index, fan_out(
+                results[duplicate.representative], documents[duplicate.representative],
+                documents[index], duplicate.exact,
+            ))
+            index += 1
+
+
+def deduplicated_entities() -> None:
+    """
+    Recognize entities and sentiment in a feed full of templates and retweets, analyzing each cluster once.
+    :return: None
+    """
+    print("\n -- deduplicated_entities")
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    feed = [
+        "Foo Company in Seattle has the best tacos I have ever had!",
+        "RT @maria: Foo Company in Seattle has the best tacos I have ever had!",
+        "  foo Company in Seattle has the best tacos\nI have ever had!",
+        "Foo Company in Seattle has the best tacos I have ever had!\n-- Sent from my phone",
+        "Your order 4711 from Bar Company in Portland has shipped and arrives on Monday.",
+        "Your order 4712 from Bar Company in Portland has shipped and arrives on Monday.",
+        "The tacos at Foo Company in Seattle were cold.",
+    ] * 10
+
+    duplicates = find_duplicates(feed)
+    representatives = sum(duplicate.representative == index for index, duplicate in enumerate(duplicates))
+    print(f"{len(feed)} document(s) in {representatives} cluster(s), {len(feed) - representatives} call(s) saved")
+
+    for index, result in analyze_deduplicated(feed, "recognize_entities", duplicates=duplicates):
+        if index >= 7:
+            continue
+        if result.is_error:
+            print(f"Document {index} failed with code '{result.error.code}'")
+            continue
+        duplicate = duplicates[index]
+        entities = ", ".join(f"{entity.text}@{entity.offset}" for entity in result.entities)
+        print(f"Document {index} (cluster {duplicate.representative}, {duplicate.similarity:.2f}): {entities}")
+
+    for index, result in analyze_deduplicated(feed[:7], "analyze_sentiment"):
+        if not result.is_error:
+            print(f"Document {index} overall sentiment: {result.sentiment}")
+
+
+if __name__ == "__main__":
+    deduplicated_entities()
@@ -0,0 +1,281 @@
+"""
+USAGE:
+    python ai_text_records.py [output path, .jsonl or .parquet]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+
+    Streams the results of long-running text analytics jobs (begin_analyze_healthcare_entities,
+    begin_analyze_actions) one result page at a time, through result.by_page(). Each document is
+    turned into a compact __slots__ record with the fields the samples use: entities, relations,
+    assertions, sentiment and its scores, key phrases, or the error. The SDK objects of a page are
+    dropped once its records are written, so memory stays flat however large the job is.
+
+    Healthcare jobs take at most 25 documents, healthcare_records() splits larger inputs into jobs
+    that run a few at a time and streams their records in input order.
+
+    Records are written straight to JSON lines, or to Parquet in row groups of batch_size records
+    when pyarrow is installed.
+
+    pip install azure-ai-textanalytics
+    pip install pyarrow  # optional, for Parquet
+"""
+import json
+import sys
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+# Records per Parquet row group
+DEFAULT_BATCH_SIZE = 1000
+
+# Documents per analyze healthcare job, the service limit
+HEALTHCARE_CHUNK = 25
+
+# Healthcare jobs running at once
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class EntityRecord:
+    __slots__ = (
+        "text", "category", "subcategory", "offset", "length", "confidence_score",
+        "normalized_text", "data_sources", "conditionality", "certainty", "association",
+    )
+
+    def __init__(self, entity: Any, match: Any = None):
+        """
+        :param match: for a LinkedEntity, one of its matches, the text the record points at
+        """
+        span = match if match is not None else entity
+        self.text = span.text
+        self.category = getattr(entity, "category", None)
+        self.subcategory = getattr(entity, "subcategory", None)
+        self.offset = span.offset
+        self.length = span.length
+        self.confidence_score = span.confidence_score
+        if match is not None:
+            # Linked entities: the name of the entry in the knowledge base and the entry
+            self.normalized_text = entity.name
+            self.data_sources = [f"{entity.data_source}:{entity.data_source_entity_id}"]
+        else:
+            # Healthcare entities only
+            self.normalized_text = getattr(entity, "normalized_text", None)
+            self.data_sources = [
+                f"{source.name}:{source.entity_id}" for source in getattr(entity, "data_sources", None) or []
+            ]
+        assertion = getattr(entity, "assertion", None)
+        self.conditionality = assertion.conditionality if assertion is not None else None
+        self.certainty = assertion.certainty if assertion is not None else None
+        self.association = assertion.association if assertion is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RelationRecord:
+    __slots__ = ("relation_type", "roles")
+
+    def __init__(self, relation: Any, entity_indices: Dict[int, int]):
+        self.relation_type = relation.relation_type
+        # (role name, index of the entity in the entities of the document)
+        self.roles = [(role.name, entity_indices.get(id(role.entity), -1)) for role in relation.roles]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relation_type": self.relation_type,
+            "roles": [{"name": name, "entity": entity} for name, entity in self.roles],
+        }
+
+
+class DocumentRecord:
+    """
+    The fields of one document result, or of all the action results of one document.
+    """
+    __slots__ = (
+        "index", "id", "entities", "relations", "key_phrases",
+        "sentiment", "positive", "neutral", "negative", "error",
+    )
+
+    def __init__(self, index: int, document_id: str = None):
+        self.index = index
+        self.id = document_id
+        self.entities: List[EntityRecord] = []
+        self.relations: List[RelationRecord] = []
+        self.key_phrases: List[str] = []
+        self.sentiment = None
+        self.positive = None
+        self.neutral = None
+        self.negative = None
+        self.error = None
+
+    def add(self, result: Any) -> "DocumentRecord":
+        """
+        Copy the fields of one SDK document result into the record.
+        """
+        if self.id is None:
+            self.id = getattr(result, "id", None)
+        if result.is_error:
+            self.error = f"{result.error.code}: {result.error.message}"
+            return self
+        # Index of the (first) record of every entity, for the relations
+        entity_indices: Dict[int, int] = {}
+        for entity in getattr(result, "entities", None) or []:
+            entity_indices[id(entity)] = len(self.entities)
+            matches = getattr(entity, "matches", None)
+            if matches is None:
+                self.entities.append(EntityRecord(entity))
+            else:
+                # A linked entity has one record per place it is mentioned
+                self.entities.extend(EntityRecord(entity, match) for match in matches)
+        self.relations.extend(
+            RelationRecord(relation, entity_indices) for relation in getattr(result, "entity_relations", None) or []
+        )
+        self.key_phrases.extend(getattr(result, "key_phrases", None) or [])
+        scores = getattr(result, "confidence_scores", None)
+        if getattr(result, "sentiment", None) is not None and scores is not None:
+            self.sentiment = result.sentiment
+            self.positive, self.neutral, self.negative = scores.positive, scores.neutral, scores.negative
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        value = {name: getattr(self, name) for name in self.__slots__}
+        value["entities"] = [entity.to_dict() for entity in self.entities]
+        value["relations"] = [relation.to_dict() for relation in self.relations]
+        return value
+
+
+def healthcare_record(index: int, result: Any) -> DocumentRecord:
+    return DocumentRecord(index).add(result)
+
+
+def actions_record(index: int, action_results: List[Any]) -> DocumentRecord:
+    """
+    One record for all the action results of a document of begin_analyze_actions.
+    """
+    record = DocumentRecord(index)
+    for action_result in action_results:
+        record.add(action_result)
+    return record
+
+
+def stream_records(
+    result: Any,
+    convert: Callable[[int, Any], DocumentRecord] = healthcare_record,
+    start: int = 0,
+) -> Iterator[DocumentRecord]:
+    """
+    Convert the documents of a paged result as its pages arrive.
+    :param result: ItemPaged returned by poller.result()
+    :param convert: healthcare_record or actions_record
+    :param start: index of the first document of the job in the input
+    :return: iterator of DocumentRecord in input order
+    """
+    index = start
+    for page in result.by_page():
+        for item in page:
+            yield convert(index, item)
+            index += 1
+
+
+def healthcare_records(
+    documents: List[Any],
+    client: Any = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    **kwargs: Any,
+) -> Iterator[DocumentRecord]:
+    """
+    Analyze any number of documents in healthcare jobs of HEALTHCARE_CHUNK documents, with at most
+    max_in_flight jobs running while the results of the oldest one are streamed.
+    :param client: TextAnalyticsClient, the shared registry client by default
+    :param kwargs: passed to begin_analyze_healthcare_entities
+    :return: iterator of DocumentRecord in input order
+    """
+    from ai_clients import registry
+
+    client = client or registry.text_analytics()
+    pending = deque()
+    for start in range(0, len(documents), HEALTHCARE_CHUNK):
+        pending.append((start, client.begin_analyze_healthcare_entities(
+            documents[start:start + HEALTHCARE_CHUNK], **kwargs)))
+        if len(pending) >= max_in_flight:
+            start, poller = pending.popleft()
+            yield from stream_records(poller.result(), start=start)
+    while pending:
+        start, poller = pending.popleft()
+        yield from stream_records(poller.result(), start=start)
+
+
+def _parquet_schema() -> Any:
+    import pyarrow as pa
+
+    entity = pa.struct([
+        ("text", pa.string()), ("category", pa.string()), ("subcategory", pa.string()),
+        ("offset", pa.int32()), ("length", pa.int32()), ("confidence_score", pa.float64()),
+        ("normalized_text", pa.string()), ("data_sources", pa.list_(pa.string())),
+        ("conditionality", pa.string()), ("certainty", pa.string()), ("association", pa.string()),
+    ])
+    relation = pa.struct([
+        ("relation_type", pa.string()),
+        ("roles", pa.list_(pa.struct([("name", pa.string()), ("entity", pa.int32())]))),
+    ])
+    return pa.schema([
+        ("index", pa.int64()), ("id", pa.string()),
+        ("entities", pa.list_(entity)), ("relations", pa.list_(relation)), ("key_phrases", pa.list_(pa.string())),
+        ("sentiment", pa.string()), ("positive", pa.float64()), ("neutral", pa.float64()),
+        ("negative", pa.float64()), ("error", pa.string()),
+    ])
+
+
+def write_records(records: Iterable[DocumentRecord], path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Write records to JSON lines, or to Parquet when the path ends with .parquet.
+    At most batch_size records are held at once for Parquet, one for JSON lines.
+    :return: number of records written
+    """
+    count = 0
+    if not path.endswith(".parquet"):
+        with open(path, "w", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record.to_dict(), ensure_ascii=False))
+                file.write("\n")
+                count += 1
+        return count
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    batch: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for record in records:
+            batch.append(record.to_dict())
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def healthcare_to_file(output_path: str = "./healthcare.jsonl") -> None:
+    """
+    Stream the results of a healthcare job to a file.
+    :return: None
+    """
+    print("\n -- healthcare_to_file")
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    documents = [
+        "Patient needs to take 100 mg of ibuprofen, and 3 mg of potassium. Also needs to take 10 mg of Zocor.",
+        "Patient needs to take 50 mg of ibuprofen, and 2 mg of Coumadin.",
+    ] * 50
+
+    count = write_records(healthcare_records(documents), output_path)
+    print(f"{count} record(s) written to {output_path}")
+
+
+if __name__ == "__main__":
+    healthcare_to_file(*sys.argv[1:2])
@@ -0,0 +1,286 @@
+"""
+USAGE:
+    python ai_tiling.py
+    python -m azure_ai tiling tiled_objects <image path> [<output path>]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) CUSTOM_VISION_DETECT_PROJECT_ID - for tiled_custom_vision
+
+    Object detection for high resolution images. A whole 20 megapixel frame is downscaled to
+    1024 pixels before detection, so small objects are lost. In tiled mode the decoded image is
+    cut into overlapping tiles at native resolution, e.g. 1024 x 1024. All tiles go out at once
+    on a thread pool, together with the downscaled whole frame, which finds the objects larger
+    than a tile. Total latency stays close to that of a single call.
+
+    The boxes of every tile are shifted to the coordinates of the original image. Duplicates
+    from overlapping tiles and the whole frame are removed with non-maximum suppression, per
+    label and vectorized with NumPy. Overlap is measured against the smaller box by default, so
+    a part of an object cut by a tile edge is suppressed by the whole object found next door.
+
+    pip install azure-ai-vision-imageanalysis azure-cognitiveservices-vision-customvision opencv-python numpy
+"""
+import os
+from typing import Any, Callable, List, NamedTuple, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Share of the tile size that neighbouring tiles overlap, objects up to this size are whole in some tile
+DEFAULT_OVERLAP = 0.25
+
+# Tiles in flight at once, a 20 megapixel frame makes 35 tiles of 1024 pixels with the default overlap.
+# Matches the connection pool of the client registry
+DEFAULT_CONCURRENCY = 32
+
+# Suppress a box that overlaps a better box of the same label by more than this share of the smaller box
+MERGE_METRIC = "ios"
+MERGE_THRESHOLD = 0.7
+
+# (pixel N x 4 x, y, width, height boxes, N scores, N labels) found in one uploaded image
+TileDetector = Callable[[bytes, int, int], Tuple[Any, Sequence[float], Sequence[str]]]
+
+
+class Detections(NamedTuple):
+    # N x 4 (x1, y1, x2, y2) float pixel corners in the original image
+    boxes: Any
+    scores: Any
+    labels: List[str]
+    # Service calls made, tiles and the whole frame
+    calls: int
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float = DEFAULT_OVERLAP) -> Any:
+    """
+    Overlapping tiles that cover the image, the last row and column are aligned with the image edges.
+    :return: N x 4 (x, y, width, height) int array
+    """
+    import numpy as np
+
+    def starts(length: int) -> Any:
+        if length <= tile_size:
+            return np.zeros(1, dtype=np.int64)
+        stride = max(1, int(tile_size * (1 - overlap)))
+        count = int(np.ceil((length - tile_size) / stride)) + 1
+        return np.rint(np.linspace(0, length - tile_size, count)).astype(np.int64)
+
+    ys, xs = np.meshgrid(starts(height), starts(width), indexing="ij")
+    grid = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    sizes = np.array([min(tile_size, width), min(tile_size, height)], dtype=np.int64)
+    return np.concatenate([grid, np.broadcast_to(sizes, grid.shape)], axis=1)
+
+
+def nms(
+    boxes: Any,
+    scores: Any,
+    labels: Sequence[str] = None,
+    threshold: float = MERGE_THRESHOLD,
+    metric: str = MERGE_METRIC,
+) -> Any:
+    """
+    Greedy non-maximum suppression, boxes of different labels never suppress each other.
+    :param boxes: N x 4 (x1, y1, x2, y2) corners
+    :param metric: iou, intersection over union, or ios, intersection over the smaller box
+    :return: indices of the boxes kept, best score first
+    """
+    import numpy as np
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    if labels is not None and len(boxes):
+        # Move every label to its own region of the plane so that boxes of different labels never overlap
+        _, label_ids = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+        boxes = boxes + (label_ids * (boxes.max() + 1))[:, None]
+
+    x1, y1, x2, y2 = boxes.T
+    areas = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.maximum(0.0, np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]))
+        height = np.maximum(0.0, np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]))
+        intersection = width * height
+        if metric == "ios":
+            overlap = intersection / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+        else:
+            overlap = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[overlap <= threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def detect_tiled(
+    source: Any,
+    detect_tile: TileDetector,
+    feature: str = "objects",
+    tile_size: int = None,
+    overlap: float = DEFAULT_OVERLAP,
+    include_full: bool = True,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    threshold: float = MERGE_THRESHOLD,
+    metric: str = MERGE_METRIC,
+) -> Detections:
+    """
+    Detect objects in overlapping tiles of an image and merge them into one set of boxes.
+    :param source: path to an image file, encoded image bytes or a PreparedImage
+    :param detect_tile: calls the service for one encoded image of the given width and height
+    :param feature: objects or custom_vision_detect, decides the tile size and the upload limit
+    :param tile_size: override the tile size, MAX_SIDE of the feature by default
+    :param include_full: also detect on the whole image downscaled to one upload, for objects larger than a tile
+    :return: Detections in the coordinates of the original image
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import cv2
+    import numpy as np
+    from ai_preprocess import JPEG_QUALITY, MAX_SIDE, PreparedImage, prepare_image
+
+    prepared = source if isinstance(source, PreparedImage) else prepare_image(source, feature)
+    tile_size = tile_size or MAX_SIDE[feature]
+    grid = tile_grid(prepared.width, prepared.height, tile_size, overlap)
+    if len(grid) == 1:
+        # The whole image fits in one tile, which is what the whole frame call sends
+        grid = grid[:0]
+        include_full = True
+
+    def run_tile(x: int, y: int, width: int, height: int) -> Tuple[Any, Sequence[float], Sequence[str]]:
+        ok, encoded = cv2.imencode(
+            ".jpg", prepared.image[y:y + height, x:x + width], [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+        )
+        if not ok:
+            raise ValueError("The tile could not be encoded")
+        boxes, scores, labels = detect_tile(encoded.tobytes(), width, height)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4) + [x, y, 0, 0]
+        return boxes, scores, labels
+
+    def run_full() -> Tuple[Any, Sequence[float], Sequence[str]]:
+        width = max(1, round(prepared.width * prepared.scale))
+        height = max(1, round(prepared.height * prepared.scale))
+        boxes, scores, labels = detect_tile(prepared.data, width, height)
+        return np.asarray(boxes, dtype=np.float64).reshape(-1, 4) / prepared.scale, scores, labels
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(grid) + include_full))) as pool:
+        futures = [pool.submit(run_tile, *tile) for tile in grid.tolist()]
+        if include_full:
+            futures.append(pool.submit(run_full))
+        parts = [future.result() for future in futures]
+
+    boxes = np.concatenate([part[0] for part in parts])
+    scores = np.concatenate([np.asarray(part[1], dtype=np.float64) for part in parts])
+    labels = [label for part in parts for label in part[2]]
+    corners = boxes.copy()
+    corners[:, 2:] += boxes[:, :2]
+    keep = nms(corners, scores, labels, threshold=threshold, metric=metric)
+    return Detections(corners[keep], scores[keep], [labels[index] for index in keep], len(parts))
+
+
+def analyze_objects_tiled(source: Any, client: Any = None, **kwargs: Any) -> Detections:
+    """
+    Image Analysis OBJECTS on overlapping tiles of a high resolution image.
+    :param kwargs: passed to detect_tiled, e.g. tile_size or overlap
+    """
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
+    from ai_cache import cached_call
+    from ai_clients import registry
+
+    client = client or registry.image_analysis()
+
+    def detect_tile(data: bytes, width: int, height: int) -> Tuple[Any, Sequence[float], Sequence[str]]:
+        result = cached_call(
+            "image.analyze", data,
+            lambda: client.analyze(image_data=data, visual_features=[VisualFeatures.OBJECTS]),
+            options={"visual_features": ["objects"]},
+        )
+        objects = [obj for value in result.objects.values() for obj in value]
+        boxes = [[obj.bounding_box[key] for key in ("x", "y", "w", "h")] for obj in objects]
+        return (
+            boxes,
+            [obj.tags[0].confidence if obj.tags else 0.0 for obj in objects],
+            [obj.tags[0].name if obj.tags else "" for obj in objects],
+        )
+
+    return detect_tiled(source, detect_tile, "objects", **kwargs)
+
+
+def custom_vision_detect_tiled(
+    source: Any,
+    project_id: str,
+    iteration_name: str,
+    predictor: Any = None,
+    min_probability: float = 0.1,
+    **kwargs: Any,
+) -> Detections:
+    """
+    Custom Vision detect_image on overlapping tiles of a high resolution image.
+    :param min_probability: predictions below it are dropped before the merge
+    :param kwargs: passed to detect_tiled, e.g. tile_size or overlap
+    """
+    from ai_cache import cached_call
+    from ai_clients import registry
+    from ai_rate_limit import limited
+
+    predictor = predictor or registry.custom_vision_prediction()
+
+    def detect_tile(data: bytes, width: int, height: int) -> Tuple[Any, Sequence[float], Sequence[str]]:
+        results = cached_call(
+            "custom_vision.detect_image", data,
+            lambda: limited(predictor.detect_image, project_id, iteration_name, data),
+            options={"project_id": project_id},
+            model_version=iteration_name,
+        )
+        predictions = [p for p in results.predictions if p.probability >= min_probability]
+        # Custom Vision boxes are normalized to the uploaded image
+        boxes = [[p.bounding_box.left * width, p.bounding_box.top * height,
+                  p.bounding_box.width * width, p.bounding_box.height * height] for p in predictions]
+        return boxes, [p.probability for p in predictions], [p.tag_name for p in predictions]
+
+    return detect_tiled(source, detect_tile, "custom_vision_detect", **kwargs)
+
+
+def _draw(image: Any, detections: Detections, output_path: str) -> None:
+    from ai_render import render, save_or_show
+
+    image = render(
+        image,
+        boxes=detections.boxes,
+        labels=[f"{label}: {score * 100:.0f}%" for label, score in zip(detections.labels, detections.scores)],
+        font_scale=0.5,
+    )
+    save_or_show(image, output_path, 'Image with Bounding Box')
+
+
+def tiled_objects(image_path: str = "./images/ButterflyWithMoon.webp", output_path: str = None) -> None:
+    """
+    Detect objects in a high resolution image tile by tile and draw the merged boxes.
+    :return: None
+    """
+    print("\n -- tiled_objects")
+    from ai_preprocess import prepare_image
+
+    prepared = prepare_image(image_path, "objects")
+    detections = analyze_objects_tiled(prepared)
+    print(f"{len(detections.labels)} object(s) from {detections.calls} call(s) "
+          f"on a {prepared.width} x {prepared.height} image")
+    _draw(prepared.image, detections, output_path)
+
+
+def tiled_custom_vision(image_path: str = "./images/SoccerBall.png", output_path: str = None) -> None:
+    """
+    Custom Vision object detection on a high resolution image tile by tile.
+    :return: None
+    """
+    print("\n -- tiled_custom_vision")
+    from ai_preprocess import prepare_image
+
+    prepared = prepare_image(image_path, "custom_vision_detect")
+    detections = custom_vision_detect_tiled(prepared, os.environ["CUSTOM_VISION_DETECT_PROJECT_ID"], "Iteration1")
+    print(f"{len(detections.labels)} object(s) from {detections.calls} call(s) "
+          f"on a {prepared.width} x {prepared.height} image")
+    _draw(prepared.image, detections, output_path)
+
+
+if __name__ == "__main__":
+    tiled_objects()
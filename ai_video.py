@@ -0,0 +1,235 @@
+"""
+USAGE:
+    python ai_video.py <video path or stream url>
+    python -m azure_ai video video_objects <video path or stream url> [<seconds between samples>]
+
+    Set the environment variables with your own values before running the sample:
+    1) AZURE_AI_SERVICES_URL - the endpoint to your azure ai resource.
+    2) AZURE_AI_SERVICES_KEY - your azure ai API key
+    3) CUSTOM_VISION_CLASSIFY_PROJECT_ID / CUSTOM_VISION_DETECT_PROJECT_ID - for the custom vision analyzers
+
+    Streams frames from a video file, an RTSP/HTTP stream or a camera through Image Analysis or
+    Custom Vision. Frames are decoded with cv2.VideoCapture and sampled at a fixed interval.
+    A sampled frame is dropped when its difference hash is within a few bits of the last frame
+    that was analyzed, so a static scene costs one call. With max_interval a frame is still
+    analyzed every few seconds.
+
+    Surviving frames are downscaled and JPEG encoded in a thread pool, in the same task as their
+    service call. At most max_in_flight frames are in the pool at once while the next frames are
+    decoded, and results come back in time order as FrameResult(index, timestamp, ...).
+
+    pip install azure-ai-vision-imageanalysis azure-cognitiveservices-vision-customvision opencv-python numpy
+"""
+import sys
+from collections import deque
+from typing import Any, Callable, Iterator, NamedTuple, Sequence, Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds between the frames that are looked at, the others are skipped without being converted
+DEFAULT_SAMPLE_INTERVAL = 0.2
+
+# Bits of the 64 bit difference hash that have to change for a frame to be analyzed again
+DEFAULT_HASH_DISTANCE = 6
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Calls the service for one frame uploaded as a PreparedImage
+FrameAnalyzer = Callable[[Any], Any]
+
+
+class FrameResult(NamedTuple):
+    # Position of the frame in the video and its timestamp in seconds
+    index: int
+    timestamp: float
+    # Scale of the upload, as PreparedImage.scale
+    scale: float
+    result: Any
+    error: BaseException
+    # Sampled frames dropped as duplicates since the previous result
+    skipped: int
+
+
+def dhash(frame: Any, size: int = 8) -> int:
+    """
+    Difference hash: whether each pixel of a (size + 1) x size grayscale thumbnail is brighter than its right neighbour.
+    :return: size * size bit int
+    """
+    import cv2
+    import numpy as np
+
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+def prepare_frame(frame: Any, feature: str = "objects") -> Any:
+    """
+    Downscale a decoded frame to the resolution the feature benefits from and encode it as JPEG.
+    :return: PreparedImage of the frame
+    """
+    import cv2
+    from ai_preprocess import JPEG_QUALITY, MAX_SIDE, PreparedImage
+
+    height, width = frame.shape[:2]
+    scale = min(1.0, MAX_SIDE[feature] / max(height, width))
+    upload = frame
+    if scale < 1.0:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        upload = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        scale = upload.shape[1] / width
+    ok, encoded = cv2.imencode(".jpg", upload, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError("The frame could not be encoded")
+    return PreparedImage(frame, encoded.tobytes(), scale)
+
+
+def sample_frames(
+    source: Union[str, int],
+    sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    hash_distance: int = DEFAULT_HASH_DISTANCE,
+    max_interval: float = None,
+) -> Iterator[tuple]:
+    """
+    Decode a video and yield the frames that differ from the last frame yielded.
+    :param source: video file, stream url or camera index
+    :param sample_interval: seconds between the frames compared, 0 to compare every frame
+    :param hash_distance: changed hash bits for a frame to count as different
+    :param max_interval: seconds after which a frame is yielded even when it did not change
+    :return: iterator of (frame index, timestamp in seconds, BGR frame, sampled frames skipped before it)
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"The video '{source}' could not be opened")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    try:
+        index = -1
+        next_sample = 0.0
+        last_hash = None
+        last_time = None
+        skipped = 0
+        while capture.grab():
+            index += 1
+            # Streams do not always report positions, fall back to the frame rate
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000 or (index / fps if fps else 0.0)
+            if timestamp < next_sample:
+                continue
+            next_sample = timestamp + sample_interval
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            frame_hash = dhash(frame)
+            unchanged = last_hash is not None and hamming(frame_hash, last_hash) <= hash_distance
+            if unchanged and (max_interval is None or timestamp - last_time < max_interval):
+                skipped += 1
+                continue
+            last_hash, last_time = frame_hash, timestamp
+            yield index, timestamp, frame, skipped
+            skipped = 0
+    finally:
+        capture.release()
+
+
+def analyze_video(
+    source: Union[str, int],
+    analyze_frame: FrameAnalyzer,
+    feature: str = "objects",
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    **kwargs: Any,
+) -> Iterator[FrameResult]:
+    """
+    Run a service call on every frame of a video that changed, with max_in_flight frames encoded and sent at once.
+    A failed frame is yielded with its exception in error instead of stopping the others.
+    :param analyze_frame: calls the service with the PreparedImage of a frame
+    :param feature: a key of ai_preprocess.MAX_SIDE, decides the resolution of the upload
+    :param kwargs: passed to sample_frames, e.g. sample_interval or max_interval
+    :return: iterator of FrameResult in time order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(frame: Any) -> tuple:
+        prepared = prepare_frame(frame, feature)
+        return prepared.scale, analyze_frame(prepared)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        def collect() -> FrameResult:
+            index, timestamp, skipped, future = pending.popleft()
+            try:
+                scale, result = future.result()
+                return FrameResult(index, timestamp, scale, result, None, skipped)
+            except Exception as error:
+                return FrameResult(index, timestamp, 1.0, None, error, skipped)
+
+        for index, timestamp, frame, skipped in sample_frames(source, **kwargs):
+            pending.append((index, timestamp, skipped, pool.submit(run, frame)))
+            if len(pending) >= max_in_flight:
+                yield collect()
+        while pending:
+            yield collect()
+
+
+def image_analysis_analyzer(visual_features: Sequence[str] = ("objects",), client: Any = None) -> FrameAnalyzer:
+    """
+    :param visual_features: VisualFeatures values, e.g. objects, tags or people
+    :return: FrameAnalyzer calling ImageAnalysisClient.analyze
+    """
+    from azure.ai.vision.imageanalysis.models import VisualFeatures
+    from ai_clients import registry
+
+    client = client or registry.image_analysis()
+    features = [VisualFeatures(feature) for feature in visual_features]
+    return lambda prepared: client.analyze(image_data=prepared.data, visual_features=features)
+
+
+def custom_vision_analyzer(
+    project_id: str,
+    iteration_name: str,
+    detect: bool = True,
+    predictor: Any = None,
+) -> FrameAnalyzer:
+    """
+    :param detect: detect_image when True, classify_image otherwise
+    :return: FrameAnalyzer calling the Custom Vision prediction client under the rate limiter
+    """
+    from ai_clients import registry
+    from ai_rate_limit import limited
+
+    predictor = predictor or registry.custom_vision_prediction()
+    method = predictor.detect_image if detect else predictor.classify_image
+    return lambda prepared: limited(method, project_id, iteration_name, prepared.data)
+
+
+def video_objects(source: str, sample_interval: str = str(DEFAULT_SAMPLE_INTERVAL)) -> None:
+    """
+    Detect objects in the frames of a video that changed and print them by time.
+    :param source: video file or stream url
+    :param sample_interval: seconds between the frames compared
+    :return: None
+    """
+    print("\n -- video_objects")
+    analyzed = skipped = failed = 0
+    for frame in analyze_video(source, image_analysis_analyzer(), sample_interval=float(sample_interval)):
+        analyzed += 1
+        skipped += frame.skipped
+        if frame.error is not None:
+            failed += 1
+            print(f"{frame.timestamp:8.2f}s frame {frame.index}: failed with {frame.error}")
+            continue
+        objects = [obj for value in frame.result.objects.values() for obj in value]
+        names = ", ".join(obj.tags[0].name for obj in objects if obj.tags)
+        print(f"{frame.timestamp:8.2f}s frame {frame.index}: {names or 'no objects'}")
+    print(f"{analyzed} frame(s) analyzed, {failed} failed, {skipped} unchanged frame(s) skipped")
+
+
+if __name__ == "__main__":
+    video_objects(*sys.argv[1:])
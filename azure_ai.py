@@ -0,0 +1,182 @@
+"""
+USAGE:
+    python -m azure_ai list
+    python -m azure_ai <service> list
+    python -m azure_ai <service> <op> [args...]
+
+    e.g. python -m azure_ai text sentiment_analysis
+         python -m azure_ai image get_words
+         python -m azure_ai jobs main sample_jobs.jsonl results.jsonl --workers 8
+
+    Arguments are converted to the int, float or bool type of the parameter they fill, e.g.
+    true/false for a bool. The main(argv) of a module gets the arguments as they are, options
+    included, and parses them itself.
+
+    With AI_TELEMETRY=1 the per-operation latency, payload and retry metrics are printed as
+    JSON after the operation, see ai_telemetry.py.
+
+    Single entry point for the samples. Only the module of the requested service is imported,
+    and each module defers its SDK, cv2 and numpy imports until an operation runs, so a
+    short-lived worker only pays for what it uses. Listing operations reads the module
+    source instead of importing it, the operations are the samples, the functions that print
+    their "\n -- name" header.
+"""
+import argparse
+import ast
+import importlib
+import inspect
+import os
+import sys
+from typing import Any, List, Union
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off")
+
+SERVICES = {
+    "auth": "ai_services_authentication",
+    "cache": "ai_cache",
+    "content-safety": "ai_content_safety",
+    "custom-vision": "ai_custom_vision",
+    "document": "ai_doc_intel",
+    "document-revisions": "ai_doc_revisions",
+    "document-shards": "ai_doc_shards",
+    "face": "ai_face",
+    "hedging": "ai_hedging",
+    "image": "ai_image",
+    "jobs": "ai_jobs",
+    "lang-detect": "ai_lang_detect",
+    "lro": "ai_lro",
+    "ocr-translate": "ai_ocr_translate",
+    "text": "ai_text_analysis",
+    "text-aggregate": "ai_text_aggregate",
+    "text-batch": "ai_text_batch",
+    "text-dedupe": "ai_text_dedupe",
+    "text-records": "ai_text_records",
+    "tiling": "ai_tiling",
+    "video": "ai_video",
+}
+
+
+def _prints_header(function: ast.AST) -> bool:
+    """
+    Whether the function prints a sample header, print("\n -- name").
+    """
+    return any(
+        isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "print"
+        and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)
+        and node.args[0].value.startswith("\n -- ")
+        for node in ast.walk(function)
+    )
+
+
+def list_operations(service: str) -> List[str]:
+    """
+    Sample operations of a service module, found without importing it.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{SERVICES[service]}.py")
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=path)
+    return [
+        node.name for node in tree.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        and not node.name.startswith("_") and _prints_header(node)
+    ]
+
+
+def _parameter_type(parameter: inspect.Parameter, hints: dict) -> Any:
+    """
+    :return: the annotated type of a parameter, Optional unwrapped, or the type of its default
+    """
+    kind = hints.get(parameter.name)
+    if getattr(kind, "__origin__", None) is Union:
+        kind = next((arg for arg in kind.__args__ if arg is not type(None)), None)
+    if kind is None and parameter.default not in (inspect.Parameter.empty, None):
+        kind = type(parameter.default)
+    return kind
+
+
+def _coerce(value: str, kind: Any, name: str) -> Any:
+    if kind is bool:
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+        raise SystemExit(f"Argument '{name}' expects true or false, got '{value}'")
+    if kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            raise SystemExit(f"Argument '{name}' expects {kind.__name__}, got '{value}'") from None
+    return value
+
+
+def convert_args(function: Any, args: List[str]) -> List[Any]:
+    """
+    Convert command line strings to the types of the positional parameters they fill.
+    """
+    import typing
+
+    try:
+        hints = typing.get_type_hints(function)
+    except Exception:
+        hints = {}
+    values = []
+    remaining = list(args)
+    for parameter in inspect.signature(function).parameters.values():
+        if parameter.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+            if remaining:
+                values.append(_coerce(remaining.pop(0), _parameter_type(parameter, hints), parameter.name))
+        elif parameter.kind == inspect.Parameter.VAR_POSITIONAL:
+            kind = _parameter_type(parameter, hints)
+            values.extend(_coerce(value, kind, parameter.name) for value in remaining)
+            remaining = []
+    if remaining:
+        raise SystemExit(f"Too many arguments for '{function.__name__}': {' '.join(remaining)}")
+    return values
+
+
+def run_operation(service: str, operation: str, args: List[str]) -> None:
+    """
+    Import the module of the service and call the operation, async operations run on a new event loop.
+    """
+    module = importlib.import_module(SERVICES[service])
+    function = getattr(module, operation.replace("-", "_"), None)
+    if function is None or not callable(function):
+        raise SystemExit(f"Unknown operation '{operation}' for service '{service}'")
+    if function.__name__ == "main" and "argv" in inspect.signature(function).parameters:
+        function(list(args))
+        return
+    values = convert_args(function, args)
+    if inspect.iscoroutinefunction(function):
+        import asyncio
+        asyncio.run(function(*values))
+    else:
+        function(*values)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m azure_ai", description="Run an Azure AI sample operation")
+    parser.add_argument("service", help="service name, or 'list' to show the services")
+    parser.add_argument("operation", nargs="?", default="list", help="operation name, or 'list' to show them")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments passed to the operation")
+    options = parser.parse_args(argv)
+
+    if options.service == "list":
+        for service in sorted(SERVICES):
+            print(service)
+        return
+    if options.service not in SERVICES:
+        parser.error(f"unknown service '{options.service}', expected one of {', '.join(sorted(SERVICES))}")
+    if options.operation == "list":
+        for operation in list_operations(options.service):
+            print(operation)
+        return
+    import ai_telemetry
+    telemetry = ai_telemetry.install_from_env()
+    run_operation(options.service, options.operation, options.args)
+    if telemetry:
+        print(ai_telemetry.metrics.to_json())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+USAGE:
+    python benchmarks/bench_e2e.py [--paths text.batch,document.layout] [--scale 1] [--latency-ms 20]
+                                   [--throttle 0] [--tracemalloc] [--json results.json]
+                                   [--baseline results.json] [--tolerance 0.2]
+
+    End-to-end throughput benchmark of the samples against benchmarks/mock_server.py, no Azure
+    resources needed. The mock server runs in its own process and every code path runs in a fresh
+    interpreter, so the peak RSS reported for a path is that path's alone. Each path reports its
+    units per second (docs, images or pages), the request latency percentiles, retries and 429s seen
+    by ai_telemetry, and the peak memory. With --tracemalloc the peak of Python allocations is
+    reported too, at the cost of slower runs.
+
+    The mock server answers a --throttle fraction of requests with 429. The azure-core clients retry
+    them, the msrest clients (custom vision) only do with the endpoint limiter, set AI_RATE_LIMIT to
+    install it as ai_rate_limit.py describes.
+
+    Save a run with --json and compare later runs with --baseline: the script exits with status 1
+    when a path got slower or its peak RSS grew by more than the tolerance.
+
+    pip install -r requirements.txt
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_TOLERANCE = 0.2
+
+TEXT = [
+    "I had the best day of my life. ",
+    "I think I want some ice cream.",
+    "I didn't enjoy this at all. I want my money back. ",
+]
+
+HEALTHCARE = "Patient needs to take 100 mg of ibuprofen, and 3 mg of potassium. Also needs to take 10 mg of Zocor."
+
+
+def text_sample(count: int) -> int:
+    """
+    ai_text_analysis.sentiment_analysis(), one request of three documents per call.
+    """
+    import ai_text_analysis
+
+    for _ in range(count):
+        ai_text_analysis.sentiment_analysis()
+    return count * 3
+
+
+def text_batch(count: int) -> int:
+    """
+    ai_text_batch.analyze_documents(), chunked and concurrent over the async client.
+    """
+    from ai_text_batch import analyze_documents
+
+    documents = [TEXT[index % len(TEXT)] for index in range(count)]
+    return sum(1 for _ in analyze_documents(documents, "analyze_sentiment"))
+
+
+def text_healthcare(count: int) -> int:
+    """
+    Healthcare jobs of 25 documents multiplexed by the LRO scheduler.
+    """
+    from ai_clients import registry
+    from ai_lro import LROScheduler
+
+    async def run() -> int:
+        client = registry.text_analytics(is_async=True)
+        batches = [[HEALTHCARE] * min(25, count - start) for start in range(0, count, 25)]
+        jobs = [(index, "healthcare", lambda batch=batch: client.begin_analyze_healthcare_entities(batch))
+                for index, batch in enumerate(batches)]
+        analyzed = 0
+        try:
+            async for job in LROScheduler(min_interval=0.05).as_completed(jobs):
+                if job.error is not None:
+                    raise job.error
+                analyzed += len([document async for document in job.result])
+        finally:
+            await registry.aclose()
+        return analyzed
+
+    return asyncio.run(run())
+
+
+def image_objects(count: int) -> int:
+    """
+    ai_image.get_objects(), decode, upload, draw and write the annotated image.
+    """
+    import ai_image
+
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(count):
+            ai_image.get_objects(os.path.join(directory, "objects.png"))
+    return count
+
+
+def image_read(count: int) -> int:
+    """
+    ai_image.get_words(), READ with line and word polygons drawn on the original.
+    """
+    import ai_image
+
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(count):
+            ai_image.get_words(os.path.join(directory, "read.png"))
+    return count
+
+
+def image_read_concurrent(count: int) -> int:
+    """
+    ai_ocr_translate.read_lines() on a thread pool, the path of the batch OCR samples.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ai_ocr_translate import read_lines
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return sum(1 for _ in pool.map(read_lines, ["./images/SpanishSign.png"] * count))
+
+
+def custom_vision_detect(count: int) -> int:
+    """
+    ai_custom_vision.detect(), upload a downscaled copy and draw the normalized boxes.
+    """
+    import ai_custom_vision
+
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(count):
+            ai_custom_vision.detect(os.path.join(directory, "detect.png"))
+    return count
+
+
+def document_layout(count: int) -> int:
+    """
+    ai_doc_shards.analyze_sharded() on a PDF of count pages, then the columnar conversion of ai_doc_intel.
+    """
+    from pypdf import PdfWriter
+    from ai_clients import registry
+    from ai_doc_columns import ColumnarDocument
+    from ai_doc_shards import analyze_sharded
+
+    writer = PdfWriter()
+    for _ in range(count):
+        writer.add_blank_page(612, 792)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "document.pdf")
+        with open(path, "wb") as file:
+            writer.write(file)
+
+        async def run() -> Any:
+            try:
+                return await analyze_sharded(path)
+            finally:
+                await registry.aclose()
+
+        document = ColumnarDocument.from_result(asyncio.run(run()))
+    return len(document.pages)
+
+
+# name: (function, unit, default count)
+PATHS: Dict[str, Tuple[Callable[[int], int], str, int]] = {
+    "text.sample": (text_sample, "docs", 100),
+    "text.batch": (text_batch, "docs", 2000),
+    "text.healthcare": (text_healthcare, "docs", 500),
+    "image.objects": (image_objects, "images", 20),
+    "image.read": (image_read, "images", 50),
+    "image.read.concurrent": (image_read_concurrent, "images", 200),
+    "custom_vision.detect": (custom_vision_detect, "images", 20),
+    "document.layout": (document_layout, "pages", 200),
+}
+
+
+def run_child(path: str, count: int, trace: bool) -> Dict[str, Any]:
+    """
+    Run one code path in this process and measure it.
+    """
+    import tracemalloc
+    import ai_telemetry
+    from ai_rate_limit import install_from_env
+
+    ai_telemetry.install()
+    install_from_env()
+    function, unit, _ = PATHS[path]
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    # The samples print every result, keep that out of the measurement output
+    with contextlib.redirect_stdout(io.StringIO()):
+        units = function(count)
+    elapsed = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace else None
+
+    # Latency and retries come from the azure-core clients, msrest clients (custom vision, face) have no policy
+    operations = ai_telemetry.metrics.snapshot()["operations"]
+    busiest = max(operations, key=lambda operation: operation["requests"], default=None)
+    return {
+        "path": path,
+        "unit": unit,
+        "units": units,
+        "seconds": elapsed,
+        "rate": units / elapsed if elapsed else 0.0,
+        "retries": sum(operation["retries"] for operation in operations),
+        "p50_ms": busiest["latency"]["p50"] * 1000 if busiest else None,
+        "p95_ms": busiest["latency"]["p95"] * 1000 if busiest else None,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "traced_peak_mb": traced_peak / 2 ** 20 if traced_peak is not None else None,
+    }
+
+
+def _ms(value: float) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def start_mock_server(options: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "mock_server.py"), "--port", "0",
+         "--latency-ms", str(options.latency_ms), "--jitter-ms", str(options.jitter_ms),
+         "--throttle", str(options.throttle), "--job-ms", str(options.job_ms), "--page-ms", str(options.page_ms),
+         "--seed", "0"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    if not line:
+        raise SystemExit("The mock server did not start")
+    return process, line.rsplit(" ", 1)[-1].strip()
+
+
+def server_counts(url: str) -> Tuple[int, int]:
+    """
+    :return: (requests, 429 responses) the mock server has answered so far
+    """
+    import urllib.request
+
+    with urllib.request.urlopen(f"{url}/mock/stats") as response:
+        stats = json.load(response)
+    throttled = sum(counts["throttled"] for counts in stats.values())
+    return sum(counts["requests"] for counts in stats.values()) + throttled, throttled
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    :return: a message for every path that regressed against the baseline
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {result["path"]: result for result in json.load(file)}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["path"])
+        if before is None:
+            continue
+        if result["rate"] < before["rate"] * (1 - tolerance):
+            regressions.append(f"{result['path']}: {result['rate']:.1f} {result['unit']}/s, "
+                               f"baseline {before['rate']:.1f}")
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{result['path']}: peak RSS {result['peak_rss_mb']:.0f} MB, "
+                               f"baseline {before['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paths", default=",".join(PATHS), help="comma separated, from: " + ", ".join(PATHS))
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the number of units of every path")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--throttle", type=float, default=0.0)
+    parser.add_argument("--job-ms", type=float, default=200.0)
+    parser.add_argument("--page-ms", type=float, default=10.0)
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the peak of Python allocations")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        os.chdir(ROOT)
+        print(json.dumps(run_child(options.child, options.count, options.tracemalloc)))
+        return 0
+
+    paths = [path.strip() for path in options.paths.split(",") if path.strip()]
+    unknown = [path for path in paths if path not in PATHS]
+    if unknown:
+        parser.error(f"unknown path(s): {', '.join(unknown)}")
+
+    server, url = start_mock_server(options)
+    env = dict(os.environ, AZURE_AI_SERVICES_URL=url, AZURE_AI_SERVICES_KEY="mock",
+               CUSTOM_VISION_DETECT_PROJECT_ID="mock", CUSTOM_VISION_CLASSIFY_PROJECT_ID="mock")
+    # Every request has to reach the mock server
+    env.pop("AI_CACHE_PATH", None)
+    results = []
+    print(f"{'path':<24} {'units':>7} {'rate':>16} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'retries':>8} {'429s':>6} {'peak RSS':>10}" + (f" {'traced':>10}" if options.tracemalloc else ""))
+    try:
+        for path in paths:
+            count = max(1, round(PATHS[path][2] * options.scale))
+            command = [sys.executable, os.path.abspath(__file__), "--child", path, "--count", str(count)]
+            if options.tracemalloc:
+                command.append("--tracemalloc")
+            requests_before, throttled_before = server_counts(url)
+            completed = subprocess.run(command, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{path:<24} FAILED\n{completed.stderr}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            requests_after, throttled_after = server_counts(url)
+            result.update(requests=requests_after - requests_before, throttled=throttled_after - throttled_before)
+            results.append(result)
+            line = (f"{path:<24} {result['units']:>7} {result['rate']:>9.1f} {result['unit'] + '/s':<6} "
+                    f"{result['requests']:>9} {_ms(result['p50_ms']):>8} {_ms(result['p95_ms']):>8} "
+                    f"{result['retries']:>8} {result['throttled']:>6} {result['peak_rss_mb']:>7.0f} MB")
+            if options.tracemalloc:
+                line += f" {result['traced_peak_mb']:>7.1f} MB"
+            print(line)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    failed = len(results) < len(paths)
+    if options.baseline:
+        regressions = compare(results, options.baseline, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
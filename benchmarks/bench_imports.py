@@ -0,0 +1,78 @@
+"""
+USAGE:
+    python benchmarks/bench_imports.py [--budget-ms 150] [--runs 5]
+
+    Cold-start import benchmark for the CLI and every service module. Each module is imported in a
+    fresh interpreter with -X importtime, the fastest of several runs is compared with the budget,
+    and the script exits with status 1 when a module is over budget or pulls in a heavy dependency
+    (cv2, numpy, requests or an Azure SDK) at import time.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from azure_ai import SERVICES  # noqa: E402
+
+MODULES = ["azure_ai"] + sorted(SERVICES.values())
+
+HEAVY_PREFIXES = ("cv2", "numpy", "requests", "aiohttp", "azure", "msrest")
+
+DEFAULT_BUDGET_MS = 150
+
+_CHECK = (
+    "import sys, {module}; "
+    "print(','.join(sorted(name for name in sys.modules if name.split('.')[0] in {heavy!r})))"
+)
+
+
+def measure(module: str) -> (float, list):
+    """
+    Import a module in a new interpreter.
+    :return: (cumulative import time of the module in ms, heavy modules it loaded)
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHECK.format(module=module, heavy=HEAVY_PREFIXES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = None
+    for line in completed.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(\S+)$", line)
+        if match and match.group(2) == module:
+            cumulative_us = int(match.group(1))
+    heavy = [name for name in completed.stdout.strip().split(",") if name]
+    return cumulative_us / 1000.0, heavy
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        timings = []
+        heavy = []
+        for _ in range(options.runs):
+            elapsed, heavy = measure(module)
+            timings.append(elapsed)
+        best = min(timings)
+        status = "ok"
+        if heavy:
+            status = f"FAIL heavy imports: {', '.join(heavy)}"
+            failed = True
+        elif best > options.budget_ms:
+            status = f"FAIL over {options.budget_ms:.0f} ms budget"
+            failed = True
+        print(f"{module:<30} {best:8.1f} ms  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
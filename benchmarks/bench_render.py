@@ -0,0 +1,68 @@
+"""
+USAGE:
+    python benchmarks/bench_render.py [--boxes 5000] [--runs 5]
+
+    Throughput benchmark for ai_render on a 12 megapixel image with thousands of boxes, the density
+    of READ words on a scanned page. Compares the per-box cv2.rectangle loop the samples used to run
+    with render(), which converts every box with NumPy and draws them with a single cv2.polylines call.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai_render import encode, normalized_to_corners, render  # noqa: E402
+
+
+def per_box_loop(image, normalized, width, height):
+    for left, top, box_width, box_height in normalized.tolist():
+        top_left = (int(left * width), int(top * height))
+        bottom_right = (int((left + box_width) * width), int((top + box_height) * height))
+        cv2.rectangle(image, top_left, bottom_right, (0, 255, 0), 2)
+    return image
+
+
+def vectorized(image, normalized, width, height):
+    return render(image, boxes=normalized_to_corners(normalized, width, height))
+
+
+def best_of(function, runs, *args):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boxes", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+
+    height, width = 3000, 4000
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    origins = rng.uniform(0.0, 0.95, size=(options.boxes, 2))
+    sizes = rng.uniform(0.002, 0.05, size=(options.boxes, 2))
+    normalized = np.hstack([origins, sizes])
+
+    loop_time = best_of(per_box_loop, options.runs, image.copy(), normalized, width, height)
+    render_time = best_of(vectorized, options.runs, image.copy(), normalized, width, height)
+    encode_time = best_of(encode, options.runs, image, ".jpg")
+
+    print(f"boxes per image:       {options.boxes}")
+    print(f"per-box loop:          {loop_time * 1000:8.2f} ms  {options.boxes / loop_time:12,.0f} boxes/s")
+    print(f"render():              {render_time * 1000:8.2f} ms  {options.boxes / render_time:12,.0f} boxes/s")
+    print(f"encode to jpeg buffer: {encode_time * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+USAGE:
+    python benchmarks/mock_server.py [--port 8765] [--latency-ms 0] [--jitter-ms 0] [--throttle 0] [--job-ms 200] [--page-ms 10]
+
+    export AZURE_AI_SERVICES_URL=http://127.0.0.1:8765
+    export AZURE_AI_SERVICES_KEY=mock
+
+    Local stand-in for the Azure AI endpoints the samples call, so their throughput can be measured
+    offline. Responses are built from the recordings in benchmarks/recordings, one document, image
+    or page at a time, so a request gets back as many results as it sent inputs:
+
+    POST /language/:analyze-text                                     text analytics, every sync task kind
+    POST /language/analyze-text/jobs, GET .../jobs/{id}              healthcare and analyze actions
+    POST /computervision/imageanalysis:analyze                       image analysis, the requested features
+    POST /customvision/v3.x/prediction/{project}/{detect|classify}/  custom vision prediction
+    POST /formrecognizer/documentModels/{model}:analyze, GET .../analyzeResults/{id}
+                                                                     document intelligence, one page per PDF page
+    POST /translate                                                  translator
+    GET  /mock/stats                                                 requests and 429s per route
+
+    Every request waits latency plus a random jitter, and a --throttle fraction of them is answered
+    with 429 and a Retry-After. Long-running operations stay running for --job-ms, plus --page-ms per
+    page for documents, and report their status like the services do.
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+RECORDINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+DEFAULT_PORT = 8765
+
+# Image analysis query feature names and the result key of each
+IMAGE_FEATURES = {
+    "caption": "captionResult",
+    "denseCaptions": "denseCaptionsResult",
+    "objects": "objectsResult",
+    "people": "peopleResult",
+    "read": "readResult",
+    "smartCrops": "smartCropsResult",
+    "tags": "tagsResult",
+}
+
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?!s)")
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _load(name: str) -> Any:
+    with open(os.path.join(RECORDINGS, name), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _shift_spans(value: Any, page_number: int, offset: int) -> None:
+    """
+    Move the spans of a copied layout element to its page and its place in the document content.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in ("span", "spans"):
+                for span in item if isinstance(item, list) else [item]:
+                    span["offset"] += offset
+            elif key == "pageNumber":
+                value[key] = page_number
+            else:
+                _shift_spans(item, page_number, offset)
+    elif isinstance(value, list):
+        for item in value:
+            _shift_spans(item, page_number, offset)
+
+
+class _Job:
+    __slots__ = ("ready_at", "created", "build")
+
+    def __init__(self, seconds: float, build: Callable[[], Dict[str, Any]]):
+        self.created = _now()
+        self.ready_at = time.monotonic() + seconds
+        self.build = build
+
+
+class MockAzureServer:
+    """
+    Threaded HTTP server that answers like the Azure AI services, from recorded responses.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        throttle: float = 0.0,
+        retry_after: float = 0.05,
+        job_seconds: float = 0.2,
+        page_seconds: float = 0.01,
+        seed: int = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.job_seconds = job_seconds
+        self.page_seconds = page_seconds
+        self.text = _load("text_analytics.json")
+        self.image = _load("image_analysis.json")
+        self.custom_vision = _load("custom_vision.json")
+        self.layout = _load("layout_page.json")
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, _Job] = {}
+        self._layouts: Dict[int, Dict[str, Any]] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+        self.routes: List[Tuple[str, Any, Callable]] = [
+            ("POST", re.compile(r"^/language/:analyze-text$"), self.analyze_text),
+            ("POST", re.compile(r"^/language/analyze-text/jobs$"), self.submit_text_job),
+            ("GET", re.compile(r"^/language/analyze-text/jobs/(?P<job>[^/]+)$"), self.text_job_status),
+            ("POST", re.compile(r"^/computervision/imageanalysis:analyze$"), self.analyze_image),
+            ("POST", re.compile(r"^/customvision/v3\.[01]/prediction/[^/]+/(?P<kind>detect|classify)/iterations/[^/]+/(image|url)(/nostore)?$",
+                                re.IGNORECASE), self.predict),
+            ("POST", re.compile(r"^/formrecognizer/documentModels/(?P<model>[^/:]+):analyze$"), self.submit_document),
+            ("GET", re.compile(r"^/formrecognizer/documentModels/(?P<model>[^/]+)/analyzeResults/(?P<job>[^/]+)$"),
+             self.document_status),
+            ("POST", re.compile(r"^/translate$"), self.translate),
+            ("GET", re.compile(r"^/mock/stats$"), self.get_stats),
+        ]
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAzureServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-azure", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockAzureServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def _count(self, route: str, key: str) -> None:
+        with self._lock:
+            counts = self.stats.setdefault(route, {"requests": 0, "throttled": 0})
+            counts[key] += 1
+
+    def _add_job(self, seconds: float, build: Callable[[], Dict[str, Any]]) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._jobs[job_id] = _Job(seconds, build)
+        return job_id
+
+    # Text analytics
+
+    def _text_results(self, kind: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        template = self.text[kind]["document"]
+        results, errors = [], []
+        for document in documents:
+            if not document.get("text", "").strip():
+                errors.append({"id": document["id"], "error": self.text["error"]})
+                continue
+            result = copy.deepcopy(template)
+            result["id"] = document["id"]
+            results.append(result)
+        return {"documents": results, "errors": errors, "modelVersion": self.text["modelVersion"]}
+
+    def analyze_text(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, str], Any]:
+        body = request["json"]
+        kind = body["kind"]
+        results = self._text_results(kind, body["analysisInput"]["documents"])
+        return 200, {}, {"kind": self.text[kind]["resultKind"], "results": results}
+
+    def submit_text_job(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, str], Any]:
+        body = request["json"]
+        documents = body["analysisInput"]["documents"]
+
+        def build() -> Dict[str, Any]:
+            items = []
+            for task in body["tasks"]:
+                result_kind = self.text[task["kind"]]["resultKind"]
+                if not result_kind.endswith("LROResults"):
+                    result_kind = result_kind.replace("Results", "LROResults")
+                items.append({
+                    "kind": result_kind, "taskName": task.get("taskName"), "lastUpdateDateTime": _now(),
+                    "status": "succeeded", "results": self._text_results(task["kind"], documents),
+                })
+            return {"tasks": {"completed": len(items), "failed": 0, "inProgress": 0, "total": len(items), "items": items}}
+
+        job_id = self._add_job(self.job_seconds, build)
+        location = f"{request['base']}/language/analyze-text/jobs/{job_id}?{request['query']}"
+        return 202, {"Operation-Location": location}, None
+
+    def text_job_status(self, request: Dict[str, Any], job: str) -> Tuple[int, Dict[str, str], Any]:
+        found = self._jobs.get(job)
+        if found is None:
+            return 404, {}, {"error": {"code": "NotFound", "message": f"Job {job} was not found."}}
+        status = {"jobId": job, "createdDateTime": found.created, "lastUpdatedDateTime": _now(),
+                  "expirationDateTime": found.created}
+        if time.monotonic() < found.ready_at:
+            status.update(status="running", tasks={"completed": 0, "failed": 0, "inProgress": 1, "total": 1, "items": []})
+        else:
+            status.update(status="succeeded", **found.build())
+        return 200, {}, status
+
+    # Vision
+
+    def analyze_image(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, str], Any]:
+        features = ",".join(request["params"].get("features", [])).split(",")
+        result = {"modelVersion": self.image["modelVersion"], "metadata": self.image["metadata"]}
+        for feature in features:
+            key = IMAGE_FEATURES.get(feature)
+            if key is None:
+                return 400, {}, {"error": {"code": "InvalidRequest", "message": f"Unknown feature '{feature}'."}}
+            result[key] = self.image[key]
+        return 200, {}, result
+
+    def predict(self, request: Dict[str, Any], kind: str) -> Tuple[int, Dict[str, str], Any]:
+        return 200, {}, dict(self.custom_vision[kind.lower()], created=_now())
+
+    # Document intelligence
+
+    def _layout(self, page_count: int) -> Dict[str, Any]:
+        """
+        A layout analyzeResult with the recorded page repeated page_count times.
+        """
+        cached = self._layouts.get(page_count)
+        if cached is not None:
+            return cached
+        recorded = self.layout
+        length = len(recorded["content"]) + 1
+        result = {"apiVersion": "2023-07-31", "modelId": "prebuilt-layout", "stringIndexType": "unicodeCodePoint",
+                  "content": "\n".join([recorded["content"]] * page_count),
+                  "pages": [], "paragraphs": [], "tables": [], "styles": []}
+        for index in range(page_count):
+            for key, value in (("pages", [recorded["page"]]), ("paragraphs", recorded["paragraphs"]),
+                               ("tables", recorded["tables"]), ("styles", recorded["styles"])):
+                copied = copy.deepcopy(value)
+                _shift_spans(copied, index + 1, index * length)
+                result[key].extend(copied)
+        with self._lock:
+            self._layouts[page_count] = result
+        return result
+
+    def submit_document(self, request: Dict[str, Any], model: str) -> Tuple[int, Dict[str, str], Any]:
+        data = request["body"]
+        page_count = len(_PDF_PAGE.findall(data)) if data.startswith(b"%PDF") else 1
+        page_count = max(1, page_count)
+        job_id = self._add_job(
+            self.job_seconds + self.page_seconds * page_count, lambda: {"analyzeResult": self._layout(page_count)}
+        )
+        location = f"{request['base']}/formrecognizer/documentModels/{model}/analyzeResults/{job_id}?{request['query']}"
+        return 202, {"Operation-Location": location}, None
+
+    def document_status(self, request: Dict[str, Any], model: str, job: str) -> Tuple[int, Dict[str, str], Any]:
+        found = self._jobs.get(job)
+        if found is None:
+            return 404, {}, {"error": {"code": "NotFound", "message": f"Result {job} was not found."}}
+        status = {"createdDateTime": found.created, "lastUpdatedDateTime": _now()}
+        if time.monotonic() < found.ready_at:
+            status["status"] = "running"
+        else:
+            status.update(status="succeeded", **found.build())
+        return 200, {}, status
+
+    # Translator
+
+    def translate(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, str], Any]:
+        targets = request["params"].get("to", [])
+        source = request["params"].get("from", [None])[0]
+        results = []
+        for element in request["json"]:
+            result = {"translations": [{"text": f"[{target}] {element['text']}", "to": target} for target in targets]}
+            if source is None:
+                result["detectedLanguage"] = {"language": "es", "score": 1.0}
+            results.append(result)
+        return 200, {}, results
+
+    def get_stats(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, str], Any]:
+        with self._lock:
+            return 200, {}, copy.deepcopy(self.stats)
+
+    def handle(self, method: str, path: str, query: str, headers: Any, body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        for route_method, pattern, function in self.routes:
+            match = pattern.match(path) if route_method == method else None
+            if match is None:
+                continue
+            route = function.__name__
+            if route != "get_stats":
+                delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+                if delay:
+                    time.sleep(delay)
+                if self.throttle and self._random.random() < self.throttle:
+                    self._count(route, "throttled")
+                    # The services send whole seconds, fractions keep benchmarks short and clients parse them
+                    retry_headers = {"Retry-After": f"{self.retry_after:g}",
+                                     "retry-after-ms": str(int(self.retry_after * 1000))}
+                    return 429, retry_headers, {"error": {
+                        "code": "429", "message": "Rate limit is exceeded. Try again later."}}
+                self._count(route, "requests")
+            content_type = headers.get("Content-Type") or ""
+            request = {
+                "base": f"http://{headers.get('Host')}",
+                "query": query,
+                "params": parse_qs(query),
+                "body": body,
+                "json": json.loads(body) if body and "json" in content_type else None,
+            }
+            return function(request, **match.groupdict())
+        return 404, {}, {"error": {"code": "NotFound", "message": f"No mock for {method} {path}."}}
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so clients reuse connections like they do against the services
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes, with Nagle on the body waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def _respond(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = urlsplit(self.path)
+                status, headers, payload = server.handle(self.command, parts.path, parts.query, self.headers, body)
+                data = b"" if payload is None else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                if payload is not None:
+                    self.send_header("Content-Type", "application/json; charset=utf-8")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("apim-request-id", str(uuid.uuid4()))
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra latency, up to this much")
+    parser.add_argument("--throttle", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after-ms", type=float, default=50.0, help="Retry-After of the 429 responses")
+    parser.add_argument("--job-ms", type=float, default=200.0, help="time a long-running operation stays running")
+    parser.add_argument("--page-ms", type=float, default=10.0, help="extra running time per document page")
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args()
+
+    server = MockAzureServer(
+        options.host, options.port,
+        latency=options.latency_ms / 1000.0, jitter=options.jitter_ms / 1000.0, throttle=options.throttle,
+        retry_after=options.retry_after_ms / 1000.0, job_seconds=options.job_ms / 1000.0,
+        page_seconds=options.page_ms / 1000.0, seed=options.seed,
+    )
+    # The first line tells a parent process where the server is listening
+    print(f"Mock Azure AI services listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()